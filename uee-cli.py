@@ -3,10 +3,27 @@ import json
 import os
 import subprocess
 import stat
+import sys
 import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+import uee_crypto
+import uee_ledger
+import uee_metrics
+import uee_qos
+import uee_sim
+import uee_station
+import uee_topology
+import uee_trace
+import uee_zoned
+
 CONFIG_FILE = Path("uee_config.json")
+CERT_DIR = Path("uee_certificates")
+ENGINE_FILE = Path(__file__).resolve().with_name("uee_engine.py")
+ANDROID_FILE = Path(__file__).resolve().with_name("uee_android.py")
+TOPOLOGY_FILE = Path(__file__).resolve().with_name("uee_topology.py")
 
 UEE_FORMAT_SCRIPT = """#!/bin/bash
 set -e
@@ -22,8 +39,8 @@ if [ "$EUID" -ne 0 ]; then
 fi
 
 if [ -z "$1" ] || [ -z "$2" ] || [ -z "$3" ] || [ -z "$4" ]; then
-  echo "${RED}Usage: $0 /dev/disk_name filesystem_type pattern passes${NC}"
-  echo "Example: $0 /dev/sdb ext4 zeros 1"
+  echo "${RED}Usage: $0 /dev/disk_name filesystem_type pattern passes [engine options...]${NC}"
+  echo "Example: $0 /dev/sdb ext4 zeros 1 --verify"
   exit 1
 fi
 
@@ -31,27 +48,52 @@ DISK="$1"
 FS_CHOICE="$2"
 PATTERN="$3"
 PASSES="$4"
+shift 4
+ENGINE_ARGS=("$@")
+PYTHON="${UEE_PYTHON:-python3}"
+
+trace() {
+    [ -n "$UEE_TRACE" ] && printf '@@uee-trace {"ph":"%s","name":"%s"}\\n' "$1" "$2"
+    return 0
+}
+
+trace B check
 
 command -v lsblk >/dev/null 2>&1 || { echo >&2 "${RED}lsblk is required but not installed. Aborting.${NC}"; exit 1; }
 command -v parted >/dev/null 2>&1 || { echo >&2 "${RED}parted is required but not installed. Aborting.${NC}"; exit 1; }
 command -v partprobe >/dev/null 2>&1 || { echo >&2 "${RED}partprobe is required but not installed. Aborting.${NC}"; exit 1; }
-command -v dd >/dev/null 2>&1 || { echo >&2 "${RED}dd is required but not installed. Aborting.${NC}"; exit 1; }
-command -v tr >/dev/null 2>&1 || { echo >&2 "${RED}tr is required but not installed. Aborting.${NC}"; exit 1; }
-
-
-if [ ! -b "$DISK" ]; then
-  echo "${RED}Error: '$DISK' is not a valid block device.${NC}"
+command -v "$PYTHON" >/dev/null 2>&1 || { echo >&2 "${RED}$PYTHON is required but not installed. Aborting.${NC}"; exit 1; }
+
+
+IMAGE=""
+SIM=""
+if [[ "$DISK" == sim:* ]]; then
+  # simulated drive (uee_sim.py): only the engine opens it, nothing to unmount or format
+  SIM="$DISK"
+elif [ -f "$DISK" ]; then
+  # disk image: wiped as a file, partitioned and formatted through a loop device
+  IMAGE="$DISK"
+  command -v losetup >/dev/null 2>&1 || { echo >&2 "${RED}losetup is required for image files but not installed. Aborting.${NC}"; exit 1; }
+  if [ -n "$(losetup -j "$IMAGE")" ]; then
+    echo "${RED}Error: '$IMAGE' is attached to a loop device, detach it first.${NC}"
+    exit 1
+  fi
+elif [ ! -b "$DISK" ]; then
+  echo "${RED}Error: '$DISK' is not a valid block device or image file.${NC}"
   exit 1
 fi
+trace E check
 
-echo "${YELLOW}Checking for mounted partitions on $DISK...${NC}"
-for part in $(lsblk -lno NAME "$DISK" | grep -v "^$(basename "$DISK")$"); do
-  PART_PATH="/dev/$part"
-  if mountpoint -q "$PART_PATH"; then
-    echo "Unmounting $PART_PATH..."
-    umount "$PART_PATH"
+trace B unmount
+if [ -z "$IMAGE" ] && [ -z "$SIM" ]; then
+  if [ -z "$UEE_TOPOLOGY" ] || [ ! -f "$UEE_TOPOLOGY" ]; then
+    echo "${RED}Topology helper not found (UEE_TOPOLOGY='$UEE_TOPOLOGY'). Aborting.${NC}"
+    exit 1
   fi
-done
+  echo "${YELLOW}Releasing mounts, swap and device stacks on $DISK...${NC}"
+  "$PYTHON" "$UEE_TOPOLOGY" teardown "$DISK"
+fi
+trace E unmount
 
 if [ -n "$PATTERN" ] && [ "$PATTERN" != "none" ]; then
     echo
@@ -61,33 +103,36 @@ if [ -n "$PATTERN" ] && [ "$PATTERN" != "none" ]; then
     echo "  Passes: $PASSES"
     echo
 
-    for (( i=1; i<=$PASSES; i++ )); do
-        echo "${GREEN}Pass $i of $PASSES...${NC}"
-        case $PATTERN in
-            "zeros")
-                echo "Writing zeros... (This will take a long time)"
-                dd if=/dev/zero of="$DISK" bs=4M status=progress
-                ;;
-            "ones")
-                echo "Writing ones... (This will take a long time)"
-                tr '\0' '\377' < /dev/zero | dd of="$DISK" bs=4M status=progress
-                ;;
-            "random")
-                echo "Writing random data... (This will take a VERY long time)"
-                dd if=/dev/urandom of="$DISK" bs=4M status=progress
-                ;;
-            *)
-                echo "${YELLOW}Unknown pattern '$PATTERN', skipping wipe.${NC}"
-                ;;
-        esac
-        echo "${GREEN}Pass $i complete.${NC}"
-    done
+    if [ -z "$UEE_ENGINE" ] || [ ! -f "$UEE_ENGINE" ]; then
+        echo "${RED}Wipe engine not found (UEE_ENGINE='$UEE_ENGINE'). Aborting.${NC}"
+        exit 1
+    fi
+
+    trace B wipe
+    if [ "$PATTERN" = "crypto" ]; then
+        "$PYTHON" "$UEE_ENGINE" crypto-erase "$DISK" "${ENGINE_ARGS[@]}"
+    elif [ "$PATTERN" = "scrub" ]; then
+        "$PYTHON" "$UEE_ENGINE" scrub "$DISK" "${ENGINE_ARGS[@]}"
+    else
+        "$PYTHON" "$UEE_ENGINE" wipe "$DISK" "$PATTERN" "$PASSES" "${ENGINE_ARGS[@]}"
+    fi
+    trace E wipe
 
     echo "${GREEN}--- Secure Wipe Finished ---${NC}"
 else
     echo "${YELLOW}Pattern is 'none', skipping secure wipe.${NC}"
 fi
 
+if [ -n "$SIM" ]; then
+    echo "${YELLOW}$DISK is a simulated drive, skipping partitioning and formatting.${NC}"
+    exit 0
+fi
+
+if [ -b "$DISK" ] && [ "$(cat "/sys/class/block/$(basename "$(readlink -f "$DISK")")/queue/zoned" 2>/dev/null)" = "host-managed" ]; then
+    echo "${YELLOW}$DISK is a host-managed zoned device, skipping partitioning and formatting.${NC}"
+    exit 0
+fi
+
 case $FS_CHOICE in
   "ext4")
     TOOL="mkfs.ext4"
@@ -116,15 +161,27 @@ command -v $TOOL >/dev/null 2>&1 || { echo >&2 "${RED}Tool '$TOOL' for $FS_CHOIC
 echo
 echo "${GREEN}--- Starting Partitioning and Formatting ---${NC}"
 
+if [ -n "$IMAGE" ]; then
+    DISK=$(losetup -fP --show "$IMAGE")
+    trap 'losetup -d "$DISK"' EXIT
+    echo "Attached $IMAGE to $DISK"
+fi
+
 echo "1. Wiping partition table on $DISK..."
+trace B mklabel
 parted "$DISK" --script -- mklabel gpt
+trace E mklabel
 
 echo "2. Creating new primary partition on $DISK..."
+trace B mkpart
 parted "$DISK" --script -- mkpart primary 0% 100%
+trace E mkpart
 
 echo "3. Reloading partition table..."
+trace B partprobe
 partprobe "$DISK"
 sleep 2
+trace E partprobe
 
 PARTITION_NAME=$(lsblk -lno NAME "$DISK" | tail -n 1)
 PARTITION="/dev/$PARTITION_NAME"
@@ -137,11 +194,13 @@ fi
 echo "4. Found new partition: $PARTITION"
 
 echo "5. Formatting $PARTITION as $FS_CHOICE..."
+trace B mkfs
 $TOOL "${ARGS[@]}" "$PARTITION"
+trace E mkfs
 
 echo
 echo "${GREEN}--- All Done! ---${NC}"
-echo "Disk $DISK has been successfully wiped and formatted."
+echo "Disk ${IMAGE:-$DISK} has been successfully wiped and formatted."
 echo "Partition: $PARTITION"
 echo "Filesystem: $FS_CHOICE"
 """
@@ -151,12 +210,25 @@ DEFAULT_CONFIG = {
     "passes": 1,
     "pattern": "zeros",
     "verify": False,
-    "post_action": "none"
+    "trace": False,
+    "max_temp": 60,
+    "critical_temp": 70,
+    "post_action": "none",
+    "android_overwrite": "none",
+    "scope": "full",
+    "numa": "auto",
+    "crypto_scrub": False
 }
 
 ANDROID_WIPE_SCRIPT = """#!/bin/bash
 set -e
 
+trace() {
+    [ -n "$UEE_TRACE" ] && printf '@@uee-trace {"ph":"%s","name":"%s","tid":"%s"}\\n' "$1" "$2" "${3:-main}"
+    return 0
+}
+
+trace B check
 if ! command -v adb &> /dev/null || ! command -v fastboot &> /dev/null; then
     echo "ADB or Fastboot not found. Installing Android platform tools..."
     if command -v pacman &> /dev/null; then
@@ -172,35 +244,34 @@ if ! command -v adb &> /dev/null || ! command -v fastboot &> /dev/null; then
         exit 1
     fi
 fi
+trace E check
 
 echo "Checking for connected devices..."
+trace B scan
 DEVICE_LIST=$(adb devices | grep -w "device" | awk '{print $1}')
+FASTBOOT_LIST=$(fastboot devices | grep -w "fastboot" | awk '{print $1}')
+trace E scan
 
-if [ -z "$DEVICE_LIST" ]; then
+if [ -z "$DEVICE_LIST" ] && [ -z "$FASTBOOT_LIST" ]; then
     echo "No devices detected. Connect at least one device via USB."
     echo "If using normal Android mode, enable Developer Options and USB Debugging."
+    echo "Devices in the bootloader are picked up in fastboot mode."
     sleep 3
     exit 1
 fi
 
 echo "Detected devices:"
-echo "$DEVICE_LIST"
+[ -n "$DEVICE_LIST" ] && echo "$DEVICE_LIST"
+[ -n "$FASTBOOT_LIST" ] && echo "$FASTBOOT_LIST" | sed 's/$/ (fastboot)/'
 echo "---"
 
-for device in $DEVICE_LIST; do
-    (
-        echo "Starting wipe on: $device"
-        adb -s "$device" reboot recovery
-        sleep 5
-        adb -s "$device" shell recovery --wipe_data || {
-            echo "Wipe command failed on: $device. It may require manual confirmation on-device."
-        }
-        echo "Wipe complete for: $device"
-    ) &
-done
-
-wait
-echo "All connected devices have been wiped successfully."
+# overwrite stage (optional) and factory reset run per device in the orchestrator ($UEE_ANDROID)
+PYTHON="${UEE_PYTHON:-python3}"
+if [ -z "$UEE_ANDROID" ] || [ ! -f "$UEE_ANDROID" ]; then
+    echo "Android orchestrator not found (UEE_ANDROID='$UEE_ANDROID'). Aborting."
+    exit 1
+fi
+"$PYTHON" "$UEE_ANDROID" wipe "$@" $DEVICE_LIST $FASTBOOT_LIST
 sleep 2
 """
 
@@ -230,7 +301,7 @@ def save_config(config):
 def scan_drives(quiet=False):
     drives = []
     try:
-        cmd = ["lsblk", "-J", "-d", "-o", "NAME,SIZE,MODEL,TYPE"]
+        cmd = ["lsblk", "-J", "-d", "-o", "NAME,SIZE,MODEL,SERIAL,TYPE"]
         result = subprocess.run(cmd, capture_output=True, text=True, check=True)
         data = json.loads(result.stdout)
 
@@ -241,9 +312,14 @@ def scan_drives(quiet=False):
             drives.append({
                 "name": "/dev/" + item.get('name', 'N/A'),
                 "size": item.get('size', 'N/A'),
-                "model": item.get('model', 'N/A')
+                "model": item.get('model', 'N/A'),
+                "serial": item.get('serial') or ''
             })
 
+        # one entry per LUN, however many paths lead to it
+        drives = uee_topology.group_drives(drives)
+        drives += uee_sim.list_drives()
+
         if not drives and not quiet:
             click.echo("No suitable drives found.")
 
@@ -255,7 +331,25 @@ def scan_drives(quiet=False):
             click.secho(f"Drive scan failed: {e}", fg='red')
     return drives
 
-def run_script(script_content, script_args):
+def engine_env():
+    env = os.environ.copy()
+    env["UEE_ENGINE"] = str(ENGINE_FILE)
+    env["UEE_TOPOLOGY"] = str(TOPOLOGY_FILE)
+    env["UEE_ANDROID"] = str(ANDROID_FILE)
+    env["UEE_PYTHON"] = sys.executable
+    env["UEE_TRACE"] = "1"
+    return env
+
+def certificate_path(disk, serial=None):
+    name = serial or os.path.basename(disk)
+    return CERT_DIR / f"{name}-{time.strftime('%Y%m%d-%H%M%S')}.json"
+
+def member_path(path, disk):
+    """path for one disk of several: trace.json becomes trace-sdb.json."""
+    path = Path(path)
+    return str(path.with_name(f"{path.stem}-{os.path.basename(disk)}{path.suffix}"))
+
+def run_script(script_content, script_args, env=None, tracer=None, prefix=''):
     try:
         with tempfile.NamedTemporaryFile(mode='w', delete=False, prefix='uee_script_', suffix='.sh') as f:
             f.write(script_content)
@@ -264,29 +358,32 @@ def run_script(script_content, script_args):
         os.chmod(script_path, 0o755)
 
         cmd = ["/bin/bash", script_path] + script_args
-        click.secho(f"--- Starting script: {' '.join(cmd)} ---", fg='yellow')
+        click.secho(f"{prefix}--- Starting script: {' '.join(cmd)} ---", fg='yellow')
 
         process = subprocess.Popen(
             cmd,
             stdout=subprocess.PIPE,
             stderr=subprocess.STDOUT,
             text=True,
-            universal_newlines=True
+            universal_newlines=True,
+            env=env
         )
 
         for line in iter(process.stdout.readline, ''):
-            click.echo(line, nl=False)
+            if tracer is not None and tracer.feed(line):
+                continue
+            click.echo(prefix + line, nl=False)
 
         process.stdout.close()
         return_code = process.wait()
 
-        click.echo("--- Script finished ---")
+        click.echo(f"{prefix}--- Script finished ---")
 
         if return_code != 0:
-            click.secho(f"Script failed with exit code {return_code}", fg='red', bold=True)
+            click.secho(f"{prefix}Script failed with exit code {return_code}", fg='red', bold=True)
             raise click.Abort()
         else:
-            click.secho("Operation completed successfully.", fg='green', bold=True)
+            click.secho(f"{prefix}Operation completed successfully.", fg='green', bold=True)
 
     finally:
         if 'script_path' in locals() and os.path.exists(script_path):
@@ -314,7 +411,160 @@ def list_drives_cmd():
         click.echo(f"{'DEVICE':<15} {'SIZE':>8}   {'MODEL'}")
         click.echo("-------------------------------------")
         for d in drives:
-            click.echo(f"{d['name']:<15} {d['size']:>8}   {d['model']}")
+            note = ""
+            if d.get('paths'):
+                note = f"  ({len(d['paths']) + 1} paths, also {', '.join(d['paths'])})"
+            elif d.get('members'):
+                note = f"  (wipes {', '.join(d['members'])})"
+            click.echo(f"{d['name']:<15} {d['size']:>8}   {d['model']}{note}")
+
+
+@cli.command()
+@click.option('--serve', is_flag=True, help='Serve OpenMetrics on localhost until interrupted.')
+@click.option('--port', type=int, default=uee_metrics.DEFAULT_PORT, show_default=True, help='Port for --serve.')
+@click.option('--interval', type=click.FloatRange(min=0.1), default=uee_metrics.DEFAULT_INTERVAL, show_default=True, help='Sampling interval in seconds.')
+def metrics(serve, port, interval):
+    """
+    Shows media throughput of running wipe jobs.
+
+    Samples /sys/block/<dev>/stat for every active job. With --serve the
+    same data is exported for Prometheus at http://127.0.0.1:PORT/metrics.
+    """
+    if serve:
+        uee_metrics.serve(port, interval)
+        return
+
+    sampler = uee_metrics.Sampler(interval=interval)
+    sampler.sample()
+    time.sleep(interval)
+    sampler.sample()
+    rows = sampler.snapshot()
+    if not rows:
+        click.echo("No active wipe jobs.")
+        return
+
+    click.echo(f"{'DEVICE':<15} {'PHASE':<12} {'DONE':>6} {'WRITE MB/s':>11} {'READ MB/s':>10} {'IN-FLIGHT':>10}")
+    for row in rows:
+        done = f"{100 * row['done'] // row['total']}%" if row.get('total') else '-'
+        click.echo(f"{row['device']:<15} {row.get('phase', '-'):<12} {done:>6} "
+                   f"{row.get('write_mb_per_s', 0):>11} {row.get('read_mb_per_s', 0):>10} {row.get('in_flight', 0):>10}")
+
+
+def parse_rate_option(ctx, param, value):
+    if value is None:
+        return None
+    try:
+        return uee_qos.parse_rate(value)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+
+
+@cli.command()
+@click.option('--device', help='Device that --rate applies to (e.g. /dev/sdb).')
+@click.option('--rate', callback=parse_rate_option, help='Per-device cap in bytes/s, e.g. 150M. 0 removes it.')
+@click.option('--aggregate', callback=parse_rate_option, help='Cap shared by all running jobs, e.g. 1G. 0 removes it.')
+def qos(device, rate, aggregate):
+    """
+    View or change throughput caps.
+
+    Running jobs pick up changes within a second. The aggregate cap is
+    split equally between the active jobs.
+    """
+    limits = uee_qos.load_limits()
+
+    if rate is not None or aggregate is not None:
+        check_root()
+        if rate is not None:
+            if not device:
+                click.secho("Error: --rate needs --device.", fg='red', bold=True)
+                raise click.Abort()
+            name = os.path.basename(device)
+            if rate:
+                limits['devices'][name] = rate
+            else:
+                limits['devices'].pop(name, None)
+            click.echo(f"Limit for {name} set to: {uee_qos.format_rate(rate)}")
+        if aggregate is not None:
+            limits['aggregate'] = aggregate
+            click.echo(f"Aggregate limit set to: {uee_qos.format_rate(aggregate)}")
+        uee_qos.save_limits(limits)
+
+    click.echo(f"Aggregate: {uee_qos.format_rate(limits['aggregate'])}")
+    for name, value in sorted(limits['devices'].items()):
+        click.echo(f"  /dev/{name:<10} {uee_qos.format_rate(value)}")
+    for job in uee_metrics.active_jobs():
+        click.echo(f"Active: {job['device']:<15} {job.get('phase', '-'):<12} {uee_qos.format_rate(job.get('rate_limit', 0))}")
+
+
+@cli.command()
+@click.argument('disk')
+@click.argument('certificate', type=click.Path(exists=True, dir_okay=False))
+def check(disk, certificate):
+    """
+    Re-verifies a wiped device against its certificate.
+
+    Reads DISK back and compares it with the last pass recorded in
+    CERTIFICATE; random passes are regenerated from the certificate's
+    seed. Anything written since (e.g. the new filesystem) shows up as
+    differing data.
+    """
+    check_root()
+    result = subprocess.run([sys.executable, str(ENGINE_FILE), 'check', disk, certificate])
+    if result.returncode != 0:
+        raise click.Abort()
+
+
+@cli.command()
+@click.option('--serial', help='Only jobs on the drive with this serial number.')
+@click.option('--model', help='Only jobs on drives of this model.')
+@click.option('--since', type=click.DateTime(), help='Only jobs started on or after this date.')
+@click.option('--until', type=click.DateTime(), help='Only jobs started before this date.')
+@click.option('--outcome', help='Only jobs with this outcome, e.g. degraded for drives with slow zones.')
+@click.option('--station', help='Only jobs run by this station (coordinator ledgers).')
+@click.option('--limit', type=click.IntRange(min=1), default=50, show_default=True, help='Maximum number of jobs to show.')
+def ledger(serial, model, since, until, outcome, station, limit):
+    """Shows recorded jobs from the job ledger, newest first."""
+    db = uee_ledger.Ledger()
+    try:
+        jobs = db.query(serial=serial, model=model,
+                        since=since.timestamp() if since else None,
+                        until=until.timestamp() if until else None, limit=limit, outcome=outcome, station=station)
+    finally:
+        db.close()
+
+    if not jobs:
+        click.echo("No matching jobs.")
+        return
+
+    stations = any(job['station'] for job in jobs)
+    click.echo(f"{'STARTED':<17} " + (f"{'STATION':<10} " if stations else "")
+               + f"{'DEVICE':<13} {'SERIAL':<20} {'MODEL':<20} {'PLAN':<12} {'TIME':>8} {'MB/s':>8}   OUTCOME")
+    for job in jobs:
+        started = time.strftime('%Y-%m-%d %H:%M', time.localtime(job['started']))
+        plan = f"{job['pattern'] or '-'} x{job['passes'] or 0}" if job['kind'] == 'format' else job['kind']
+        station = f"{(job['station'] or '-')[:10]:<10} " if stations else ""
+        click.echo(f"{started:<17} {station}{job['device'] or '-':<13} {(job['serial'] or '-')[:20]:<20} "
+                   f"{(job['model'] or '-')[:20]:<20} {plan:<12} "
+                   f"{uee_ledger.format_duration(job['total_seconds']):>8} {job['mb_per_s'] or '-':>8}   {job['outcome']}")
+
+
+@cli.command()
+@click.option('--coordinator', default=uee_station.DEFAULT_ADDRESS, show_default=True, help='Coordinator address (HOST:PORT).')
+@click.option('--token', help='Shared secret of the coordinator (default: $UEE_STATION_TOKEN).')
+def stations(coordinator, token):
+    """
+    Shows the erase stations registered with a coordinator and its jobs.
+
+    Every station sees the same view: drives and phones per station,
+    bandwidth in use, and where each queued or running job is. Start the
+    coordinator and the stations with uee_station.py.
+    """
+    try:
+        status = uee_station.request(coordinator, {"type": "status"}, token)
+    except (OSError, ValueError) as e:
+        click.secho(f"Error: cannot reach the coordinator at {coordinator}: {e}", fg='red', bold=True)
+        raise click.Abort()
+    uee_station.print_status(status)
 
 
 @cli.command()
@@ -352,37 +602,105 @@ def config(set_pattern, set_passes, view):
         click.echo("Try './uee-cli.py config --help' for more info.")
 
 
+def save_trace(tracer, trace):
+    if trace:
+        tracer.save(trace)
+        click.echo(f"Trace written to {trace}")
+
+def record_job(**job):
+    try:
+        ledger = uee_ledger.Ledger()
+        try:
+            ledger.record(**job)
+        finally:
+            ledger.close()
+    except Exception as e:
+        click.secho(f"Failed to record job in ledger: {e}", fg='red')
+
+
 @cli.command('android-wipe')
+@click.option('--overwrite', type=click.Choice(['none', 'free-space', 'userdata']), help='Overwrite stage before the factory reset (overrides config).')
+@click.option('--usb-budget', callback=parse_rate_option, help='Bandwidth shared by all overwrite streams in bytes/s, e.g. 80M.')
 @click.option('--yes', '-y', is_flag=True, help='Skip the confirmation prompt.')
-def android_wipe(yes):
+@click.option('--trace', type=click.Path(dir_okay=False), help='Write a Chrome/Perfetto trace of every phase to this file.')
+def android_wipe(overwrite, usb_budget, yes, trace):
     """
     Attempts to factory reset ALL connected Android devices.
 
     This command will reboot devices into recovery and send the
-    --wipe_data command via ADB.
+    --wipe_data command via ADB. Devices in the bootloader are wiped
+    with 'fastboot -w' when unlocked. With --overwrite, the configured
+    pattern is first streamed onto each device: 'free-space' fills
+    the free space of /data with a file, 'userdata' overwrites the
+    whole userdata partition from recovery.
     """
     check_root()
+    config = load_config()
+    overwrite = overwrite or config.get('android_overwrite', 'none')
+    pattern = config['pattern'] if config['pattern'] in ('zeros', 'ones', 'random') else 'zeros'
 
     click.secho("WARNING: This will attempt to factory reset ALL connected Android devices.", fg='red', bold=True)
+    if overwrite != 'none':
+        click.echo(f"Overwrite stage: {overwrite} with pattern '{pattern}', "
+                   f"USB budget {uee_qos.format_rate(usb_budget or 0)}")
 
     if not yes:
         click.confirm("Are you sure you want to proceed?", abort=True)
 
     click.echo("Starting Android wipe procedure...")
-    run_script(ANDROID_WIPE_SCRIPT, [])
+    script_args = ["--overwrite", overwrite, "--pattern", pattern]
+    if usb_budget:
+        script_args += ["--usb-budget", str(usb_budget)]
+    # the orchestrator reports every device, each one becomes its own ledger row
+    fd, report = tempfile.mkstemp(prefix="uee-android-", suffix=".json")
+    os.close(fd)
+    script_args += ["--report", report]
+    # phases are always collected, they are only written out with --trace
+    tracer = uee_trace.Tracer(process_name="uee android-wipe")
+    try:
+        run_script(ANDROID_WIPE_SCRIPT, script_args, env=engine_env(), tracer=tracer)
+    finally:
+        save_trace(tracer, trace)
+        for job in uee_ledger.android_jobs(uee_ledger.load_report(report)):
+            record_job(**job)
+        os.unlink(report)
 
 
 @cli.command()
 @click.argument('disk', type=str)
 @click.argument('filesystem', type=click.Choice(['ext4', 'fat32', 'exfat', 'ntfs']))
-@click.option('--pattern', 'pattern_override', type=click.Choice(['zeros', 'ones', 'random', 'none']), help='Wipe pattern to use (overrides config). "none" skips wipe.')
+@click.option('--pattern', 'pattern_override', type=click.Choice(['zeros', 'ones', 'random', 'crypto', 'scrub', 'none']), help='Wipe pattern to use (overrides config). "crypto" destroys LUKS key material or reverts an OPAL drive instead of overwriting. "scrub" only zeroes partition tables, RAID/LVM labels and filesystem superblocks. "none" skips wipe.')
 @click.option('--passes', 'passes_override', type=click.IntRange(min=1), help='Number of passes (overrides config).')
+@click.option('--verify/--no-verify', 'verify_override', default=None, help='Read back and check the last pass (overrides config).')
+@click.option('--certificate', type=click.Path(dir_okay=False), help=f'Where to write the wipe certificate (default: {CERT_DIR}/<serial>-<time>.json).')
+@click.option('--trace', type=click.Path(dir_okay=False), help='Write a Chrome/Perfetto trace of every phase to this file.')
+@click.option('--rate', callback=parse_rate_option, help='Throughput cap for the wipe in bytes/s, e.g. 200M (see also the qos command).')
+@click.option('--cgroup', is_flag=True, help='Also enforce the cap with cgroup v2 io.max.')
+@click.option('--scope', type=click.Choice(['full', 'allocated']), help='"allocated" overwrites only used blocks and filesystem metadata and discards the free space (overrides config).')
+@click.option('--max-temp', type=click.IntRange(min=0), help='Slow the wipe down above this drive temperature in C, 0 disables (overrides config).')
+@click.option('--critical-temp', type=click.IntRange(min=1), help='Pause the wipe above this drive temperature in C (overrides config).')
+@click.option('--numa', type=click.Choice(['auto', 'off']), help='"auto" runs the engine on the CPUs and memory of the NUMA node the disk controller is attached to (overrides config).')
+@click.option('--scrub/--no-scrub', 'scrub_override', default=None, help='After a crypto erase, zero the signatures at the head and tail of the disk and its partitions (overrides config).')
+@click.option('--psid', help='PSID printed on the drive label, for the OPAL revert of a crypto erase.')
 @click.option('--yes', '-y', is_flag=True, help='Skip the final confirmation prompt.')
-def format(disk, filesystem, pattern_override, passes_override, yes):
+def format(disk, filesystem, pattern_override, passes_override, verify_override, certificate, trace, rate, cgroup,
+           scope, max_temp, critical_temp, numa, scrub_override, psid, yes):
     """
     Wipes, partitions, and formats a target DISK.
 
-    DISK: The block device to format (e.g., /dev/sdb)
+    DISK: The block device to format (e.g., /dev/sdb), or a raw/qcow
+    disk image file; only the allocated extents of an image are wiped.
+    A simulated drive (sim:NAME, see uee_sim.py) is wiped but not
+    partitioned or formatted.
+
+    With --pattern crypto, a disk holding LUKS volumes or an OPAL
+    self-encrypting drive (with --psid) is sanitized by destroying its
+    key material in seconds instead of overwriting the surface.
+
+    With --pattern scrub, only the partition tables, RAID/LVM labels and
+    filesystem superblocks (with their backups) are zeroed, so nothing
+    old is assembled or detected after the format. It takes well under
+    a second but leaves the data itself in place.
 
     FILESYSTEM: The filesystem to apply (ext4, fat32, exfat, ntfs)
 
@@ -393,40 +711,165 @@ def format(disk, filesystem, pattern_override, passes_override, yes):
 
     pattern = pattern_override or conf.get('pattern', DEFAULT_CONFIG['pattern'])
     passes = passes_override or conf.get('passes', DEFAULT_CONFIG['passes'])
+    verify = conf.get('verify', DEFAULT_CONFIG['verify']) if verify_override is None else verify_override
+    scope = scope or conf.get('scope', DEFAULT_CONFIG['scope'])
+    numa = numa or conf.get('numa', DEFAULT_CONFIG['numa'])
+    scrub = conf.get('crypto_scrub', DEFAULT_CONFIG['crypto_scrub']) if scrub_override is None else scrub_override
+    if max_temp is None:
+        max_temp = conf.get('max_temp', DEFAULT_CONFIG['max_temp'])
+    if critical_temp is None:
+        critical_temp = conf.get('critical_temp', DEFAULT_CONFIG['critical_temp'])
 
     if pattern == 'none':
         passes = 1
+    elif pattern in ('crypto', 'scrub'):
+        passes = 0
 
     click.echo("Performing safety checks...")
+    # phases are always collected for the ledger, they are only written out with --trace
+    tracer = uee_trace.Tracer(process_name="uee format")
 
-    try:
-        if not stat.S_ISBLK(os.stat(disk).st_mode):
-            click.secho(f"Error: '{disk}' is not a block device.", fg='red', bold=True)
+    with tracer.span("check", disk=disk):
+        try:
+            # simulated drives (uee_sim.py) have no device node
+            mode = 0 if uee_sim.is_sim(disk) else os.stat(disk).st_mode
+            if mode and not stat.S_ISBLK(mode) and not stat.S_ISREG(mode):
+                click.secho(f"Error: '{disk}' is not a block device or image file.", fg='red', bold=True)
+                raise click.Abort()
+        except FileNotFoundError:
+            click.secho(f"Error: Device '{disk}' does not exist.", fg='red', bold=True)
+            raise click.Abort()
+        except Exception as e:
+            click.secho(f"Error checking device: {e}", fg='red', bold=True)
             raise click.Abort()
-    except FileNotFoundError:
-        click.secho(f"Error: Device '{disk}' does not exist.", fg='red', bold=True)
-        raise click.Abort()
-    except Exception as e:
-        click.secho(f"Error checking device: {e}", fg='red', bold=True)
-        raise click.Abort()
 
-    available_drives = [d['name'] for d in scan_drives(quiet=True)]
-    if disk not in available_drives:
-        click.secho(f"Error: '{disk}' was not found as a suitable top-level drive.", fg='red', bold=True)
+    with tracer.span("scan"):
+        if stat.S_ISREG(mode):
+            drive_info = {disk: {'name': disk, 'model': None, 'serial': None}}
+        else:
+            drive_info = {d['name']: d for d in scan_drives(quiet=True)}
+
+    # arrays expand into their member disks, multipath LUNs collapse into the best path
+    targets = [disk]
+    resolved = []
+    plans = []
+    if mode and stat.S_ISBLK(mode):
+        with tracer.span("topology"):
+            try:
+                topology = uee_topology.Topology()
+                resolution = topology.resolve_targets(disk)
+                targets = ["/dev/" + t for t in resolution['targets']]
+                plans = [topology.plan(t) for t in targets]
+            except uee_topology.TopologyError as e:
+                click.secho(f"Error reading the device topology: {e}", fg='red', bold=True)
+                raise click.Abort()
+        resolved = uee_topology.describe_targets(resolution)
+        for plan in plans:
+            if plan['refused']:
+                click.secho(f"Error: refusing to wipe {plan['disk']}: {plan['refused']}.", fg='red', bold=True)
+                raise click.Abort()
+    missing = [t for t in targets if t not in drive_info]
+    if missing:
+        click.secho(f"Error: '{missing[0]}' was not found as a suitable top-level drive.", fg='red', bold=True)
         click.echo("This tool only formats whole disks, not partitions.")
         click.echo("Available disks:")
         list_drives_cmd.callback()
         raise click.Abort()
 
+    teardown = []
+    for plan in plans:
+        # the other members lose the array anyway, they are wiped too
+        plan['shared_with'] = [s for s in plan['shared_with'] if "/dev/" + s not in targets]
+        teardown += [line for line in uee_topology.describe(plan) if line not in teardown]
+
+    with tracer.span("zone-report"):
+        zoned = {t: uee_zoned.probe(t) for t in targets}
+
+    with tracer.span("crypto-detect"):
+        found = {t: uee_crypto.probe(t) for t in targets}
+    encryption = "; ".join(uee_crypto.describe(f) for f in found.values() if f and uee_crypto.describe(f))
+    for target, f in found.items():
+        if pattern == 'crypto' and not (f and (f['luks'] or (f['opal'] and psid))):
+            hint = " (an OPAL drive, its revert needs --psid)" if f and f['opal'] else ""
+            click.secho(f"Error: nothing to crypto-erase on {target}: no LUKS header{hint}. Use an overwrite pattern.",
+                        fg='red', bold=True)
+            raise click.Abort()
+
+    certificates = {}
+    traces = {}
+    for target in targets:
+        if pattern != 'none':
+            if certificate:
+                certificates[target] = member_path(certificate, target) if len(targets) > 1 else certificate
+            else:
+                certificates[target] = str(certificate_path(target, drive_info[target].get('serial')))
+        if trace:
+            traces[target] = member_path(trace, target) if len(targets) > 1 else trace
+
+    sizes = {t: os.path.getsize(t) if stat.S_ISREG(mode) else uee_ledger.device_size_bytes(t) for t in targets}
+    eta, history, model = None, 0, drive_info[targets[0]].get('model')
+    try:
+        ledger = uee_ledger.Ledger()
+        # members run side by side, the slowest one decides
+        for target in targets:
+            member_eta, member_history = ledger.predict(drive_info[target].get('model'), sizes[target],
+                                                        0 if pattern == 'none' else passes,
+                                                        verify and pattern not in ('none', 'crypto', 'scrub'))
+            if member_eta is None:
+                eta = None
+                break
+            eta, history = max(eta or 0, member_eta), max(history, member_history)
+        ledger.close()
+    except Exception:
+        eta, history = None, 0
+
     click.secho(f"\n!!! FINAL WARNING !!!", fg='red', bold=True)
     click.echo("You are about to PERMANENTLY DESTROY all data on the following device:")
 
     click.echo("\n--- OPERATION PLAN ---")
     click.echo(f"  Target Disk: {disk}")
+    for line in resolved:
+        click.echo(f"  Resolved: {line}")
+    if targets != [disk]:
+        click.echo(f"  Physical Disks: {', '.join(targets)}" + (" (wiped concurrently)" if len(targets) > 1 else ""))
+    if teardown:
+        click.echo(f"  Teardown: {'; '.join(teardown)}")
     click.echo(f"  Wipe Pattern: {pattern}")
-    if pattern != 'none':
+    any_zoned = next((z for z in zoned.values() if z), None)
+    if pattern == 'crypto':
+        click.echo(f"  Crypto Erase: {encryption}")
+        click.echo(f"  Signature Scrub: {'yes' if scrub else 'no'}")
+        click.echo(f"  Certificate: {', '.join(certificates.values())}")
+    elif pattern == 'scrub':
+        click.echo("  Signature Scrub: partition tables, RAID/LVM labels and filesystem superblocks only; "
+                   "the data is not overwritten")
+        click.echo(f"  Certificate: {', '.join(certificates.values())}")
+    elif pattern != 'none':
         click.echo(f"  Wipe Passes: {passes}")
-    click.echo(f"  Filesystem: {filesystem}")
+        for target, z in zoned.items():
+            if z:
+                click.echo(f"  Zoned: {uee_zoned.describe(z)}" + (f" ({target})" if len(targets) > 1 else ""))
+        if scope == 'allocated':
+            click.echo("  Wipe Scope: allocated blocks and filesystem metadata, free space discarded"
+                       + (" (not on zoned devices: every zone is rewritten)" if any_zoned else ""))
+        click.echo(f"  Verify: {'yes' if verify else 'no'}")
+        click.echo(f"  Certificate: {', '.join(certificates.values())}")
+        if rate:
+            click.echo(f"  Rate Limit: {uee_qos.format_rate(rate)}{' (cgroup io.max)' if cgroup else ''}")
+        if max_temp:
+            click.echo(f"  Thermal: slow down above {max_temp}C, pause at {critical_temp}C")
+        if encryption:
+            click.secho(f"  Hint: found {encryption}; --pattern crypto erases it in seconds.", fg='yellow')
+    if any_zoned and any_zoned['model'] == 'host-managed':
+        click.echo(f"  Filesystem: none ({filesystem} cannot be written to a host-managed zoned device)")
+    else:
+        click.echo(f"  Filesystem: {filesystem}" + (" (on each disk)" if len(targets) > 1 else ""))
+    if trace:
+        click.echo(f"  Trace: {', '.join(traces.values())}")
+    if eta is not None:
+        click.echo(f"  Estimated Time: {uee_ledger.format_duration(eta)} (from {history} earlier jobs on {model})")
+    else:
+        click.echo("  Estimated Time: unknown (no history for this model)")
     click.echo("----------------------\n")
 
     if not yes:
@@ -438,7 +881,78 @@ def format(disk, filesystem, pattern_override, passes_override, yes):
 
     click.echo("Confirmation received. Starting operation...")
 
-    run_script(UEE_FORMAT_SCRIPT, [disk, filesystem, pattern, str(passes)])
+    engine_args = []
+    if pattern == 'crypto':
+        if scrub:
+            engine_args.append('--scrub')
+        if psid:
+            engine_args += ['--psid', psid]
+    elif pattern not in ('none', 'scrub'):
+        if verify:
+            engine_args.append('--verify')
+        if rate:
+            engine_args += ['--rate', str(rate)]
+        if cgroup:
+            engine_args.append('--cgroup')
+        if scope == 'allocated':
+            engine_args += ['--scope', 'allocated']
+        engine_args += ['--max-temp', str(max_temp), '--critical-temp', str(critical_temp), '--numa', numa]
+
+    def run_target(target, member_tracer, prefix=''):
+        args = list(engine_args)
+        if pattern != 'none':
+            args += ['--certificate', os.path.abspath(certificates[target])]
+        started = time.time()
+        outcome = 'failed'
+        try:
+            run_script(UEE_FORMAT_SCRIPT, [target, filesystem, pattern, str(passes)] + args,
+                       env=engine_env(), tracer=member_tracer, prefix=prefix)
+            outcome = 'success'
+        finally:
+            save_trace(member_tracer, traces.get(target))
+            cert = uee_ledger.load_certificate(certificates[target]) if pattern != 'none' else None
+            if cert and cert.get('verification', {}).get('result') == 'failed':
+                outcome = 'verify-failed'
+            elif outcome == 'success' and cert and (cert.get('bad_blocks') or {}).get('sectors'):
+                outcome = 'bad-blocks'
+            elif outcome == 'success' and cert and (cert.get('health') or {}).get('degraded'):
+                outcome = 'degraded'
+            elif outcome == 'success' and cert and cert.get('plan', {}).get('method') == 'crypto-erase':
+                outcome = 'crypto-erased'
+            elif outcome == 'success' and cert and cert.get('plan', {}).get('method') == 'signature-scrub':
+                outcome = 'scrubbed'
+            record_job(kind='format', started=started, outcome=outcome, device=target,
+                       serial=drive_info[target].get('serial'), model=drive_info[target].get('model'),
+                       size_bytes=sizes[target], pattern=pattern, passes=passes, verify=verify,
+                       filesystem=filesystem, phases=member_tracer.durations(), certificate=cert,
+                       certificate_path=certificates.get(target))
+
+    if len(targets) == 1:
+        run_target(targets[0], tracer)
+        return
+
+    # the shared stack goes once, before the members start on their own
+    try:
+        for plan in plans:
+            uee_topology.teardown(uee_topology.Topology().plan(plan['disk']), log=click.echo)
+    except uee_topology.TopologyError as e:
+        click.secho(f"Error: {e}", fg='red', bold=True)
+        raise click.Abort()
+    failed = []
+
+    def run_member(target):
+        try:
+            run_target(target, uee_trace.Tracer(process_name=f"uee format {target}"),
+                       prefix=f"[{os.path.basename(target)}] ")
+        except click.Abort:
+            failed.append(target)
+
+    with ThreadPoolExecutor(max_workers=len(targets)) as pool:
+        list(pool.map(run_member, targets))
+    if failed:
+        click.secho(f"Failed on {', '.join(sorted(failed))}.", fg='red', bold=True)
+        raise click.Abort()
+    click.secho(f"All {len(targets)} disks of {disk} done.", fg='green', bold=True)
 
 
 if __name__ == '__main__':
@@ -3,10 +3,25 @@ import time
 import json
 import os
 import subprocess
+import sys
+import tempfile
 import fcntl  # needed for non-blocking i/o
 from pathlib import Path
 
+import uee_crypto
+import uee_ledger
+import uee_metrics
+import uee_sim
+import uee_topology
+import uee_trace
+import uee_zoned
+
 CONFIG_FILE = Path("uee_config.json")
+CERT_DIR = Path("uee_certificates")
+TRACE_DIR = Path("uee_traces")
+ENGINE_FILE = Path(__file__).resolve().with_name("uee_engine.py")
+ANDROID_FILE = Path(__file__).resolve().with_name("uee_android.py")
+TOPOLOGY_FILE = Path(__file__).resolve().with_name("uee_topology.py")
 
 TITLE_ART = r"""
 
@@ -33,7 +48,8 @@ UU:::::U     U:::::UU     EE::::::EEEEEEEEE::::E     EE::::::EEEEEEEEE::::E
 """
 
 # This script is now heavily modified.
-# It accepts $1 (DISK), $2 (FS_CHOICE), $3 (PATTERN), $4 (PASSES)
+# It accepts $1 (DISK), $2 (FS_CHOICE), $3 (PATTERN), $4 (PASSES),
+# anything after that is handed to the wipe engine ($UEE_ENGINE).
 UEE_FORMAT_SCRIPT = """#!/bin/bash
 set -e
 
@@ -51,8 +67,8 @@ fi
 
 # check for args
 if [ -z "$1" ] || [ -z "$2" ] || [ -z "$3" ] || [ -z "$4" ]; then
-  echo "${RED}Usage: $0 /dev/disk_name filesystem_type pattern passes${NC}"
-  echo "Example: $0 /dev/sdb ext4 zeros 1"
+  echo "${RED}Usage: $0 /dev/disk_name filesystem_type pattern passes [engine options...]${NC}"
+  echo "Example: $0 /dev/sdb ext4 zeros 1 --verify"
   exit 1
 fi
 
@@ -60,29 +76,55 @@ DISK="$1"
 FS_CHOICE="$2"
 PATTERN="$3"
 PASSES="$4"
+shift 4
+ENGINE_ARGS=("$@")
+PYTHON="${UEE_PYTHON:-python3}"
+
+# phase markers for --trace, read by the front-end
+trace() {
+    [ -n "$UEE_TRACE" ] && printf '@@uee-trace {"ph":"%s","name":"%s"}\\n' "$1" "$2"
+    return 0
+}
+
+trace B check
 
 # check for required tools
 command -v lsblk >/dev/null 2>&1 || { echo >&2 "${RED}lsblk is required but not installed. Aborting.${NC}"; exit 1; }
 command -v parted >/dev/null 2>&1 || { echo >&2 "${RED}parted is required but not installed. Aborting.${NC}"; exit 1; }
 command -v partprobe >/dev/null 2>&1 || { echo >&2 "${RED}partprobe is required but not installed. Aborting.${NC}"; exit 1; }
-command -v dd >/dev/null 2>&1 || { echo >&2 "${RED}dd is required but not installed. Aborting.${NC}"; exit 1; }
-command -v tr >/dev/null 2>&1 || { echo >&2 "${RED}tr is required but not installed. Aborting.${NC}"; exit 1; }
-
-
-if [ ! -b "$DISK" ]; then
-  echo "${RED}Error: '$DISK' is not a valid block device.${NC}"
+command -v "$PYTHON" >/dev/null 2>&1 || { echo >&2 "${RED}$PYTHON is required but not installed. Aborting.${NC}"; exit 1; }
+
+
+IMAGE=""
+SIM=""
+if [[ "$DISK" == sim:* ]]; then
+  # simulated drive (uee_sim.py): only the engine opens it, nothing to unmount or format
+  SIM="$DISK"
+elif [ -f "$DISK" ]; then
+  # disk image: wiped as a file, partitioned and formatted through a loop device
+  IMAGE="$DISK"
+  command -v losetup >/dev/null 2>&1 || { echo >&2 "${RED}losetup is required for image files but not installed. Aborting.${NC}"; exit 1; }
+  if [ -n "$(losetup -j "$IMAGE")" ]; then
+    echo "${RED}Error: '$IMAGE' is attached to a loop device, detach it first.${NC}"
+    exit 1
+  fi
+elif [ ! -b "$DISK" ]; then
+  echo "${RED}Error: '$DISK' is not a valid block device or image file.${NC}"
   exit 1
 fi
+trace E check
 
-# unmount all partitions on the selected disk
-echo "${YELLOW}Checking for mounted partitions on $DISK...${NC}"
-for part in $(lsblk -lno NAME "$DISK" | grep -v "^$(basename "$DISK")$"); do
-  PART_PATH="/dev/$part"
-  if mountpoint -q "$PART_PATH"; then
-    echo "Unmounting $PART_PATH..."
-    umount "$PART_PATH"
+# unmount, swapoff and close everything stacked on the selected disk
+trace B unmount
+if [ -z "$IMAGE" ] && [ -z "$SIM" ]; then
+  if [ -z "$UEE_TOPOLOGY" ] || [ ! -f "$UEE_TOPOLOGY" ]; then
+    echo "${RED}Topology helper not found (UEE_TOPOLOGY='$UEE_TOPOLOGY'). Aborting.${NC}"
+    exit 1
   fi
-done
+  echo "${YELLOW}Releasing mounts, swap and device stacks on $DISK...${NC}"
+  "$PYTHON" "$UEE_TOPOLOGY" teardown "$DISK"
+fi
+trace E unmount
 
 # -------------------------------------------------
 # --- NEW SECURE WIPE BLOCK ---
@@ -95,28 +137,23 @@ if [ -n "$PATTERN" ] && [ "$PATTERN" != "none" ]; then
     echo "  Passes: $PASSES"
     echo
 
-    for (( i=1; i<=$PASSES; i++ )); do
-        echo "${GREEN}Pass $i of $PASSES...${NC}"
-        case $PATTERN in
-            "zeros")
-                echo "Writing zeros... (This will take a long time)"
-                dd if=/dev/zero of="$DISK" bs=4M status=progress
-                ;;
-            "ones")
-                echo "Writing ones... (This will take a long time)"
-                # Create a stream of 0xFF (ones) and pipe it
-                tr '\0' '\377' < /dev/zero | dd of="$DISK" bs=4M status=progress
-                ;;
-            "random")
-                echo "Writing random data... (This will take a VERY long time)"
-                dd if=/dev/urandom of="$DISK" bs=4M status=progress
-                ;;
-            *)
-                echo "${YELLOW}Unknown pattern '$PATTERN', skipping wipe.${NC}"
-                ;;
-        esac
-        echo "${GREEN}Pass $i complete.${NC}"
-    done
+    # the engine runs every pass, verifies and writes the certificate
+    if [ -z "$UEE_ENGINE" ] || [ ! -f "$UEE_ENGINE" ]; then
+        echo "${RED}Wipe engine not found (UEE_ENGINE='$UEE_ENGINE'). Aborting.${NC}"
+        exit 1
+    fi
+
+    trace B wipe
+    # crypto destroys the LUKS key material instead of overwriting the surface
+    if [ "$PATTERN" = "crypto" ]; then
+        "$PYTHON" "$UEE_ENGINE" crypto-erase "$DISK" "${ENGINE_ARGS[@]}"
+    # scrub only zeroes the known signature locations
+    elif [ "$PATTERN" = "scrub" ]; then
+        "$PYTHON" "$UEE_ENGINE" scrub "$DISK" "${ENGINE_ARGS[@]}"
+    else
+        "$PYTHON" "$UEE_ENGINE" wipe "$DISK" "$PATTERN" "$PASSES" "${ENGINE_ARGS[@]}"
+    fi
+    trace E wipe
 
     echo "${GREEN}--- Secure Wipe Finished ---${NC}"
 else
@@ -126,6 +163,17 @@ fi
 # --- END NEW SECURE WIPE BLOCK ---
 # -------------------------------------------------
 
+if [ -n "$SIM" ]; then
+    echo "${YELLOW}$DISK is a simulated drive, skipping partitioning and formatting.${NC}"
+    exit 0
+fi
+
+# host-managed zones only take sequential writes: ext4, fat32, exfat and ntfs cannot live there
+if [ -b "$DISK" ] && [ "$(cat "/sys/class/block/$(basename "$(readlink -f "$DISK")")/queue/zoned" 2>/dev/null)" = "host-managed" ]; then
+    echo "${YELLOW}$DISK is a host-managed zoned device, skipping partitioning and formatting.${NC}"
+    exit 0
+fi
+
 
 # set tool based on $2
 case $FS_CHOICE in
@@ -157,18 +205,31 @@ command -v $TOOL >/dev/null 2>&1 || { echo >&2 "${RED}Tool '$TOOL' for $FS_CHOIC
 echo
 echo "${GREEN}--- Starting Partitioning and Formatting ---${NC}"
 
+# attach an image file so it can be partitioned like a disk
+if [ -n "$IMAGE" ]; then
+    DISK=$(losetup -fP --show "$IMAGE")
+    trap 'losetup -d "$DISK"' EXIT
+    echo "Attached $IMAGE to $DISK"
+fi
+
 # create a new gpt partition table
 echo "1. Wiping partition table on $DISK..."
+trace B mklabel
 parted "$DISK" --script -- mklabel gpt
+trace E mklabel
 
 # create a single partition covering the whole disk
 echo "2. Creating new primary partition on $DISK..."
+trace B mkpart
 parted "$DISK" --script -- mkpart primary 0% 100%
+trace E mkpart
 
 # tell the kernel to re-read the partition table
 echo "3. Reloading partition table..."
+trace B partprobe
 partprobe "$DISK"
 sleep 2 # give the system a moment to catch up
+trace E partprobe
 
 # find the name of the new partition (e.g., sdb1 or nvme0n1p1)
 PARTITION_NAME=$(lsblk -lno NAME "$DISK" | tail -n 1)
@@ -183,11 +244,13 @@ echo "4. Found new partition: $PARTITION"
 
 # format the new partition
 echo "5. Formatting $PARTITION as $FS_CHOICE..."
+trace B mkfs
 $TOOL "${ARGS[@]}" "$PARTITION"
+trace E mkfs
 
 echo
 echo "${GREEN}--- All Done! ---${NC}"
-echo "Disk $DISK has been successfully wiped and formatted."
+echo "Disk ${IMAGE:-$DISK} has been successfully wiped and formatted."
 echo "Partition: $PARTITION"
 echo "Filesystem: $FS_CHOICE"
 """
@@ -197,13 +260,28 @@ DEFAULT_CONFIG = {
     "passes": 1,
     "pattern": "zeros",  # Default pattern
     "verify": False,
-    "post_action": "none"
+    "trace": False,
+    "max_temp": 60,
+    "critical_temp": 70,
+    "post_action": "none",
+    "android_overwrite": "none",  # none, free-space or userdata
+    "scope": "full",  # full or allocated
+    "numa": "auto",  # auto pins the engine to the disk controller's NUMA node, or off
+    "crypto_scrub": False  # zero partition/filesystem signatures after a crypto erase
 }
 
 # modified script to remove all user 'read' prompts
 ANDROID_WIPE_SCRIPT = """#!/bin/bash
 set -e
 
+# phase markers for --trace, read by the front-end
+trace() {
+    [ -n "$UEE_TRACE" ] && printf '@@uee-trace {"ph":"%s","name":"%s","tid":"%s"}\\n' "$1" "$2" "${3:-main}"
+    return 0
+}
+
+trace B check
+
 # check and install adb/fastboot
 if ! command -v adb &> /dev/null || ! command -v fastboot &> /dev/null; then
     echo "ADB or Fastboot not found. Installing Android platform tools..."
@@ -220,42 +298,129 @@ if ! command -v adb &> /dev/null || ! command -v fastboot &> /dev/null; then
         exit 1
     fi
 fi
+trace E check
 
 # connected devices
 echo "Checking for connected devices..."
+trace B scan
 DEVICE_LIST=$(adb devices | grep -w "device" | awk '{print $1}')
+FASTBOOT_LIST=$(fastboot devices | grep -w "fastboot" | awk '{print $1}')
+trace E scan
 
-if [ -z "$DEVICE_LIST" ]; then
+if [ -z "$DEVICE_LIST" ] && [ -z "$FASTBOOT_LIST" ]; then
     echo "No devices detected. Connect at least one device via USB."
     echo "If using normal Android mode, enable Developer Options and USB Debugging."
+    echo "Devices in the bootloader are picked up in fastboot mode."
     sleep 3
     exit 1
 fi
 
 # no of devices
 echo "Detected devices:"
-echo "$DEVICE_LIST"
+[ -n "$DEVICE_LIST" ] && echo "$DEVICE_LIST"
+[ -n "$FASTBOOT_LIST" ] && echo "$FASTBOOT_LIST" | sed 's/$/ (fastboot)/'
 echo "---"
 
-# parallel wipe
-for device in $DEVICE_LIST; do
-    (
-        echo "Starting wipe on: $device"
-        adb -s "$device" reboot recovery
-        sleep 5
-        adb -s "$device" shell recovery --wipe_data || {
-            echo "Wipe command failed on: $device. It may require manual confirmation on-device."
-        }
-        echo "Wipe complete for: $device"
-    ) &
-done
-
-wait
-echo "All connected devices have been wiped successfully."
+# parallel wipe, with the optional overwrite stage first ($UEE_ANDROID)
+PYTHON="${UEE_PYTHON:-python3}"
+if [ -z "$UEE_ANDROID" ] || [ ! -f "$UEE_ANDROID" ]; then
+    echo "Android orchestrator not found (UEE_ANDROID='$UEE_ANDROID'). Aborting."
+    exit 1
+fi
+"$PYTHON" "$UEE_ANDROID" wipe "$@" $DEVICE_LIST $FASTBOOT_LIST
 sleep 2
 """
 
 
+class ListView:
+    """
+    Viewport over a list: only the rows that fit are drawn, so the cost of
+    a redraw does not depend on the length of the list. Filtering narrows
+    the previous matches while the filter grows, and items appended later
+    (log lines) are matched as they arrive. Marks are kept by key across
+    rescans. With follow, a cursor on the last row stays on the last row
+    as items are appended.
+    """
+
+    def __init__(self, items=None, text=str, key=None, follow=False):
+        self.text = text
+        self.key = key or text
+        self.follow = follow
+        self.filter = ""
+        self.cursor = 0
+        self.top = 0
+        self.marked = set()
+        self.set_items([] if items is None else items)
+
+    def set_items(self, items):
+        self.items = items
+        self.matches = []
+        self.seen = 0
+        self.refresh()
+        keys = {self.key(item) for item in items}
+        self.marked &= keys
+
+    def _match(self, item):
+        return not self.filter or self.filter in self.text(item).lower()
+
+    # match the items appended since the last call
+    def refresh(self):
+        at_end = self.cursor >= len(self.matches) - 1
+        for i in range(self.seen, len(self.items)):
+            if self._match(self.items[i]):
+                self.matches.append(i)
+        self.seen = len(self.items)
+        if at_end and self.follow:
+            self.cursor = len(self.matches) - 1
+        self.cursor = max(0, min(self.cursor, len(self.matches) - 1))
+
+    def set_filter(self, text):
+        text = text.lower()
+        current = self.current()
+        if self.filter and text.startswith(self.filter):
+            self.filter = text
+            self.matches = [i for i in self.matches if self._match(self.items[i])]
+        else:
+            self.filter = text
+            self.matches = [i for i, item in enumerate(self.items) if self._match(item)]
+        # stay on the same item if it still matches
+        positions = [pos for pos, i in enumerate(self.matches) if self.items[i] is current]
+        self.cursor = positions[0] if positions else len(self.matches) - 1 if self.follow else 0
+        self.cursor = max(0, self.cursor)
+
+    def current(self):
+        return self.items[self.matches[self.cursor]] if self.matches else None
+
+    def move(self, delta):
+        self.cursor = max(0, min(self.cursor + delta, len(self.matches) - 1))
+
+    def rows(self, height):
+        """(item, is_cursor, is_marked) for the visible rows."""
+        if self.cursor < self.top:
+            self.top = self.cursor
+        elif self.cursor >= self.top + height:
+            self.top = self.cursor - height + 1
+        self.top = max(0, min(self.top, len(self.matches) - height))
+        return [(self.items[i], pos == self.cursor, self.key(self.items[i]) in self.marked)
+                for pos, i in enumerate(self.matches[self.top:self.top + height], self.top)]
+
+    def toggle(self):
+        item = self.current()
+        if item is not None:
+            self.marked ^= {self.key(item)}
+
+    # mark every match, or unmark them if they all are marked already
+    def toggle_all(self):
+        keys = {self.key(self.items[i]) for i in self.matches}
+        if keys <= self.marked:
+            self.marked -= keys
+        else:
+            self.marked |= keys
+
+    def marked_items(self):
+        return [item for item in self.items if self.key(item) in self.marked]
+
+
 class UEEApp:
 
     def __init__(self, stdscr):
@@ -280,8 +445,19 @@ class UEEApp:
         self.process = None
         self.script_output = []
         self.drives = []
+        self.drive_list = ListView(text=lambda d: f"{d['name']} {d.get('model') or ''} {d.get('serial') or ''}",
+                                   key=lambda d: d['name'])
+        self.log_list = ListView(self.message_log, follow=True)
+        self.filtering = False
+        self.batch = []
+        self.resolved = []
+        self.queue = []
         self.pending_fs = None
         self.pending_method = None
+        self.sampler = uee_metrics.Sampler()
+        self.tracer = uee_trace.Tracer(enabled=False)
+        self.trace_path = None
+        self.last_sample = 0
         self.scan_drives()
 
     def setup_curses(self):
@@ -318,7 +494,7 @@ class UEEApp:
         self.message_log.append("Scanning for drives...")
         self.drives = []
         try:
-            cmd = ["lsblk", "-J", "-d", "-o", "NAME,SIZE,MODEL,TYPE"]
+            cmd = ["lsblk", "-J", "-d", "-o", "NAME,SIZE,MODEL,SERIAL,TYPE"]
             result = subprocess.run(cmd, capture_output=True, text=True, check=True)
             data = json.loads(result.stdout)
 
@@ -329,7 +505,11 @@ class UEEApp:
                 name = "/dev/" + item.get('name', 'N/A')
                 size = item.get('size', 'N/A')
                 model = item.get('model', 'N/A')
-                self.drives.append({"name": name, "size": size, "model": model})
+                serial = item.get('serial') or ''
+                self.drives.append({"name": name, "size": size, "model": model, "serial": serial})
+            # one entry per LUN, however many paths lead to it
+            self.drives = uee_topology.group_drives(self.drives)
+            self.drives += uee_sim.list_drives()
 
             if not self.drives:
                 self.message_log.append("No suitable drives found.")
@@ -340,6 +520,7 @@ class UEEApp:
         except Exception as e:
             self.message_log.append(f"Drive scan failed: {e}")
             self.drives.append({"name": "N/A", "size": "", "model": f"Scan error"})
+        self.drive_list.set_items(self.drives)
 
     def run(self):
         while True:
@@ -364,13 +545,15 @@ class UEEApp:
                 self.draw_confirm_android()
             elif self.state == "run_script":
                 self.draw_run_script()
+            elif self.state == "view_log":
+                self.draw_log()
             else:
                 break
 
             self.stdscr.refresh()
             c = self.stdscr.getch()
 
-            if c == ord('q'):
+            if c == ord('q') and not self.filtering:
                 if self.process:
                     self.process.kill()
                 break
@@ -399,7 +582,9 @@ class UEEApp:
         menu_y = min(self.height - 7, starty + len(art_lines) + 1)
 
         current_drive_name = "N/A"
-        if self.drives and self.drive_idx < len(self.drives):
+        if self.batch:
+            current_drive_name = f"{len(self.batch)} drives"
+        elif self.drives and self.drive_idx < len(self.drives):
             current_drive_name = self.drives[self.drive_idx]["name"]
 
         options = [
@@ -434,7 +619,7 @@ class UEEApp:
     def draw_basic_menu(self):
         self.draw_border()
         self.center_text(2, "BASIC MODE - Quick Format")
-        self.stdscr.addstr(3, 4, "This skips the secure wipe and just formats the drive.")
+        self.stdscr.addstr(3, 4, "This scrubs old partition tables, RAID labels and superblocks, then formats.")
 
         options = ["Quick Format (ext4)", "Quick Format (fat32)", "Back"]
 
@@ -446,7 +631,7 @@ class UEEApp:
             else:
                 self.stdscr.addstr(y, 6, "   " + opt)
 
-        self.stdscr.addstr(self.height - 3, 2, "This will perform a format-only operation.")
+        self.stdscr.addstr(self.height - 3, 2, "Signature scrub and format only; the data is not overwritten.")
 
     # draw the advanced configuration editor menu.
     def draw_advanced_menu(self):
@@ -457,19 +642,21 @@ class UEEApp:
         self.stdscr.addstr(6, 6, f"passes : {self.config.get('passes')}")
         self.stdscr.addstr(7, 6, f"pattern: {self.config.get('pattern')}")
         self.stdscr.addstr(8, 6, f"verify : {self.config.get('verify')}")
+        self.stdscr.addstr(9, 6, f"trace  : {self.config.get('trace', False)}")
 
         options = [
             "Increase passes",
             "Decrease passes",
             "Cycle pattern",
             "Toggle verify",
+            "Toggle trace",
             "Save config",
             "START ERASE",
             "Back",
         ]
 
         for idx, opt in enumerate(options):
-            y = 10 + idx
+            y = 11 + idx
             if idx == self.selected:
                 self.stdscr.addstr(y, 6, "-> ")
                 self.stdscr.addstr(y, 9, opt, self.color_highlight)
@@ -478,27 +665,50 @@ class UEEApp:
 
         self.stdscr.addstr(self.height - 3, 2, "START ERASE will use these settings, then format.")
 
+    # rows between the header and the footer, only those are drawn
+    def list_height(self):
+        return max(self.height - 9, 1)
+
+    def draw_filter(self, view, total_label):
+        cursor = "_" if self.filtering else ""
+        marked = f", {len(view.marked)} marked" if view.marked else ""
+        text = f"Filter: {view.filter}{cursor}   ({len(view.matches)} of {len(view.items)} {total_label}{marked})"
+        self.stdscr.addstr(4, 6, text[:self.width - 8])
+
     def draw_drive_selector(self):
         self.draw_border()
         self.center_text(2, "Select Drive")
-
-        for idx, d in enumerate(self.drives):
-            y = 4 + idx
-            text = f"{d['name']}   {d['size']}   {d['model']}"
-            if idx == self.selected:
+        self.draw_filter(self.drive_list, "drives")
+
+        width = self.width - 12
+        for row, (d, is_cursor, is_marked) in enumerate(self.drive_list.rows(self.list_height())):
+            y = 6 + row
+            text = f"[{'x' if is_marked else ' '}] {d['name']:<14} {d['size']:>7}  {d['model'] or ''}  {d.get('serial') or ''}"
+            if d.get('paths'):
+                text += f"  ({len(d['paths']) + 1} paths)"
+            elif d.get('members'):
+                text += f"  (wipes {', '.join(d['members'])})"
+            if is_cursor:
                 self.stdscr.addstr(y, 6, "-> ")
-                self.stdscr.addstr(y, 9, text, self.color_highlight)
+                self.stdscr.addstr(y, 9, text[:width], self.color_highlight)
             else:
-                self.stdscr.addstr(y, 6, "   " + text)
+                self.stdscr.addstr(y, 6, "   " + text[:width])
 
-        y = 4 + len(self.drives)
-        if self.selected == len(self.drives):
-            self.stdscr.addstr(y, 6, "-> ")
-            self.stdscr.addstr(y, 9, "Back", self.color_highlight)
-        else:
-            self.stdscr.addstr(y, 6, "   Back")
+        self.stdscr.addstr(self.height - 3, 2, "/ filter  Space mark  a mark all  Enter select  "
+                                               "PgUp/PgDn  ESC back"[:self.width - 4])
+        self.stdscr.addstr(self.height - 2, 2, "WARNING: This will permanently destroy data."[:self.width - 4])
+
+    def draw_log(self):
+        self.log_list.refresh()
+        self.draw_border()
+        self.center_text(2, "UEE - Log")
+        self.draw_filter(self.log_list, "lines")
+        if not self.message_log:
+            self.stdscr.addstr(6, 4, "(no log messages)")
+        for row, (line, is_cursor, _) in enumerate(self.log_list.rows(self.list_height())):
+            self.stdscr.addstr(6 + row, 4, line[: self.width - 8], self.color_highlight if is_cursor else 0)
 
-        self.stdscr.addstr(self.height - 3, 2, "WARNING: This will permanently destroy data.")
+        self.stdscr.addstr(self.height - 3, 2, "/ filter  Up/Down PgUp/PgDn Home/End scroll  ESC back"[:self.width - 4])
 
     def draw_select_fs(self):
         self.draw_border()
@@ -522,23 +732,67 @@ class UEEApp:
         drive = self.drives[self.drive_idx]
         method = self.pending_method
 
-        self.stdscr.addstr(4, 6, f"Drive:      {drive['name']}   {drive['size']}   {drive['model']}")
-        self.stdscr.addstr(5, 6, f"Method:     {method}")
-        self.stdscr.addstr(6, 6, f"Pattern:    {self.config.get('pattern')}")
-        self.stdscr.addstr(7, 6, f"Passes:     {self.config.get('passes')}")
-        self.stdscr.addstr(8, 6, f"Filesystem: {self.pending_fs}")
+        if self.resolved:
+            self.stdscr.addstr(3, 6, f"Resolved:   {'; '.join(self.resolved)}"[:self.width - 8])
 
-        self.stdscr.addstr(10, 6, "Type 'FORMAT' to begin, or Back to cancel.")
+        if self.batch:
+            self.stdscr.addstr(4, 6, f"Drives:     {len(self.batch)}: {', '.join(self.batch)}"[:self.width - 8])
+        else:
+            self.stdscr.addstr(4, 6, f"Drive:      {drive['name']}   {drive['size']}   {drive['model']}")
+        self.stdscr.addstr(5, 6, f"Method:     {method}")
+        zoned = uee_zoned.probe(drive['name'])
+        scope = " (allocated blocks only)" if self.config.get('scope') == 'allocated' else ""
+        if zoned:
+            # zones are reset and rewritten whole, allocated or not
+            scope = f" ({zoned['model']} zoned, {len(zoned['zones'])} zones)"
+        self.stdscr.addstr(6, 6, f"Pattern:    {self.config.get('pattern')}{scope}")
+        if self.config.get('pattern') == 'crypto':
+            scrub = ", then scrub signatures" if self.config.get('crypto_scrub') else ""
+            self.stdscr.addstr(7, 6, f"Crypto:     {self.crypto_plan(drive)[0] or 'nothing found'}{scrub}"[:self.width - 8])
+        elif self.config.get('pattern') == 'scrub':
+            self.stdscr.addstr(7, 6, "Scrub:      partition tables, RAID/LVM labels, superblocks"[:self.width - 8])
+        else:
+            self.stdscr.addstr(7, 6, f"Passes:     {self.config.get('passes')}")
+        self.stdscr.addstr(8, 6, f"Verify:     {self.config.get('verify')}")
+        if zoned and zoned['model'] == 'host-managed':
+            self.stdscr.addstr(9, 6, "Filesystem: none (host-managed zoned device)")
+        else:
+            self.stdscr.addstr(9, 6, f"Filesystem: {self.pending_fs}")
+        self.stdscr.addstr(10, 6, f"Est. time:  {self.predict_eta(drive)}")
+        teardown, refused = self.teardown_plan(drive)
+        if not refused and self.config.get('pattern') == 'crypto':
+            refused = self.crypto_plan(drive)[1]
+        # every drive of a batch is checked now, not when its turn comes
+        for other in self.drives:
+            if refused or other['name'] not in self.batch[1:]:
+                continue
+            other_teardown, refused = self.teardown_plan(other)
+            if not refused and self.config.get('pattern') == 'crypto':
+                refused = self.crypto_plan(other)[1]
+            if refused:
+                refused = f"{other['name']}: {refused}"
+            teardown += other_teardown
+        if refused:
+            self.stdscr.addstr(11, 6, f"REFUSED:    {refused}"[:self.width - 8], curses.A_BOLD)
+        elif teardown:
+            self.stdscr.addstr(11, 6, f"Teardown:   {'; '.join(teardown)}"[:self.width - 8])
+
+        self.stdscr.addstr(12, 6, "Type 'FORMAT' to begin, or Back to cancel.")
 
         self.stdscr.nodelay(False)
         curses.echo()
-        self.stdscr.addstr(12, 6, "> ")
-        s = self.stdscr.getstr(12, 8, 20).decode('utf-8')
+        self.stdscr.addstr(14, 6, "> ")
+        s = self.stdscr.getstr(14, 8, 20).decode('utf-8')
         curses.noecho()
         self.stdscr.nodelay(True)
 
-        if s.strip() == "FORMAT":
+        if s.strip() == "FORMAT" and refused:
+            self.message_log.append(f"Refusing to wipe {drive['name']}: {refused}.")
+            self.state = "main_menu"
+            self.selected = 0
+        elif s.strip() == "FORMAT":
             self.message_log.append(f"Starting operation on {drive['name']}...")
+            self.queue = self.batch[1:]
             self.start_format_script()
             self.state = "run_script"
         else:
@@ -550,7 +804,10 @@ class UEEApp:
         self.draw_border()
         self.center_text(2, "CONFIRM ANDROID WIPE")
         self.stdscr.addstr(4, 6, "This will attempt to wipe all data on ALL")
-        self.stdscr.addstr(5, 6, "connected devices in ADB mode.")
+        self.stdscr.addstr(5, 6, "connected devices in ADB or fastboot mode.")
+        overwrite = self.config.get('android_overwrite', 'none')
+        if overwrite != 'none':
+            self.stdscr.addstr(6, 6, f"Overwrite first: {overwrite} ({self.android_pattern()})")
         self.stdscr.addstr(7, 6, "Type 'CONFIRM' to begin, or Back to cancel.")
 
         self.stdscr.nodelay(False)
@@ -580,7 +837,7 @@ class UEEApp:
 
         self.center_text(2, title)
 
-        max_lines = self.height - 6
+        max_lines = self.height - 8  # keep room for the media line
         start_index = max(0, len(self.script_output) - max_lines)
 
         y = 4
@@ -588,17 +845,36 @@ class UEEApp:
             self.stdscr.addstr(y, 4, line[:self.width - 8])
             y += 1
 
+        if self.process is not None and self.pending_fs:
+            self.draw_media_stats()
+
         if self.process is None:
             self.stdscr.addstr(self.height - 3, 2, "Script finished. Press any key to return.")
         else:
             self.stdscr.addstr(self.height - 3, 2, "Script running... Press 'q' to force quit.")
 
+    # live media numbers from /sys/block/<dev>/stat, same data as the exporter
+    def draw_media_stats(self):
+        now = time.monotonic()
+        if now - self.last_sample >= uee_metrics.DEFAULT_INTERVAL:
+            self.sampler.sample()
+            self.last_sample = now
+
+        drive_name = self.drives[self.drive_idx]['name']
+        for row in self.sampler.snapshot():
+            if row['device'] == drive_name and 'write_mb_per_s' in row:
+                text = (f"Media: {row.get('phase', '-')}  write {row['write_mb_per_s']} MB/s  "
+                        f"read {row['read_mb_per_s']} MB/s  in-flight {row['in_flight']}")
+                self.stdscr.addstr(self.height - 4, 2, text[:self.width - 4])
+
     def update_script_output(self):
         if self.process is None:
             return
 
         try:
             for line in iter(self.process.stdout.readline, ''):
+                if self.tracer.feed(line):
+                    continue
                 if line:
                     self.script_output.append(line.strip())
                 else:
@@ -609,24 +885,189 @@ class UEEApp:
         status = self.process.poll()
         if status is not None:
             if self.pending_fs:
-                self.message_log.append(f"Format script finished with code {status}.")
+                self.message_log.append(f"Format script on {self.drives[self.drive_idx]['name']} finished with code {status}.")
             else:
                 self.message_log.append(f"Android script finished with code {status}.")
 
             self.process.stdout.close()
             self.process = None
+            self.record_job(status)
+
+            if self.trace_path:
+                try:
+                    self.tracer.save(self.trace_path)
+                    self.message_log.append(f"Trace written to {self.trace_path}")
+                except Exception as e:
+                    self.message_log.append(f"Failed to write trace: {e}")
+                self.trace_path = None
+
+            if self.pending_fs and self.queue:
+                name = self.queue.pop(0)
+                self.drive_idx = next((i for i, d in enumerate(self.drives) if d['name'] == name), self.drive_idx)
+                self.message_log.append(f"Starting operation on {name} ({len(self.queue)} more queued)...")
+                self.start_format_script()
+
+    # phases are always collected for the ledger, the trace file is only
+    # written if enabled in the config.
+    def start_trace(self, env, name):
+        self.tracer = uee_trace.Tracer(process_name=f"uee {name}")
+        env["UEE_TRACE"] = "1"
+        self.trace_path = None
+        if self.config.get('trace'):
+            self.trace_path = TRACE_DIR / f"{name}-{time.strftime('%Y%m%d-%H%M%S')}.json"
+        return env
+
+    def predict_eta(self, drive):
+        pattern = self.config.get('pattern', 'none')
+        try:
+            ledger = uee_ledger.Ledger()
+            eta, history = ledger.predict(drive.get('model'), uee_ledger.device_size_bytes(drive['name']),
+                                          0 if pattern in ('none', 'crypto', 'scrub') else self.config.get('passes', 1),
+                                          self.config.get('verify') and pattern not in ('none', 'crypto', 'scrub'))
+            ledger.close()
+        except Exception:
+            return "unknown"
+        if eta is None:
+            return "unknown (no history for this model)"
+        return f"{uee_ledger.format_duration(eta)} (from {history} earlier jobs)"
+
+    # md/dm devices go to their member disks, which join the batch
+    def expand_targets(self, chosen):
+        self.resolved = []
+        known = {d['name'] for d in self.drives}
+        names = []
+        for drive in chosen:
+            targets = [drive['name']]
+            if drive.get('members'):
+                try:
+                    resolution = uee_topology.Topology().resolve_targets(drive['name'])
+                    self.resolved += uee_topology.describe_targets(resolution)
+                    targets = ["/dev/" + t for t in resolution['targets']]
+                except uee_topology.TopologyError as e:
+                    self.message_log.append(f"Cannot resolve {drive['name']}: {e}")
+            for name in targets:
+                if name not in known:
+                    self.message_log.append(f"{name} is not in the drive list, skipped")
+                elif name not in names:
+                    names.append(name)
+        for line in self.resolved:
+            self.message_log.append(f"Resolved: {line}")
+        return names or [chosen[0]['name']]
+
+    # what has to be unmounted/closed first, and whether the drive carries the running system
+    def teardown_plan(self, drive):
+        if uee_sim.is_sim(drive['name']):
+            return [], None
+        try:
+            plan = uee_topology.Topology().plan(drive['name'])
+        except uee_topology.TopologyError as e:
+            return [], str(e)
+        return uee_topology.describe(plan), plan['refused']
+
+    # what a crypto erase would destroy on the drive, or why it cannot run
+    def crypto_plan(self, drive):
+        found = uee_crypto.probe(drive['name'])
+        if not found:
+            return "", "cannot read the drive"
+        if not found['luks']:
+            opal = " (OPAL drive: a PSID revert needs the CLI's --psid)" if found['opal'] else ""
+            return uee_crypto.describe(found), f"nothing to crypto-erase, no LUKS header{opal}"
+        return uee_crypto.describe(found), None
+
+    def record_job(self, status):
+        job, self.job = self.job, None
+        if job is None:
+            return
+        if 'report' in job:
+            self.record_android(job['report'])
+            return
+        path = job.get('certificate_path')
+        cert = uee_ledger.load_certificate(path) if path else None
+        outcome = 'success' if status == 0 else 'failed'
+        if cert and cert.get('verification', {}).get('result') == 'failed':
+            outcome = 'verify-failed'
+        elif outcome == 'success' and cert and (cert.get('bad_blocks') or {}).get('sectors'):
+            outcome = 'bad-blocks'
+        elif outcome == 'success' and cert and (cert.get('health') or {}).get('degraded'):
+            outcome = 'degraded'
+        elif outcome == 'success' and cert and cert.get('plan', {}).get('method') == 'crypto-erase':
+            outcome = 'crypto-erased'
+        elif outcome == 'success' and cert and cert.get('plan', {}).get('method') == 'signature-scrub':
+            outcome = 'scrubbed'
+        try:
+            ledger = uee_ledger.Ledger()
+            ledger.record(outcome=outcome, phases=self.tracer.durations(), certificate=cert, **job)
+            ledger.close()
+        except Exception as e:
+            self.message_log.append(f"Failed to record job in ledger: {e}")
+
+    # one ledger row per device of the android wipe report
+    def record_android(self, report):
+        try:
+            ledger = uee_ledger.Ledger()
+            for job in uee_ledger.android_jobs(uee_ledger.load_report(report)):
+                ledger.record(**job)
+            ledger.close()
+        except Exception as e:
+            self.message_log.append(f"Failed to record job in ledger: {e}")
+        finally:
+            try:
+                os.unlink(report)
+            except OSError:
+                pass
 
     # write and start the format script.
     def start_format_script(self):
         script_name = "uee_format.sh"
         self.script_output = [f"Preparing {script_name}..."]
 
-        drive_name = self.drives[self.drive_idx]['name']
+        drive = self.drives[self.drive_idx]
+        drive_name = drive['name']
         fs_type = self.pending_fs
 
-        pattern = "none"
-
-        passes = str(self.config.get('passes', 1))
+        pattern = self.config.get('pattern', 'none')
+
+        passes = "0" if pattern in ('crypto', 'scrub') else str(self.config.get('passes', 1))
+
+        self.job = {"kind": "format", "started": time.time(), "device": drive_name,
+                    "serial": drive.get('serial'), "model": drive.get('model'),
+                    "size_bytes": uee_ledger.device_size_bytes(drive_name), "pattern": pattern,
+                    "passes": int(passes), "verify": bool(self.config.get('verify')), "filesystem": fs_type}
+
+        engine_args = []
+        if pattern == 'crypto':
+            name = drive.get('serial') or os.path.basename(drive_name)
+            cert = CERT_DIR / f"{name}-{time.strftime('%Y%m%d-%H%M%S')}.json"
+            engine_args += ['--certificate', str(cert.resolve())]
+            self.job["certificate_path"] = str(cert.resolve())
+            if self.config.get('crypto_scrub'):
+                engine_args.append('--scrub')
+            self.message_log.append(f"Certificate: {cert}")
+        elif pattern == 'scrub':
+            name = drive.get('serial') or os.path.basename(drive_name)
+            cert = CERT_DIR / f"{name}-{time.strftime('%Y%m%d-%H%M%S')}.json"
+            engine_args += ['--certificate', str(cert.resolve())]
+            self.job["certificate_path"] = str(cert.resolve())
+            self.message_log.append(f"Certificate: {cert}")
+        elif pattern != 'none':
+            if self.config.get('verify'):
+                engine_args.append('--verify')
+            if self.config.get('scope') == 'allocated':
+                engine_args += ['--scope', 'allocated']
+            name = drive.get('serial') or os.path.basename(drive_name)
+            cert = CERT_DIR / f"{name}-{time.strftime('%Y%m%d-%H%M%S')}.json"
+            engine_args += ['--certificate', str(cert.resolve())]
+            self.job["certificate_path"] = str(cert.resolve())
+            engine_args += ['--max-temp', str(self.config.get('max_temp', DEFAULT_CONFIG['max_temp'])),
+                            '--critical-temp', str(self.config.get('critical_temp', DEFAULT_CONFIG['critical_temp'])),
+                            '--numa', self.config.get('numa', DEFAULT_CONFIG['numa'])]
+            self.message_log.append(f"Certificate: {cert}")
+
+        env = os.environ.copy()
+        env["UEE_ENGINE"] = str(ENGINE_FILE)
+        env["UEE_TOPOLOGY"] = str(TOPOLOGY_FILE)
+        env["UEE_PYTHON"] = sys.executable
+        env = self.start_trace(env, f"format-{os.path.basename(drive_name)}")
 
         try:
             with open(script_name, "w") as f:
@@ -639,14 +1080,15 @@ class UEEApp:
             return
 
         try:
-            cmd = ["/bin/bash", script_name, drive_name, fs_type, pattern, passes]
+            cmd = ["/bin/bash", script_name, drive_name, fs_type, pattern, passes] + engine_args
             self.process = subprocess.Popen(
                 cmd,
                 stdout=subprocess.PIPE,
                 stderr=subprocess.STDOUT,
                 text=True,
                 bufsize=1,
-                universal_newlines=True
+                universal_newlines=True,
+                env=env
             )
             fd = self.process.stdout.fileno()
             fl = fcntl.fcntl(fd, fcntl.F_GETFL)
@@ -659,10 +1101,24 @@ class UEEApp:
             self.script_output.append(f"Failed to start script: {e}")
             self.process = None
 
+    def android_pattern(self):
+        pattern = self.config.get('pattern', 'zeros')
+        return pattern if pattern in ('zeros', 'ones', 'random') else 'zeros'
+
     def start_android_wipe(self):
         script_name = "android_wipe.sh"
         self.script_output = [f"Preparing {script_name}..."]
         self.pending_fs = None
+        fd, report = tempfile.mkstemp(prefix="uee-android-", suffix=".json")
+        os.close(fd)
+        self.job = {'report': report}
+        script_args = ["--overwrite", self.config.get('android_overwrite', 'none'), "--pattern", self.android_pattern(),
+                       "--report", report]
+
+        env = os.environ.copy()
+        env["UEE_ANDROID"] = str(ANDROID_FILE)
+        env["UEE_PYTHON"] = sys.executable
+        env = self.start_trace(env, "android-wipe")
 
         try:
             with open(script_name, "w") as f:
@@ -675,19 +1131,21 @@ class UEEApp:
             return
 
         try:
+            cmd = ["/bin/bash", script_name] + script_args
             self.process = subprocess.Popen(
-                ["/bin/bash", script_name],
+                cmd,
                 stdout=subprocess.PIPE,
                 stderr=subprocess.STDOUT,
                 text=True,
                 bufsize=1,
-                universal_newlines=True
+                universal_newlines=True,
+                env=env
             )
             fd = self.process.stdout.fileno()
             fl = fcntl.fcntl(fd, fcntl.F_GETFL)
             fcntl.fcntl(fd, fcntl.F_SETFL, fl | os.O_NONBLOCK)
 
-            self.script_output.append(f"Starting: /bin/bash {script_name}")
+            self.script_output.append(f"Starting: {' '.join(cmd)}")
             self.script_output.append("---")
 
         except Exception as e:
@@ -695,6 +1153,11 @@ class UEEApp:
             self.process = None
 
     def handle_input(self, c):
+        if self.state in ('select_drive', 'view_log'):
+            view = self.drive_list if self.state == 'select_drive' else self.log_list
+            if self.list_input(view, c):
+                return
+
         if c in (curses.KEY_BACKSPACE, 27):
             if self.state not in ['main_menu', 'run_script']:
                 self.state = 'main_menu'
@@ -723,8 +1186,8 @@ class UEEApp:
             if c == curses.KEY_UP: self.selected = (self.selected - 1) % 3
             elif c == curses.KEY_DOWN: self.selected = (self.selected + 1) % 3
             elif c in (curses.KEY_ENTER, 10, 13):
-                # Set config to 'none' for basic mode
-                self.config['pattern'] = 'none'
+                # basic mode scrubs the old signatures, it does not overwrite
+                self.config['pattern'] = 'scrub'
                 self.config['passes'] = 1
 
                 if self.selected == 0:
@@ -740,15 +1203,15 @@ class UEEApp:
                 self.selected = 0
 
         elif self.state == 'advanced_menu':
-            if c == curses.KEY_UP: self.selected = (self.selected - 1) % 7
-            elif c == curses.KEY_DOWN: self.selected = (self.selected + 1) % 7
+            if c == curses.KEY_UP: self.selected = (self.selected - 1) % 8
+            elif c == curses.KEY_DOWN: self.selected = (self.selected + 1) % 8
             elif c in (curses.KEY_ENTER, 10, 13):
                 if self.selected == 0:
                     self.config['passes'] += 1
                 elif self.selected == 1:
                     self.config['passes'] = max(1, self.config['passes'] - 1)
                 elif self.selected == 2:
-                    patterns = ['zeros', 'ones', 'random']
+                    patterns = ['zeros', 'ones', 'random', 'crypto', 'scrub']
                     try:
                         cur_idx = patterns.index(self.config['pattern'])
                         self.config['pattern'] = patterns[(cur_idx + 1) % len(patterns)]
@@ -757,14 +1220,16 @@ class UEEApp:
                 elif self.selected == 3:
                     self.config['verify'] = not self.config['verify']
                 elif self.selected == 4:
+                    self.config['trace'] = not self.config.get('trace', False)
+                elif self.selected == 5:
                     self.save_config()
-                elif self.selected == 5: # START ERASE
+                elif self.selected == 6: # START ERASE
                     self.pending_method = 'Advanced Erase'
                     self.state = 'select_fs' # Go to FS selection
-                elif self.selected == 6: # Back
+                elif self.selected == 7: # Back
                     self.state = 'main_menu'
 
-                if self.selected != 5: # Don't reset selection on START
+                if self.selected != 6: # Don't reset selection on START
                     self.selected = 0
 
         elif self.state == 'select_fs':
@@ -784,13 +1249,27 @@ class UEEApp:
                 self.selected = 0
 
         elif self.state == 'select_drive':
-            count = len(self.drives) + 1
-            if c == curses.KEY_UP: self.selected = (self.selected - 1) % count
-            elif c == curses.KEY_DOWN: self.selected = (self.selected + 1) % count
+            if c == ord(' '):
+                self.drive_list.toggle()
+                self.drive_list.move(1)
+            elif c == ord('a'):
+                self.drive_list.toggle_all()
             elif c in (curses.KEY_ENTER, 10, 13):
-                if self.selected < len(self.drives):
-                    self.drive_idx = self.selected
-                    self.message_log.append(f"Selected drive {self.drives[self.drive_idx]['name']}")
+                # marked drives make a batch, run one after the other
+                chosen = self.drive_list.marked_items() or [self.drive_list.current()]
+                if chosen[0] is not None:
+                    names = self.expand_targets(chosen)
+                    self.drive_idx = next(i for i, d in enumerate(self.drives) if d['name'] == names[0])
+                    self.batch = names if len(names) > 1 else []
+                    if self.batch:
+                        self.message_log.append(f"Selected {len(self.batch)} drives: {', '.join(self.batch)}")
+                    else:
+                        self.message_log.append(f"Selected drive {self.drives[self.drive_idx]['name']}")
+                self.state = 'main_menu'
+                self.selected = 0
+
+        elif self.state == 'view_log':
+            if c in (curses.KEY_ENTER, 10, 13):
                 self.state = 'main_menu'
                 self.selected = 0
 
@@ -803,26 +1282,36 @@ class UEEApp:
                 self.selected = 0
 
     def view_log(self):
-        self.stdscr.clear()
-        self.draw_border()
-        self.center_text(2, "UEE - Log")
-        y = 4
-        if not self.message_log:
-            self.stdscr.addstr(y, 4, "(no log messages)")
-        else:
-            start_index = max(0, len(self.message_log) - (self.height - 8))
-            for line in self.message_log[start_index:]:
-                self.stdscr.addstr(y, 4, line[: self.width - 8])
-                y += 1
-
-        self.stdscr.addstr(self.height - 3, 2, "Press any key to go back")
-        self.stdscr.nodelay(False)
-        self.stdscr.getch()
-        self.stdscr.nodelay(True)
-
-        self.state = 'main_menu'
+        self.log_list.refresh()
+        self.log_list.cursor = len(self.log_list.matches) - 1
+        self.log_list.move(0)
+        self.state = 'view_log'
         self.selected = 0
 
+    # keys shared by the scrolling lists; True if c was handled
+    def list_input(self, view, c):
+        if self.filtering:
+            if c in (10, 13, curses.KEY_ENTER):
+                self.filtering = False
+            elif c == 27:
+                self.filtering = False
+                view.set_filter("")
+            elif c in (curses.KEY_BACKSPACE, 127, 8):
+                view.set_filter(view.filter[:-1])
+            elif 32 <= c < 127:
+                view.set_filter(view.filter + chr(c))
+            return True
+        page = self.list_height()
+        if c == curses.KEY_UP: view.move(-1)
+        elif c == curses.KEY_DOWN: view.move(1)
+        elif c == curses.KEY_PPAGE: view.move(-page)
+        elif c == curses.KEY_NPAGE: view.move(page)
+        elif c == curses.KEY_HOME: view.move(-len(view.matches))
+        elif c == curses.KEY_END: view.move(len(view.matches))
+        elif c == ord('/'): self.filtering = True
+        else:
+            return False
+        return True
 
 def main(stdscr):
     app = UEEApp(stdscr)
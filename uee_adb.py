@@ -0,0 +1,278 @@
+"""
+UEE native ADB client.
+
+Talks the adb host protocol to the local adb server (tcp:5037) instead
+of spawning an 'adb' process per action. Every request is a 4-hex-digit
+length followed by the request; the server answers OKAY or FAIL plus a
+length-prefixed message. Services on a device ('shell,v2,raw:', 'exec:',
+'reboot:') first switch the connection to the device with
+'host:transport:<serial>', after which the socket carries the stream.
+
+The server closes a connection once its service ends, so streams are
+one loopback socket each (no process, no output parsing). Device state
+comes from a single long-lived 'host:track-devices' connection shared by
+all waiters.
+
+ADB_SERVER_SOCKET (tcp:host:port) points the client at a stand-in server.
+"""
+import os
+import socket
+import struct
+import threading
+import time
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 5037
+CONNECT_TIMEOUT = 5.0
+# a stream may stall on USB for a while; only this long without progress is an error
+STREAM_TIMEOUT = 120.0
+
+# shell protocol v2 packet ids
+ID_STDIN = 0
+ID_STDOUT = 1
+ID_STDERR = 2
+ID_EXIT = 3
+ID_CLOSE_STDIN = 4
+
+
+class AdbError(Exception):
+    pass
+
+
+def server_address():
+    spec = os.environ.get("ADB_SERVER_SOCKET", "")
+    if spec.startswith("tcp:"):
+        parts = spec[4:].rsplit(":", 1)
+        if len(parts) == 2:
+            return parts[0] or DEFAULT_HOST, int(parts[1])
+        return DEFAULT_HOST, int(parts[0])
+    return DEFAULT_HOST, int(os.environ.get("ANDROID_ADB_SERVER_PORT", DEFAULT_PORT))
+
+
+def _recv_exact(sock, n):
+    data = bytearray()
+    while len(data) < n:
+        chunk = sock.recv(n - len(data))
+        if not chunk:
+            raise AdbError("connection closed by adb server")
+        data += chunk
+    return bytes(data)
+
+
+def _read_length_prefixed(sock):
+    length = int(_recv_exact(sock, 4), 16)
+    return _recv_exact(sock, length).decode(errors="replace")
+
+
+def _parse_devices(text):
+    devices = {}
+    for line in text.splitlines():
+        fields = line.split()
+        if len(fields) >= 2:
+            devices[fields[0]] = fields[1]
+    return devices
+
+
+class AdbClient:
+    """Connection factory for one adb server."""
+
+    def __init__(self, host=None, port=None, timeout=CONNECT_TIMEOUT):
+        default_host, default_port = server_address()
+        self.host = host or default_host
+        self.port = port or default_port
+        self.timeout = timeout
+
+    def connect(self, request=None):
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if request is not None:
+            try:
+                self.request(sock, request)
+            except Exception:
+                sock.close()
+                raise
+        return sock
+
+    @staticmethod
+    def request(sock, request):
+        payload = request.encode()
+        sock.sendall(b"%04x" % len(payload) + payload)
+        status = _recv_exact(sock, 4)
+        if status == b"OKAY":
+            return
+        if status == b"FAIL":
+            raise AdbError(_read_length_prefixed(sock))
+        raise AdbError(f"unexpected adb server reply {status!r}")
+
+    def query(self, request):
+        """A host request answered with one length-prefixed string."""
+        with self.connect(request) as sock:
+            return _read_length_prefixed(sock)
+
+    def version(self):
+        return int(self.query("host:version"), 16)
+
+    def devices(self):
+        """{serial: state} for every device the server knows."""
+        return _parse_devices(self.query("host:devices"))
+
+    def track_devices(self):
+        """Yield {serial: state} every time the device list changes."""
+        with self.connect("host:track-devices") as sock:
+            sock.settimeout(None)
+            while True:
+                yield _parse_devices(_read_length_prefixed(sock))
+
+    def device(self, serial, tracker=None):
+        return AdbDevice(self, serial, tracker)
+
+    def available(self):
+        try:
+            self.version()
+            return True
+        except (OSError, AdbError, ValueError):
+            return False
+
+
+class DeviceTracker:
+    """Background host:track-devices connection shared by all waiters."""
+
+    def __init__(self, client):
+        self.client = client
+        self.devices = {}
+        self.error = None
+        self.changed = threading.Condition()
+        self.thread = threading.Thread(target=self._run, name="adb-track-devices", daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        try:
+            for devices in self.client.track_devices():
+                with self.changed:
+                    self.devices = devices
+                    self.changed.notify_all()
+        except (OSError, AdbError) as e:
+            with self.changed:
+                self.error = e
+                self.changed.notify_all()
+
+    def wait_for(self, serial, state, timeout=None):
+        """Block until serial reports state; False on timeout or lost tracking."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.changed:
+            while self.devices.get(serial) != state:
+                if self.error is not None:
+                    return False
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.changed.wait(remaining)
+            return True
+
+
+class ShellStream:
+    """
+    A running shell v2 command. Popen-like: write to .stdin, close it to
+    send EOF, then wait() for the remote exit code.
+    """
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.stdin = self
+        self.stdout = bytearray()
+        self.stderr = bytearray()
+        self.returncode = None
+        self.header = struct.Struct("<BI")
+
+    def write(self, data):
+        try:
+            self.sock.sendall(self.header.pack(ID_STDIN, len(data)))
+            self.sock.sendall(data)
+        except socket.timeout:
+            # a stalled link, not a full device
+            raise TimeoutError(f"shell stream made no progress for {self.sock.gettimeout():.0f} s")
+        return len(data)
+
+    def close(self):
+        try:
+            self.sock.sendall(self.header.pack(ID_CLOSE_STDIN, 0))
+        except OSError:
+            pass
+
+    def wait(self, timeout=None):
+        self.sock.settimeout(timeout)
+        try:
+            while self.returncode is None:
+                kind, length = self.header.unpack(_recv_exact(self.sock, self.header.size))
+                data = _recv_exact(self.sock, length)
+                if kind == ID_STDOUT:
+                    self.stdout += data
+                elif kind == ID_STDERR:
+                    self.stderr += data
+                elif kind == ID_EXIT:
+                    self.returncode = data[0] if data else 0
+        except (AdbError, OSError):
+            # connection dropped without an exit packet
+            self.returncode = -1
+        finally:
+            self.sock.close()
+        return self.returncode
+
+
+class AdbDevice:
+    """Services on one device, each over its own server connection."""
+
+    def __init__(self, client, serial, tracker=None):
+        self.client = client
+        self.serial = serial
+        self.tracker = tracker
+
+    def open(self, service):
+        sock = self.client.connect(f"host:transport:{self.serial}")
+        try:
+            self.client.request(sock, service)
+        except Exception:
+            sock.close()
+            raise
+        return sock
+
+    def open_stream(self, command):
+        sock = self.open(f"shell,v2,raw:{command}")
+        # CONNECT_TIMEOUT was for the handshake
+        sock.settimeout(STREAM_TIMEOUT)
+        return ShellStream(sock)
+
+    def call(self, command, timeout=None):
+        """Run command, return (exit code, stdout text)."""
+        stream = self.open_stream(command)
+        stream.stdin.close()
+        returncode = stream.wait(timeout)
+        return returncode, stream.stdout.decode(errors="replace")
+
+    def shell(self, command, timeout=None):
+        return self.call(command, timeout)[1]
+
+    def exec_out(self, command):
+        """Raw stdout of command as a socket file; no exit code."""
+        return self.open(f"exec:{command}").makefile("rb")
+
+    def reboot(self, target=""):
+        with self.open(f"reboot:{target}") as sock:
+            sock.settimeout(self.client.timeout)
+            try:
+                while sock.recv(4096):
+                    pass
+            except OSError:
+                pass
+
+    def wait_for(self, state, timeout=None):
+        if self.tracker is not None:
+            return self.tracker.wait_for(self.serial, state, timeout)
+        try:
+            with self.client.connect() as sock:
+                sock.settimeout(timeout)
+                self.client.request(sock, f"host-serial:{self.serial}:wait-for-any-{state}")
+                # a second OKAY arrives once the device is in state
+                return _recv_exact(sock, 4) == b"OKAY"
+        except (OSError, AdbError):
+            return False
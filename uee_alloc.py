@@ -0,0 +1,489 @@
+"""
+UEE allocation-aware wipe layout.
+
+Reads the partition table (MBR with logical partitions, GPT) and the
+allocation data of every filesystem UEE formats (ext4 block bitmaps, the
+FAT32 FAT, the exFAT allocation bitmap, the NTFS $Bitmap), and splits
+the device into ranges to overwrite and ranges that are positively free.
+Only the free ranges are skipped: filesystem metadata, partition tables,
+gaps, unknown filesystems and anything that fails to parse are
+overwritten. The engine hands the free ranges to the target to release
+(see uee_target).
+
+Usage: python3 uee_alloc.py scan /dev/sdb
+"""
+import argparse
+import json
+import os
+import re
+import struct
+import sys
+
+SECTOR = 512
+_HAS_SET = re.compile(rb"[^\x00]")
+_HAS_CLEAR = re.compile(rb"[^\xff]")
+_ZERO_RUN = re.compile(rb"\x00{4,}")
+
+
+def read_at(fd, offset, length):
+    data = bytearray()
+    while len(data) < length:
+        chunk = os.pread(fd, length - len(data), offset + len(data))
+        if not chunk:
+            break
+        data += chunk
+    return bytes(data)
+
+
+def merge(extents):
+    """Sort and coalesce (start, length) extents."""
+    merged = []
+    for start, length in sorted(e for e in extents if e[1] > 0):
+        if merged and start <= merged[-1][0] + merged[-1][1]:
+            last_start, last_length = merged[-1]
+            merged[-1] = (last_start, max(last_length, start + length - last_start))
+        else:
+            merged.append((start, length))
+    return merged
+
+
+def subtract(extents, holes):
+    """extents minus holes; both merged."""
+    result = []
+    holes = merge(holes)
+    i = 0
+    for start, length in merge(extents):
+        end = start + length
+        while i < len(holes) and holes[i][0] + holes[i][1] <= start:
+            i += 1
+        j = i
+        while j < len(holes) and holes[j][0] < end:
+            hole_start, hole_end = holes[j][0], holes[j][0] + holes[j][1]
+            if hole_start > start:
+                result.append((start, hole_start - start))
+            start = max(start, hole_end)
+            j += 1
+        if start < end:
+            result.append((start, end - start))
+    return result
+
+
+def intersect(extents, other):
+    return subtract(extents, subtract(extents, other))
+
+
+def total(extents):
+    return sum(length for _, length in extents)
+
+
+def _next_bit(bitmap, pos, nbits, value):
+    """First bit >= pos that equals value, or nbits; whole bytes are skipped with a regex."""
+    skip = _HAS_CLEAR if value == 0 else _HAS_SET
+    while pos < nbits:
+        if pos & 7 == 0:
+            match = skip.search(bitmap, pos >> 3)
+            if match is None:
+                return nbits
+            pos = match.start() * 8
+            if pos >= nbits:
+                return nbits
+        if bitmap[pos >> 3] >> (pos & 7) & 1 == value:
+            return pos
+        pos += 1
+    return nbits
+
+
+def clear_runs(bitmap, nbits):
+    """Yield (first bit, count) of the runs of clear bits (LSB first) in bitmap."""
+    nbits = min(nbits, len(bitmap) * 8)
+    pos = 0
+    while True:
+        start = _next_bit(bitmap, pos, nbits, 0)
+        if start >= nbits:
+            return
+        pos = _next_bit(bitmap, start, nbits, 1)
+        yield start, pos - start
+
+
+# partition tables
+
+def _mbr_entries(sector):
+    for i in range(4):
+        entry = sector[446 + 16 * i:446 + 16 * (i + 1)]
+        kind = entry[4]
+        start, count = struct.unpack_from("<II", entry, 8)
+        if kind and count:
+            yield kind, start, count
+
+
+def _gpt_partitions(fd, size):
+    for sector_size in (512, 4096):
+        header = read_at(fd, sector_size, 92)
+        if header[:8] != b"EFI PART":
+            continue
+        entries_lba, count, entry_size = struct.unpack_from("<QII", header, 72)
+        table = read_at(fd, entries_lba * sector_size, count * entry_size)
+        partitions = []
+        for i in range(count):
+            entry = table[i * entry_size:(i + 1) * entry_size]
+            if len(entry) < 48 or entry[:16] == bytes(16):
+                continue
+            first, last = struct.unpack_from("<QQ", entry, 32)
+            start, length = first * sector_size, (last - first + 1) * sector_size
+            if start + length <= size:
+                partitions.append((start, length))
+        return partitions
+    return []
+
+
+def partitions(fd, size):
+    """(start, length) of every partition in bytes; [] without a partition table."""
+    sector = read_at(fd, 0, SECTOR)
+    if len(sector) < SECTOR or sector[510:512] != b"\x55\xaa":
+        return []
+    entries = list(_mbr_entries(sector))
+    if any(kind == 0xEE for kind, _, _ in entries):
+        return _gpt_partitions(fd, size)
+    # a FAT/NTFS boot sector also ends in 55aa; real tables have sane entries
+    if not entries or any((start + count) * SECTOR > size for _, start, count in entries):
+        return []
+    result = []
+    for kind, start, count in entries:
+        if kind not in (0x05, 0x0F, 0x85):
+            result.append((start * SECTOR, count * SECTOR))
+            continue
+        # extended partition: follow the EBR chain
+        ebr = start
+        for _ in range(128):
+            chain = list(_mbr_entries(read_at(fd, ebr * SECTOR, SECTOR)))
+            if not chain:
+                break
+            _, rel, n = chain[0]
+            result.append(((ebr + rel) * SECTOR, n * SECTOR))
+            if len(chain) < 2:
+                break
+            ebr = start + chain[1][1]
+    return [p for p in result if p[0] + p[1] <= size]
+
+
+# filesystems: each probe returns (name, fs bytes, free extents) relative to the partition
+
+def _has_super(group):
+    if group <= 1:
+        return True
+    for base in (3, 5, 7):
+        n = base
+        while n < group:
+            n *= base
+        if n == group:
+            return True
+    return False
+
+
+def probe_ext4(fd, start, length):
+    sb = read_at(fd, start + 1024, 1024)
+    if len(sb) < 1024 or struct.unpack_from("<H", sb, 56)[0] != 0xEF53:
+        return None
+    blocks_lo, = struct.unpack_from("<I", sb, 4)
+    first_data_block, log_block_size, _, blocks_per_group = struct.unpack_from("<IIII", sb, 20)
+    inodes_per_group, = struct.unpack_from("<I", sb, 40)
+    inode_size, = struct.unpack_from("<H", sb, 88)
+    _, incompat, ro_compat = struct.unpack_from("<III", sb, 92)
+    reserved_gdt, = struct.unpack_from("<H", sb, 206)
+    desc_size, = struct.unpack_from("<H", sb, 254)
+    blocks_hi, = struct.unpack_from("<I", sb, 0x150)
+    if incompat & 0x10:
+        # META_BG moves the descriptors around; leave the whole filesystem to the overwrite
+        return None
+    if ro_compat & 0x200:
+        # BIGALLOC bitmaps count clusters, not blocks; the same fallback
+        return None
+    block_size = 1024 << log_block_size
+    is_64bit = incompat & 0x80
+    desc_size = desc_size if is_64bit and desc_size else 32
+    blocks = blocks_lo | (blocks_hi << 32 if is_64bit else 0)
+    groups = (blocks - first_data_block + blocks_per_group - 1) // blocks_per_group
+    gdt_blocks = (groups * desc_size + block_size - 1) // block_size
+    gdt = read_at(fd, start + (first_data_block + 1) * block_size, groups * desc_size)
+    itable_blocks = (inodes_per_group * inode_size + block_size - 1) // block_size
+
+    def field(desc, lo, hi):
+        value, = struct.unpack_from("<I", desc, lo)
+        if desc_size >= 64:
+            value |= struct.unpack_from("<I", desc, hi)[0] << 32
+        return value
+
+    free = []
+    metadata = []
+    for g in range(groups):
+        desc = gdt[g * desc_size:(g + 1) * desc_size]
+        if len(desc) < 32:
+            return None
+        group_start = first_data_block + g * blocks_per_group
+        group_blocks = min(blocks_per_group, blocks - group_start)
+        block_bitmap = field(desc, 0x0, 0x20)
+        metadata += [(block_bitmap, 1), (field(desc, 0x4, 0x24), 1), (field(desc, 0x8, 0x28), itable_blocks)]
+        if not ro_compat & 0x1 or _has_super(g):
+            metadata.append((group_start, 1 + gdt_blocks + reserved_gdt))
+        flags, = struct.unpack_from("<H", desc, 0x12)
+        if flags & 0x2 and ro_compat & 0x410:
+            # BLOCK_UNINIT (trusted with group checksums): only the metadata above is in use
+            free.append((group_start, group_blocks))
+            continue
+        bitmap = read_at(fd, start + block_bitmap * block_size, block_size)
+        for first, count in clear_runs(bitmap, group_blocks):
+            free.append((group_start + first, count))
+    free = subtract(merge(free), merge(metadata))
+    return "ext4", blocks * block_size, [(b * block_size, n * block_size) for b, n in free]
+
+
+def probe_fat32(fd, start, length):
+    bs = read_at(fd, start, SECTOR)
+    if len(bs) < SECTOR or bs[510:512] != b"\x55\xaa" or bs[82:87] != b"FAT32":
+        return None
+    bytes_per_sector, sectors_per_cluster, reserved, fats = struct.unpack_from("<HBHB", bs, 11)
+    fat_size16, = struct.unpack_from("<H", bs, 22)
+    total_sectors, fat_size = struct.unpack_from("<II", bs, 32)
+    if fat_size16 or not fat_size or not bytes_per_sector or not sectors_per_cluster:
+        return None
+    cluster = bytes_per_sector * sectors_per_cluster
+    data_start = (reserved + fats * fat_size) * bytes_per_sector
+    clusters = (total_sectors * bytes_per_sector - data_start) // cluster
+    fat = read_at(fd, start + reserved * bytes_per_sector, min(fat_size * bytes_per_sector, (clusters + 2) * 4))
+    free = []
+    # entries that are entirely zero are free; runs of zero bytes are aligned to whole entries
+    for match in _ZERO_RUN.finditer(fat):
+        first = max(2, (match.start() + 3) // 4)
+        end = min(clusters + 2, match.end() // 4)
+        if end > first:
+            free.append((data_start + (first - 2) * cluster, (end - first) * cluster))
+    return "fat32", total_sectors * bytes_per_sector, free
+
+
+def probe_exfat(fd, start, length):
+    bs = read_at(fd, start, SECTOR)
+    if len(bs) < SECTOR or bs[3:11] != b"EXFAT   ":
+        return None
+    volume_length, = struct.unpack_from("<Q", bs, 72)
+    fat_offset, _, heap_offset, cluster_count, root_cluster = struct.unpack_from("<IIIII", bs, 80)
+    sector_shift, cluster_shift = bs[108], bs[109]
+    sector = 1 << sector_shift
+    cluster = sector << cluster_shift
+    heap = heap_offset * sector
+
+    def chain(first, nbytes):
+        """Cluster numbers of a file; contiguous when the FAT has no chain for it."""
+        clusters = []
+        c = first
+        needed = (nbytes + cluster - 1) // cluster if nbytes else None
+        while 2 <= c < cluster_count + 2 and len(clusters) < cluster_count:
+            clusters.append(c)
+            if needed is not None and len(clusters) >= needed:
+                break
+            nxt, = struct.unpack("<I", read_at(fd, start + fat_offset * sector + 4 * c, 4))
+            if nxt == 0 and needed is not None:
+                return list(range(first, first + needed))
+            if nxt >= 0xFFFFFFF7 or nxt == 0:
+                break
+            c = nxt
+        return clusters
+
+    bitmap_cluster = bitmap_length = None
+    for c in chain(root_cluster, 0):
+        directory = read_at(fd, start + heap + (c - 2) * cluster, cluster)
+        for i in range(0, len(directory), 32):
+            kind = directory[i]
+            if kind == 0x81:
+                bitmap_cluster, bitmap_length = struct.unpack_from("<IQ", directory, i + 20)
+                break
+            if kind == 0x00:
+                break
+        if bitmap_cluster is not None or kind == 0x00:
+            break
+    if bitmap_cluster is None:
+        return None
+    bitmap = bytearray()
+    for c in chain(bitmap_cluster, bitmap_length):
+        bitmap += read_at(fd, start + heap + (c - 2) * cluster, cluster)
+    free = [(heap + first * cluster, count * cluster)
+            for first, count in clear_runs(bytes(bitmap[:bitmap_length]), cluster_count)]
+    return "exfat", volume_length * sector, free
+
+
+def _apply_fixups(record, stride=512):
+    usa_offset, usa_count = struct.unpack_from("<HH", record, 4)
+    record = bytearray(record)
+    for i in range(1, usa_count):
+        end = i * stride
+        if end > len(record):
+            break
+        record[end - 2:end] = record[usa_offset + 2 * i:usa_offset + 2 * i + 2]
+    return bytes(record)
+
+
+def _data_runs(record, offset):
+    runs = []
+    lcn = 0
+    while offset < len(record) and record[offset]:
+        header = record[offset]
+        len_size, off_size = header & 0xF, header >> 4
+        count = int.from_bytes(record[offset + 1:offset + 1 + len_size], "little")
+        if off_size:
+            lcn += int.from_bytes(record[offset + 1 + len_size:offset + 1 + len_size + off_size], "little",
+                                  signed=True)
+            runs.append((lcn, count))
+        offset += 1 + len_size + off_size
+    return runs
+
+
+def probe_ntfs(fd, start, length):
+    bs = read_at(fd, start, SECTOR)
+    if len(bs) < SECTOR or bs[3:11] != b"NTFS    ":
+        return None
+    bytes_per_sector, spc = struct.unpack_from("<HB", bs, 11)
+    sectors_per_cluster = 1 << (256 - spc) if spc > 0x80 else spc
+    total_sectors, mft_lcn = struct.unpack_from("<QQ", bs, 40)
+    record_size = struct.unpack_from("<b", bs, 64)[0]
+    cluster = bytes_per_sector * sectors_per_cluster
+    record_size = 1 << -record_size if record_size < 0 else record_size * cluster
+    # $Bitmap is MFT record 6, always inside the first (contiguous) MFT extent
+    record = read_at(fd, start + mft_lcn * cluster + 6 * record_size, record_size)
+    if record[:4] != b"FILE":
+        return None
+    record = _apply_fixups(record)
+    offset, = struct.unpack_from("<H", record, 20)
+    bitmap = None
+    while offset + 16 <= len(record):
+        kind, attr_length = struct.unpack_from("<II", record, offset)
+        if kind == 0xFFFFFFFF or attr_length == 0:
+            break
+        if kind == 0x80 and record[offset + 9] == 0:
+            if record[offset + 8]:
+                runs_offset, = struct.unpack_from("<H", record, offset + 32)
+                data_size, = struct.unpack_from("<Q", record, offset + 48)
+                bitmap = bytearray()
+                for lcn, count in _data_runs(record, offset + runs_offset):
+                    bitmap += read_at(fd, start + lcn * cluster, count * cluster)
+                bitmap = bytes(bitmap[:data_size])
+            else:
+                value_length, value_offset = struct.unpack_from("<IH", record, offset + 16)
+                bitmap = record[offset + value_offset:offset + value_offset + value_length]
+            break
+        offset += attr_length
+    if bitmap is None:
+        return None
+    clusters = total_sectors * bytes_per_sector // cluster
+    free = [(first * cluster, count * cluster) for first, count in clear_runs(bitmap, clusters)]
+    return "ntfs", total_sectors * bytes_per_sector, free
+
+
+PROBES = [probe_ext4, probe_fat32, probe_exfat, probe_ntfs]
+
+
+def probe(fd, start, length):
+    for check in PROBES:
+        try:
+            found = check(fd, start, length)
+        except (struct.error, ValueError, IndexError, OverflowError):
+            found = None
+        if found is not None:
+            name, fs_bytes, free = found
+            # never skip anything past the end of the partition or the filesystem
+            limit = min(fs_bytes, length)
+            free = [(start + s, min(n, limit - s)) for s, n in free if s < limit]
+            return name, merge(free)
+    return None, []
+
+
+def scan(fd, size):
+    """
+    Layout of the device: {"size_bytes", "regions": [...], "overwrite": [...], "free": [...]}.
+    Extents are (offset, length) in bytes; overwrite + free cover the whole device.
+    """
+    regions = []
+    free = []
+    parts = partitions(fd, size) or [(0, size)]
+    for start, length in parts:
+        name, part_free = probe(fd, start, length)
+        free += part_free
+        regions.append({"start": start, "length": length, "filesystem": name,
+                        "free_bytes": total(part_free)})
+    free = merge(free)
+    return {
+        "size_bytes": size,
+        "regions": regions,
+        "overwrite": subtract([(0, size)], free),
+        "free": free,
+    }
+
+
+def full_layout(size):
+    """The layout of a full-surface wipe: everything is overwritten."""
+    return {
+        "size_bytes": size,
+        "regions": [{"start": 0, "length": size, "filesystem": None, "free_bytes": 0}],
+        "overwrite": [(0, size)],
+        "free": [],
+    }
+
+
+def restrict(layout, data):
+    """Limit layout to the allocated extents of a sparse image; its holes hold nothing to wipe."""
+    layout = dict(layout, overwrite=intersect(layout["overwrite"], data), free=intersect(layout["free"], data))
+    layout["sparse_bytes"] = layout["size_bytes"] - total(data)
+    return layout
+
+
+def coverage(layout, scope, passes, released):
+    """The coverage section of a certificate."""
+    overwritten = total(layout["overwrite"])
+    return {
+        "scope": scope,
+        "size_bytes": layout["size_bytes"],
+        "overwritten_bytes": overwritten,
+        "free_bytes": total(layout["free"]),
+        "sparse_bytes": layout.get("sparse_bytes", 0),
+        "overwritten_percent": round(100.0 * overwritten / layout["size_bytes"], 2) if layout["size_bytes"] else 0,
+        "passes": passes,
+        "released": released,
+        "regions": layout["regions"],
+        "overwritten_extents": [list(e) for e in layout["overwrite"]],
+    }
+
+
+def describe(layout):
+    lines = []
+    for region in layout["regions"]:
+        lines.append(f"  {region['start']:>15}  {region['length'] // (1024 * 1024):>9} MiB  "
+                     f"{region['filesystem'] or 'unknown':<8} free {region['free_bytes'] // (1024 * 1024)} MiB")
+    overwrite = total(layout["overwrite"])
+    lines.append(f"Overwrite {overwrite // (1024 * 1024)} MiB of {layout['size_bytes'] // (1024 * 1024)} MiB "
+                 f"in {len(layout['overwrite'])} extents, release {total(layout['free']) // (1024 * 1024)} MiB.")
+    if layout.get("sparse_bytes"):
+        lines.append(f"Skipping {layout['sparse_bytes'] // (1024 * 1024)} MiB of holes in the image.")
+    return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="uee_alloc.py", description="UEE allocation scan")
+    sub = parser.add_subparsers(dest="command", required=True)
+    scan_parser = sub.add_parser("scan", help="show what an allocation-aware wipe would overwrite")
+    scan_parser.add_argument("disk")
+    scan_parser.add_argument("--json", action="store_true", help="print the full layout as JSON")
+    args = parser.parse_args(argv)
+
+    fd = os.open(args.disk, os.O_RDONLY)
+    try:
+        layout = scan(fd, os.lseek(fd, 0, os.SEEK_END))
+    finally:
+        os.close(fd)
+    if args.json:
+        print(json.dumps(layout, indent=2))
+    else:
+        for line in describe(layout):
+            print(line)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,446 @@
+"""
+UEE Android wipe orchestrator.
+
+Runs the per-device part of ANDROID_WIPE_SCRIPT: an optional overwrite
+stage that streams the fill pattern from the host into the device through
+'adb shell', followed by the factory reset. Devices are processed in
+parallel and all streams share one USB bandwidth budget.
+
+Overwrite modes:
+  none        factory reset only
+  free-space  fill the free space of /data (via /sdcard) with a file, then delete it
+  userdata    reboot to recovery and overwrite the userdata partition itself
+
+Devices sitting in the bootloader are wiped with 'fastboot -w' (falling
+back to 'fastboot erase userdata') when it is unlocked; the overwrite
+stage does not apply to them.
+
+Devices are driven through the adb server protocol (uee_adb) when the
+server is running, otherwise through the adb binary from --adb/UEE_ADB,
+so a fake adb that writes to local files can stand in for real devices.
+
+With --report, the per-device results (model, timings per phase,
+overwrite bytes, outcome) are written as JSON for the front-ends'
+ledger (uee_ledger.android_jobs).
+
+Usage: python3 uee_android.py wipe [--overwrite free-space] [--usb-budget 40M] [--report FILE] SERIAL...
+"""
+import argparse
+import contextlib
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import uee_adb
+import uee_engine
+import uee_qos
+import uee_trace
+
+ADB = os.environ.get("UEE_ADB", "adb")
+FASTBOOT = os.environ.get("UEE_FASTBOOT", "fastboot")
+OVERWRITE_MODES = ['none', 'free-space', 'userdata']
+FILL_DIR = "/sdcard"
+FILL_FILE = FILL_DIR + "/uee_fill.bin"
+USERDATA = "/dev/block/by-name/userdata"
+STREAM_BLOCK = 1024 * 1024
+RECOVERY_TIMEOUT = 120
+TRANSPORTS = ['auto', 'native', 'cli']
+DEFAULT_WORKERS = 8
+DEFAULT_FASTBOOT_WORKERS = 4
+FASTBOOT_TIMEOUT = 600
+STREAM_EXIT_TIMEOUT = 120
+NO_SPACE = "No space left on device"
+
+
+class Adb:
+    """adb command line for one device."""
+
+    def __init__(self, serial, adb=ADB):
+        self.serial = serial
+        self.adb = adb
+
+    def run(self, *args, timeout=None):
+        return subprocess.run([self.adb, "-s", self.serial] + list(args), capture_output=True, text=True,
+                              timeout=timeout)
+
+    def call(self, command, timeout=None):
+        result = self.run("shell", command, timeout=timeout)
+        return result.returncode, result.stdout
+
+    def shell(self, command, timeout=None):
+        return self.call(command, timeout)[1]
+
+    def open_stream(self, command):
+        """Start a shell command whose stdin is fed by the caller."""
+        return CliStream(subprocess.Popen([self.adb, "-s", self.serial, "shell", command], stdin=subprocess.PIPE,
+                                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE))
+
+    def reboot(self, target=""):
+        self.run("reboot", target, timeout=30)
+
+    def wait_for(self, state, timeout=None):
+        try:
+            return self.run(f"wait-for-{state}", timeout=timeout).returncode == 0
+        except subprocess.TimeoutExpired:
+            return False
+
+
+class CliStream:
+    """An 'adb shell' process behind uee_adb.ShellStream's interface: wait() collects stderr."""
+
+    def __init__(self, proc):
+        self.proc = proc
+        self.stdin = proc.stdin
+        self.stderr = bytearray()
+        self.returncode = None
+
+    def wait(self, timeout=None):
+        try:
+            self.stdin.close()
+        except OSError:
+            pass
+        # stdin is done with, communicate() only has stderr to collect
+        self.proc.stdin = None
+        try:
+            _, stderr = self.proc.communicate(timeout=timeout)
+            self.stderr += stderr
+            self.returncode = self.proc.returncode
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+            self.proc.wait()
+            self.returncode = -1
+        return self.returncode
+
+
+class CliTransport:
+    """One adb process per action."""
+    name = "cli"
+
+    def __init__(self, adb=ADB):
+        self.adb = adb
+
+    def device(self, serial):
+        return Adb(serial, self.adb)
+
+    def devices(self):
+        result = subprocess.run([self.adb, "devices"], capture_output=True, text=True, check=True)
+        devices = []
+        for line in result.stdout.splitlines()[1:]:
+            fields = line.split()
+            if len(fields) >= 2 and fields[1] == "device":
+                devices.append(fields[0])
+        return devices
+
+
+class NativeTransport:
+    """adb server protocol over tcp:5037, one tracker shared by all devices."""
+    name = "native"
+
+    def __init__(self, client=None):
+        self.client = client or uee_adb.AdbClient()
+        self.tracker = uee_adb.DeviceTracker(self.client)
+
+    def device(self, serial):
+        return self.client.device(serial, self.tracker)
+
+    def devices(self):
+        return [serial for serial, state in self.client.devices().items() if state == "device"]
+
+
+class Fastboot:
+    """fastboot command line for one device in the bootloader."""
+
+    def __init__(self, serial, fastboot=FASTBOOT):
+        self.serial = serial
+        self.fastboot = fastboot
+
+    def run(self, *args, timeout=None):
+        return subprocess.run([self.fastboot, "-s", self.serial] + list(args), capture_output=True, text=True,
+                              timeout=timeout)
+
+    def getvar(self, name):
+        # fastboot prints "name: value" on stderr
+        result = self.run("getvar", name, timeout=30)
+        for line in (result.stderr + result.stdout).splitlines():
+            if line.startswith(name + ":"):
+                return line.split(":", 1)[1].strip()
+        return None
+
+
+def fastboot_devices(fastboot=FASTBOOT):
+    try:
+        result = subprocess.run([fastboot, "devices"], capture_output=True, text=True, timeout=30)
+    except (OSError, subprocess.SubprocessError):
+        return []
+    devices = []
+    for line in result.stdout.splitlines():
+        fields = line.split()
+        if len(fields) >= 2 and fields[1] == "fastboot":
+            devices.append(fields[0])
+    return devices
+
+
+def open_transport(transport='auto', adb=ADB):
+    """The native client when the adb server answers (or is forced), else the adb binary."""
+    if transport == 'native' or (transport == 'auto' and uee_adb.AdbClient().available()):
+        return NativeTransport()
+    return CliTransport(adb)
+
+
+class UsbBudget:
+    """One token bucket shared by every stream; 0 means unlimited."""
+
+    def __init__(self, rate=0):
+        self.bucket = uee_qos.TokenBucket(rate)
+        self.lock = threading.Lock()
+
+    def consume(self, n):
+        if not self.bucket.rate:
+            return
+        with self.lock:
+            self.bucket.consume(n)
+
+
+def free_bytes(device, path=FILL_DIR):
+    # toybox df: Filesystem 1K-blocks Used Available Use% Mounted on
+    lines = device.shell(f"df -k {path}", timeout=30).strip().splitlines()
+    return int(lines[-1].split()[3]) * 1024
+
+
+def partition_bytes(device, path=USERDATA):
+    return int(device.shell(f"blockdev --getsize64 {path}", timeout=30).strip())
+
+
+def stream_fill(device, command, total, pattern, budget, label):
+    """
+    Stream pattern into command's stdin until total bytes or the device
+    is full. Returns (bytes written, whether the device ran out of
+    space); any other early stop or a failed command raises OSError.
+    """
+    view = None if pattern == 'random' else uee_engine.pattern_view(pattern, STREAM_BLOCK)
+    progress = uee_engine.Progress(label, total)
+    proc = device.open_stream(command)
+    written = 0
+    error = None
+    try:
+        while written < total:
+            n = min(STREAM_BLOCK, total - written)
+            chunk = memoryview(os.urandom(n)) if view is None else view[:n]
+            budget.consume(n)
+            proc.stdin.write(chunk)
+            written += n
+            progress.update(written)
+        proc.stdin.close()
+    except OSError as e:
+        # the shell side stops reading once the device is full, or the link failed
+        error = e
+    returncode = proc.wait(STREAM_EXIT_TIMEOUT)
+    progress.update(written, force=True)
+    stderr = bytes(proc.stderr).decode(errors="replace").strip()
+    if NO_SPACE in stderr:
+        return written, True
+    if error is not None:
+        raise OSError(f"stream to '{command}' failed after {written} bytes: {stderr or error}")
+    if returncode != 0:
+        raise OSError(f"'{command}' exited with {returncode} after {written} bytes: {stderr or 'no error output'}")
+    return written, False
+
+
+def overwrite(device, mode, pattern, budget):
+    started = time.monotonic()
+    if mode == 'free-space':
+        total = free_bytes(device)
+        try:
+            # the fill ends where the free space does, a little before total is fine
+            written, _ = stream_fill(device, f"cat > {FILL_FILE}", total, pattern, budget, device.serial)
+        finally:
+            device.shell(f"sync; rm -f {FILL_FILE}", timeout=120)
+    else:
+        total = partition_bytes(device)
+        written, _ = stream_fill(device, f"cat > {USERDATA}", total, pattern, budget, device.serial)
+        device.shell("sync", timeout=120)
+        if written < total:
+            raise OSError(f"userdata overwrite stopped at {written} of {total} bytes")
+    seconds = time.monotonic() - started
+    return {"mode": mode, "pattern": pattern, "target_bytes": total, "bytes": written,
+            "seconds": round(seconds, 3), "mb_per_s": round(written / seconds / 1e6, 2) if seconds else None}
+
+
+def reboot_recovery(device):
+    uee_trace.emit("B", "reboot-recovery", tid=device.serial)
+    device.reboot("recovery")
+    reached = device.wait_for("recovery", RECOVERY_TIMEOUT)
+    uee_trace.emit("E", "reboot-recovery", tid=device.serial)
+    if not reached:
+        # nothing may be written or reset on a phone that is not where we think it is
+        raise OSError(f"{device.serial} did not reach recovery within {RECOVERY_TIMEOUT} s")
+
+
+def factory_reset(device):
+    returncode, _ = device.call("recovery --wipe_data", timeout=300)
+    return returncode == 0
+
+
+def new_result(serial, path):
+    return {"serial": serial, "path": path, "model": None, "overwrite": None, "reset": False, "error": None,
+            "started": time.time(), "finished": None, "phases": {}}
+
+
+@contextlib.contextmanager
+def timed(result, name):
+    """Seconds spent in the block, into result["phases"][name]."""
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        result["phases"][name] = round(time.monotonic() - started, 3)
+
+
+def wipe_device(device, mode, pattern, budget):
+    serial = device.serial
+    result = new_result(serial, "adb")
+    try:
+        result["model"] = device.shell("getprop ro.product.model", timeout=30).strip() or None
+        if mode != 'none':
+            print(f"Starting {mode} overwrite on: {serial}", flush=True)
+            if mode == 'userdata':
+                with timed(result, "reboot-recovery"):
+                    reboot_recovery(device)
+            uee_trace.emit("B", "overwrite", tid=serial)
+            with timed(result, "overwrite"):
+                result["overwrite"] = overwrite(device, mode, pattern, budget)
+            uee_trace.emit("E", "overwrite", tid=serial, args={"bytes": result["overwrite"]["bytes"]})
+
+        print(f"Starting wipe on: {serial}", flush=True)
+        if mode != 'userdata':
+            with timed(result, "reboot-recovery"):
+                reboot_recovery(device)
+        uee_trace.emit("B", "wipe-data", tid=serial)
+        with timed(result, "wipe-data"):
+            result["reset"] = factory_reset(device)
+        uee_trace.emit("E", "wipe-data", tid=serial)
+        if not result["reset"]:
+            print(f"Wipe command failed on: {serial}. It may require manual confirmation on-device.", flush=True)
+        else:
+            print(f"Wipe complete for: {serial}", flush=True)
+    except (OSError, ValueError, IndexError, subprocess.SubprocessError, uee_adb.AdbError) as e:
+        result["error"] = str(e)
+        print(f"Wipe failed on {serial}: {e}", flush=True)
+    result["finished"] = time.time()
+    return result
+
+
+def fastboot_wipe(device):
+    serial = device.serial
+    result = new_result(serial, "fastboot")
+    try:
+        print(f"Starting fastboot wipe on: {serial}", flush=True)
+        result["model"] = device.getvar("product")
+        if device.getvar("unlocked") != "yes":
+            result["error"] = "bootloader locked"
+            print(f"Bootloader of {serial} is locked, it cannot be wiped from fastboot.", flush=True)
+            result["finished"] = time.time()
+            return result
+        uee_trace.emit("B", "fastboot-wipe", tid=serial)
+        with timed(result, "fastboot-wipe"):
+            result["reset"] = device.run("-w", timeout=FASTBOOT_TIMEOUT).returncode == 0
+            if not result["reset"]:
+                result["reset"] = device.run("erase", "userdata", timeout=FASTBOOT_TIMEOUT).returncode == 0
+        uee_trace.emit("E", "fastboot-wipe", tid=serial)
+        if result["reset"]:
+            device.run("reboot", timeout=60)
+            print(f"Wipe complete for: {serial}", flush=True)
+        else:
+            print(f"Fastboot erase failed on: {serial}.", flush=True)
+    except (OSError, subprocess.SubprocessError) as e:
+        result["error"] = str(e)
+        print(f"Wipe failed on {serial}: {e}", flush=True)
+    result["finished"] = time.time()
+    return result
+
+
+def print_report(results):
+    print("---")
+    print(f"{'DEVICE':<24} {'PATH':<9} {'OVERWRITE':>12} {'MB/s':>8}   RESET")
+    for r in results:
+        ow = r["overwrite"]
+        written = f"{ow['bytes'] // (1024 * 1024)} MiB" if ow else "-"
+        rate = ow["mb_per_s"] if ow else "-"
+        reset = "error: " + r["error"] if r["error"] else ("ok" if r["reset"] else "failed")
+        print(f"{r['serial']:<24} {r['path']:<9} {written:>12} {rate or '-':>8}   {reset}")
+
+
+def write_report(path, mode, pattern, results):
+    report = {"tool": "uee_android", "mode": mode, "pattern": pattern, "devices": results}
+    try:
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
+    except OSError as e:
+        print(f"Failed to write the report to {path}: {e}", file=sys.stderr)
+
+
+def wipe_all(transport, serials, fastboot_serials=(), mode='none', pattern='zeros', usb_budget=0,
+             workers=DEFAULT_WORKERS, fastboot_workers=DEFAULT_FASTBOOT_WORKERS, fastboot=FASTBOOT):
+    """Wipe adb and fastboot devices concurrently, each path in its own bounded pool."""
+    budget = UsbBudget(usb_budget)
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool, \
+            ThreadPoolExecutor(max_workers=max(1, fastboot_workers)) as fastboot_pool:
+        futures = [pool.submit(wipe_device, transport.device(s), mode, pattern, budget) for s in serials]
+        futures += [fastboot_pool.submit(fastboot_wipe, Fastboot(s, fastboot)) for s in fastboot_serials]
+        results = [future.result() for future in futures]
+    print_report(results)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="uee_android.py", description="UEE Android wipe orchestrator")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    wipe_parser = sub.add_parser("wipe", help="overwrite and factory reset Android devices")
+    wipe_parser.add_argument("serials", nargs="*",
+                             help="devices to wipe (default: all in 'adb devices' and 'fastboot devices')")
+    wipe_parser.add_argument("--overwrite", choices=OVERWRITE_MODES, default='none')
+    wipe_parser.add_argument("--pattern", choices=uee_engine.PATTERNS, default='zeros')
+    wipe_parser.add_argument("--usb-budget", type=uee_qos.parse_rate, default=0,
+                             help="bandwidth shared by all overwrite streams, e.g. 80M (bytes/s)")
+    wipe_parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    wipe_parser.add_argument("--fastboot-workers", type=int, default=DEFAULT_FASTBOOT_WORKERS)
+    wipe_parser.add_argument("--adb", default=ADB, help="adb binary for the cli transport")
+    wipe_parser.add_argument("--fastboot", default=FASTBOOT, help="fastboot binary")
+    wipe_parser.add_argument("--report", help="write the per-device results to this JSON file")
+    wipe_parser.add_argument("--transport", choices=TRANSPORTS, default='auto',
+                             help="native adb server protocol or one adb process per action (default: native "
+                                  "when the server is running)")
+
+    args = parser.parse_args(argv)
+
+    transport = open_transport(args.transport, args.adb)
+    serials = transport.devices()
+    fastboot_serials = fastboot_devices(args.fastboot)
+    if args.serials:
+        for serial in args.serials:
+            if serial not in serials and serial not in fastboot_serials:
+                print(f"Device {serial} is in neither adb nor fastboot mode, skipping.")
+        serials = [s for s in serials if s in args.serials]
+        fastboot_serials = [s for s in fastboot_serials if s in args.serials]
+    if not serials and not fastboot_serials:
+        print("No devices detected.")
+        return 1
+    results = wipe_all(transport, serials, fastboot_serials, args.overwrite, args.pattern, args.usb_budget,
+                       args.workers, args.fastboot_workers, args.fastboot)
+    if args.report:
+        write_report(args.report, args.overwrite, args.pattern, results)
+    if args.serials and len(results) < len(set(args.serials)):
+        return 1
+    if all(r["reset"] and not r["error"] for r in results):
+        print("All connected devices have been wiped successfully.")
+        return 0
+    return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
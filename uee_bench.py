@@ -0,0 +1,261 @@
+"""
+UEE benchmarks.
+
+Micro-benchmarks for engine design choices, run on the station itself
+because the answers depend on its kernel, memory and CPUs.
+
+patterns: N forked workers each write a constant pattern from either a
+private buffer or the shared pattern pool (uee_pool). Reports the memory
+the pattern buffers cost across all workers (sum of Pss), the page size
+backing the shared mapping (TLB reach) and the write throughput from
+each, to a tmpfs file so the copy out of the buffer is what is measured.
+
+affinity: the engine's verify work (read, hash, regenerate a seeded
+random block and compare) over the start of a device, read-only, once
+unpinned and once pinned to each NUMA node, labelled local or remote
+relative to the device's controller (uee_numa).
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+
+import uee_engine
+import uee_numa
+import uee_pool
+import uee_prng
+import uee_qos
+import uee_target
+
+BENCH_DIR = "/dev/shm"
+WINDOW = 64 * 1024 * 1024
+
+
+def pss_kb(pid):
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                if line.startswith("Pss:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def _pattern_worker(mode, pattern, size, nbytes, start, ready, go, results):
+    os.read(start, 1)
+    if mode == 'shared':
+        shared = uee_pool.shared_buffer(pattern, size, lambda: uee_engine.pattern_buffer(pattern, size))
+        view = shared.view if shared is not None else None
+    else:
+        shared = None
+        view = memoryview(uee_engine.pattern_buffer(pattern, size))
+    if view is None:
+        os.write(ready, b"x")
+        os.write(results, (json.dumps({"error": "no usable pool directory"}) + "\n").encode())
+        return
+    # touch every page so Pss reflects the whole buffer
+    bytes(view[::4096])
+    os.write(ready, b"r")
+    os.read(go, 1)
+    page = uee_pool.page_size(shared) if shared is not None else None
+
+    path = os.path.join(BENCH_DIR, f"uee-bench-{os.getpid()}")
+    fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o600)
+    try:
+        window = max(WINDOW // size, 1) * size
+        started = time.monotonic()
+        done = 0
+        while done < nbytes:
+            done += os.pwrite(fd, view, done % window)
+        seconds = time.monotonic() - started
+    finally:
+        os.close(fd)
+        os.unlink(path)
+    os.write(results, (json.dumps({"bytes": done, "seconds": seconds, "page_size": page,
+                                         "hugetlb": shared is not None and shared.hugetlb}) + "\n").encode())
+
+
+def run_patterns(mode, workers, pattern, size, nbytes):
+    start_r, start_w = os.pipe()
+    ready_r, ready_w = os.pipe()
+    go_r, go_w = os.pipe()
+    results_r, results_w = os.pipe()
+    pids = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                _pattern_worker(mode, pattern, size, nbytes, start_r, ready_w, go_r, results_w)
+            except BaseException:
+                code = 1
+            finally:
+                os._exit(code)
+        pids.append(pid)
+
+    baseline = sum(pss_kb(pid) for pid in pids)
+    # one at a time, so the first shared worker creates the pool file and the others map it
+    for _ in pids:
+        os.write(start_w, b"s")
+        os.read(ready_r, 1)
+    loaded = sum(pss_kb(pid) for pid in pids)
+    os.write(go_w, b"g" * workers)
+
+    for fd in (start_r, start_w, ready_r, ready_w, go_r, go_w, results_w):
+        os.close(fd)
+    with os.fdopen(results_r) as f:
+        reports = [json.loads(line) for line in f]
+    for pid in pids:
+        os.waitpid(pid, 0)
+
+    errors = [r["error"] for r in reports if "error" in r]
+    if errors or len(reports) < workers:
+        return {"mode": mode, "error": errors[0] if errors else "worker failed"}
+    memory = max(loaded - baseline, 0) * 1024
+    if reports[0]["hugetlb"]:
+        # hugetlbfs pages are not in Pss; the one pool file is all of it
+        memory += size
+    total = sum(r["bytes"] for r in reports)
+    seconds = max(r["seconds"] for r in reports)
+    return {"mode": mode, "workers": workers, "buffer_bytes": size,
+            "pattern_memory_bytes": memory,
+            "page_size": reports[0]["page_size"] or "anonymous",
+            "bytes": total, "seconds": round(seconds, 3), "mb_per_s": round(total / seconds / 1e6, 1)}
+
+
+def _forked(func, *args):
+    """Run func(*args) in a child process, so affinity and first-touch memory start fresh; returns its dict."""
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            os.close(read_fd)
+            os.write(write_fd, json.dumps(func(*args)).encode())
+        except BaseException as e:
+            os.write(write_fd, json.dumps({"error": str(e)}).encode())
+            code = 1
+        finally:
+            os._exit(code)
+    os.close(write_fd)
+    with os.fdopen(read_fd) as f:
+        data = f.read()
+    os.waitpid(pid, 0)
+    return json.loads(data) if data else {"error": "worker failed"}
+
+
+def _verify_work(disk, cpus, nbytes):
+    if cpus is not None:
+        os.sched_setaffinity(0, cpus)
+    # allocated after pinning, so the pages come from the pinned node
+    view = memoryview(uee_target.aligned_buffer(uee_engine.BLOCK_SIZE))
+    source = uee_prng.stream(uee_prng.GENERATORS[0], uee_prng.new_seed(), 1)
+    target = uee_target.open_target(disk, readonly=True)
+    try:
+        target.set_io_mode('direct')
+        size = min(nbytes, target.size)
+        os.posix_fadvise(target.fd, 0, size, os.POSIX_FADV_DONTNEED)
+        hasher = hashlib.new(uee_engine.HASH_ALGORITHM)
+        started, cpu_started = time.monotonic(), time.process_time()
+        done = 0
+        for expected in uee_prng.blocks(source, [(0, size)], uee_engine.BLOCK_SIZE, allocate=bytearray):
+            n = uee_engine.read_all(target, view[:len(expected)], done)
+            target.read(done, n)
+            hasher.update(view[:n])
+            uee_engine.differs(expected, view[:n])
+            done += n
+            if n < len(expected):
+                break
+        seconds, cpu = time.monotonic() - started, time.process_time() - cpu_started
+    finally:
+        target.close()
+    return {"bytes": done, "seconds": round(seconds, 3), "cpu_seconds": round(cpu, 3),
+            "mb_per_s": round(done / seconds / 1e6, 1) if seconds else None}
+
+
+def run_affinity(disk, nbytes, sysfs_root=uee_numa.SYSFS_ROOT):
+    home = uee_numa.device_node(disk, sysfs_root)
+    runs = [("unpinned", None)]
+    for node in uee_numa.nodes(sysfs_root):
+        cpus = uee_numa.node_cpus(node, sysfs_root)
+        if cpus:
+            where = "" if home is None else " (local)" if node == home else " (remote)"
+            runs.append((f"node {node}{where}", cpus))
+    results = []
+    for label, cpus in runs:
+        result = _forked(_verify_work, disk, cpus, nbytes)
+        result.update(run=label, cpus=uee_numa.format_cpulist(cpus) if cpus else "all")
+        results.append(result)
+    return {"device": disk, "device_node": home, "runs": results}
+
+
+def print_affinity(report):
+    node = report["device_node"]
+    print(f"{report['device']}: controller on NUMA node {node if node is not None else 'unknown'}")
+    print(f"{'RUN':<20}{'CPUS':<12}{'MB/s':>10}{'CPU s':>10}")
+    for r in report["runs"]:
+        if "error" in r:
+            print(f"{r['run']:<20}{r['cpus']:<12}  {r['error']}")
+            continue
+        print(f"{r['run']:<20}{r['cpus']:<12}{r['mb_per_s']:>10}{r['cpu_seconds']:>10}")
+
+
+def print_patterns(results):
+    print(f"{'MODE':<9}{'WORKERS':>8}{'BUFFER':>10}{'MEMORY':>12}  {'PAGES':<16}{'MB/s':>10}")
+    for r in results:
+        if "error" in r:
+            print(f"{r['mode']:<9}  {r['error']}")
+            continue
+        print(f"{r['mode']:<9}{r['workers']:>8}{r['buffer_bytes'] // 1024:>7} KiB"
+              f"{r['pattern_memory_bytes'] / 2 ** 20:>8.1f} MiB  {r['page_size']:<16}{r['mb_per_s']:>10}")
+    private, shared = results
+    if "error" not in private and "error" not in shared:
+        saved = private["pattern_memory_bytes"] - shared["pattern_memory_bytes"]
+        print(f"Shared pool saves {saved / 2 ** 20:.1f} MiB of pattern memory, "
+              f"throughput {shared['mb_per_s'] / private['mb_per_s'] - 1:+.1%}.")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="uee_bench.py", description="UEE benchmarks")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    patterns_parser = sub.add_parser("patterns", help="private pattern buffers vs the shared pattern pool")
+    patterns_parser.add_argument("--workers", type=int, default=max(os.cpu_count() or 1, 2))
+    patterns_parser.add_argument("--pattern", choices=['zeros', 'ones'], default='ones',
+                                 help="zeros are mostly the kernel zero page even in private buffers")
+    patterns_parser.add_argument("--buffer", type=uee_qos.parse_rate, default=uee_engine.BLOCK_SIZE,
+                                 help="buffer size, e.g. 4Mi (default: the engine block size)")
+    patterns_parser.add_argument("--bytes", type=uee_qos.parse_rate, default=2 * 1024 ** 3,
+                                 help="bytes each worker writes (default 2Gi)")
+    patterns_parser.add_argument("--json", action="store_true")
+
+    affinity_parser = sub.add_parser("affinity", help="verify work pinned to each NUMA node vs unpinned (read-only)")
+    affinity_parser.add_argument("disk")
+    affinity_parser.add_argument("--bytes", type=uee_qos.parse_rate, default=2 * 1024 ** 3,
+                                 help="bytes read from the start of the device per run (default 2Gi)")
+    affinity_parser.add_argument("--json", action="store_true")
+    affinity_parser.add_argument("--sysfs-root", default=uee_numa.SYSFS_ROOT, help=argparse.SUPPRESS)
+
+    args = parser.parse_args(argv)
+
+    if args.command == "patterns":
+        results = [run_patterns(mode, args.workers, args.pattern, args.buffer, args.bytes)
+                   for mode in ('private', 'shared')]
+        if args.json:
+            print(json.dumps(results, indent=2))
+        else:
+            print_patterns(results)
+    elif args.command == "affinity":
+        report = run_affinity(args.disk, args.bytes, args.sysfs_root)
+        if args.json:
+            print(json.dumps(report, indent=2))
+        else:
+            print_affinity(report)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,165 @@
+"""
+UEE cryptographic erase.
+
+Data on a dm-crypt/LUKS volume or a self-encrypting drive is only as
+readable as its key material. Destroying that is enough to sanitize it,
+in seconds instead of an overwrite of the whole surface:
+
+  LUKS1   the header and the anti-forensic key material of all eight
+          keyslots, up to the payload offset
+  LUKS2   both binary/JSON header copies and every keyslot area, up to
+          the first data segment (or exactly those areas for detached
+          data offsets)
+  OPAL    a PSID revert of the drive (sedutil-cli, from UEE_SEDUTIL),
+          which makes the drive generate a new media key
+
+LUKS headers are looked for at the start of the disk and of every
+partition (uee_alloc's MBR/GPT reader). Key material is overwritten with
+random data and the headers are read back to prove the magic is gone.
+
+The optional signature scrub zeroes the first and last SCRUB_BYTES of
+the disk and of each partition, and every other place uee_signatures
+knows a signature can live: partition tables and their GPT backup,
+filesystem superblocks, their backups and boot sectors, md and LVM
+labels, so nothing on the disk is recognized afterwards.
+"""
+import json
+import os
+import struct
+import subprocess
+
+import uee_alloc
+import uee_signatures
+import uee_target
+
+LUKS_MAGIC = b"LUKS\xba\xbe"
+LUKS2_SECONDARY_MAGIC = b"SKUL\xba\xbe"
+LUKS1_HEADER_SIZE = 592
+LUKS1_KEYSLOTS = 8
+LUKS2_BINARY_HEADER = 4096
+SECTOR = 512
+SCRUB_BYTES = 2 * 1024 * 1024
+SEDUTIL = os.environ.get("UEE_SEDUTIL", "sedutil-cli")
+METHODS = ['luks', 'opal']
+
+
+def _luks1(header, offset):
+    payload_offset, key_bytes = struct.unpack_from(">II", header, 104)
+    uuid = header[168:208].split(b"\0")[0].decode(errors="replace")
+    areas = [(offset, LUKS1_HEADER_SIZE)]
+    active = 0
+    for i in range(LUKS1_KEYSLOTS):
+        state, _, material_offset, stripes = struct.unpack_from(">II32xII", header, 208 + 48 * i)
+        active += state == 0x00AC71F3
+        length = -(-key_bytes * stripes // SECTOR) * SECTOR
+        areas.append((offset + material_offset * SECTOR, length))
+    data_offset = payload_offset * SECTOR
+    return {"version": 1, "offset": offset, "uuid": uuid, "active_keyslots": active,
+            "data_offset": data_offset,
+            "erase": [(offset, data_offset)] if data_offset else uee_alloc.merge(areas)}
+
+
+def _luks2(fd, header, offset):
+    header_size = struct.unpack_from(">Q", header, 8)[0]
+    uuid = header[168:208].split(b"\0")[0].decode(errors="replace")
+    raw = uee_alloc.read_at(fd, offset + LUKS2_BINARY_HEADER, header_size - LUKS2_BINARY_HEADER)
+    try:
+        metadata = json.loads(raw.split(b"\0")[0])
+    except ValueError:
+        metadata = {}
+    keyslots = metadata.get("keyslots", {})
+    areas = [(offset, header_size), (offset + header_size, header_size)]
+    for slot in keyslots.values():
+        area = slot.get("area", {})
+        areas.append((offset + int(area.get("offset", 0)), int(area.get("size", 0))))
+    segments = [int(s["offset"]) for s in metadata.get("segments", {}).values() if str(s.get("offset", "")).isdigit()]
+    data_offset = min(segments) if segments else 0
+    if not metadata:
+        # unreadable JSON: the binary headers and the default 16 MiB metadata/keyslot region
+        data_offset = 16 * 1024 * 1024
+    return {"version": 2, "offset": offset, "uuid": uuid, "active_keyslots": len(keyslots),
+            "data_offset": data_offset,
+            "erase": [(offset, data_offset)] if data_offset else uee_alloc.merge([a for a in areas if a[1]])}
+
+
+def luks_header(fd, offset):
+    """The LUKS header at offset, with the extents that hold its key material, or None."""
+    header = uee_alloc.read_at(fd, offset, LUKS2_BINARY_HEADER)
+    if len(header) < LUKS1_HEADER_SIZE or header[:6] != LUKS_MAGIC:
+        return None
+    version = struct.unpack_from(">H", header, 6)[0]
+    if version == 1:
+        return _luks1(header, offset)
+    if version == 2:
+        return _luks2(fd, header, offset)
+    return None
+
+
+def find_luks(fd, size):
+    """LUKS headers at the start of the disk and of its partitions."""
+    offsets = [0] + [start for start, _ in uee_alloc.partitions(fd, size)]
+    headers = []
+    for offset in offsets:
+        header = luks_header(fd, offset)
+        if header is not None:
+            headers.append(header)
+    return headers
+
+
+def opal_status(device, run=subprocess.run):
+    """True for an OPAL drive, False for none, None when sedutil-cli is unavailable."""
+    if not device.startswith("/dev/"):
+        return False
+    try:
+        result = run([SEDUTIL, "--isValidSED", device], capture_output=True, text=True, timeout=30)
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    output = result.stdout + result.stderr
+    return result.returncode == 0 and " SED " in f" {output} " and "Not a " not in output
+
+
+def opal_revert(device, psid, run=subprocess.run):
+    """PSID revert: the drive discards its media encryption key. Raises OSError on failure."""
+    try:
+        result = run([SEDUTIL, "--yesIreallywanttoERASEALLmydatausingthePSID", psid, device],
+                     capture_output=True, text=True, timeout=600)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        raise OSError(f"OPAL revert on {device} failed: {e}") from None
+    if result.returncode != 0:
+        raise OSError(f"OPAL revert on {device} failed: {(result.stderr or result.stdout).strip()}")
+    return (result.stdout or "").strip()
+
+
+def detect(device, fd, size, run=subprocess.run):
+    """What a crypto erase could use on device: {"luks": [...], "opal": True/False/None}."""
+    return {"luks": find_luks(fd, size), "opal": opal_status(device, run)}
+
+
+def probe(device):
+    """detect() on a device opened read-only, for the front-ends' plan; None if it cannot be read."""
+    try:
+        target = uee_target.open_target(device, readonly=True)
+    except OSError:
+        return None
+    try:
+        return detect(device, target.fd, target.size)
+    except OSError:
+        return None
+    finally:
+        target.close()
+
+
+def describe(found):
+    parts = [f"LUKS{h['version']} at {h['offset'] // (1024 * 1024)} MiB" for h in found["luks"]]
+    if found["opal"]:
+        parts.append("OPAL self-encrypting drive")
+    return ", ".join(parts)
+
+
+def scrub_extents(fd, size, length=SCRUB_BYTES):
+    """Head and tail of the disk and of each partition, and the other signature locations."""
+    extents = uee_signatures.locations(fd, size)
+    for start, span in [(0, size)] + uee_alloc.partitions(fd, size):
+        n = min(length, span)
+        extents += [(start, n), (start + span - n, n)]
+    return uee_alloc.merge(extents)
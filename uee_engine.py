@@ -0,0 +1,1024 @@
+"""
+UEE wipe engine.
+
+Writes the wipe passes for UEE_FORMAT_SCRIPT and produces a per-device
+wipe certificate. Every buffer that is written (and read back when
+verifying) is fed to an incremental hash as it flows, so the certificate
+costs no extra I/O.
+
+With --scope allocated only the allocated blocks and the filesystem
+metadata found by uee_alloc are overwritten; the free space is discarded
+or zeroed by the device instead. DISK may also be a disk image file (see
+uee_target), of which only the allocated extents are written.
+
+Write errors from a failing medium do not end the job: the buffer is
+retried in smaller pieces down to the logical sector, sectors that stay
+unwritable are skipped (and left out of later passes and the verify),
+and the bad-block map goes into the certificate.
+
+Every pass and the verify keep a throughput profile per LBA bucket
+(uee_profile); slow zones and stragglers are reported as they happen
+and the certificate's health section says whether the drive is
+degraded.
+
+Random passes come from a seeded, seekable generator (uee_prng); the
+seed goes into the certificate, so they are verified by regenerating
+the data and 'check' can re-verify a device against its certificate
+later.
+
+On zoned devices (host-managed/host-aware SMR, ZNS; see uee_zoned) every
+sequential zone is reset and written from its write pointer, with as
+many zones in flight as the device may have open. The pass digest is
+then the hash over the zones' own digests in LBA order.
+
+crypto-erase destroys the key material of LUKS volumes (and reverts
+OPAL drives) instead of overwriting the surface; see uee_crypto.
+
+scrub only zeroes the places partition tables, RAID/LVM labels and
+filesystem superblocks (and their backups) live, see uee_signatures:
+the fast path of a quick format, not a sanitization.
+
+Usage: python3 uee_engine.py wipe /dev/sdb zeros 1 [--verify] [--certificate FILE]
+       python3 uee_engine.py crypto-erase /dev/sdb [--scrub] [--psid PSID] [--certificate FILE]
+       python3 uee_engine.py scrub /dev/sdb [--certificate FILE]
+       python3 uee_engine.py check /dev/sdb FILE
+"""
+import argparse
+import bisect
+import errno
+import hashlib
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import uee_alloc
+import uee_crypto
+import uee_metrics
+import uee_numa
+import uee_pool
+import uee_prng
+import uee_profile
+import uee_qos
+import uee_signatures
+import uee_sim
+import uee_target
+import uee_thermal
+import uee_trace
+import uee_zoned
+
+BLOCK_SIZE = 4 * 1024 * 1024
+PATTERNS = ['zeros', 'ones', 'random']
+HASH_ALGORITHM = 'sha256'
+PROGRESS_INTERVAL = 1.0
+MAX_MISMATCHES = 64
+CERTIFICATE_VERSION = 1
+# errors a failing medium returns for one region; anything else (device gone, ...) aborts the job
+MEDIUM_ERRORS = (errno.EIO, errno.EILSEQ, errno.ENODATA, errno.EBADMSG, errno.EREMOTEIO)
+SECTOR_RETRIES = 3
+MAX_BAD_SECTORS = 65536
+
+
+class Progress:
+    """Prints a dd-style progress line at most once per interval."""
+
+    def __init__(self, label, total, interval=PROGRESS_INTERVAL, device=None, throttle=None):
+        self.label = label
+        self.total = total
+        self.device = device
+        self.throttle = throttle
+        self.interval = interval
+        self.start = time.monotonic()
+        self.last = self.start
+
+    def update(self, done, force=False):
+        now = time.monotonic()
+        if not force and now - self.last < self.interval:
+            return
+        self.last = now
+        elapsed = max(now - self.start, 1e-9)
+        pct = (100.0 * done / self.total) if self.total else 100.0
+        status = self.throttle.describe() if self.throttle else ""
+        print(f"{self.label}: {done // (1024 * 1024)} MiB / {self.total // (1024 * 1024)} MiB "
+              f"({pct:.1f}%), {done / elapsed / 1e6:.1f} MB/s{', ' + status if status else ''}", flush=True)
+        if self.device:
+            state = {"done": done, "total": self.total}
+            if self.throttle and self.throttle.governor:
+                state["temperature"] = self.throttle.governor.temperature
+            uee_metrics.publish_job(self.device, **state)
+        uee_trace.emit("C", "progress", args={"bytes": done})
+
+
+def pattern_buffer(pattern, size=BLOCK_SIZE):
+    if pattern == 'zeros':
+        return bytearray(size)
+    if pattern == 'ones':
+        return bytearray(b'\xff') * size
+    raise ValueError(f"pattern '{pattern}' has no constant buffer")
+
+
+def pattern_view(pattern, size=BLOCK_SIZE):
+    """Read-only pattern data, mapped from the shared pool when possible."""
+    # one copy per NUMA node, so pinned engines read local memory
+    node = uee_numa.current_node()
+    name = pattern if node is None else f"{pattern}-node{node}"
+    shared = uee_pool.shared_buffer(name, size, lambda: pattern_buffer(pattern, size))
+    if shared is not None:
+        return shared.view
+    # page aligned like the pool, for O_DIRECT
+    private = uee_target.aligned_buffer(size)
+    private[:] = pattern_buffer(pattern, size)
+    return memoryview(private)
+
+
+def device_identity(disk):
+    identity = {"name": disk}
+    try:
+        cmd = ["lsblk", "-J", "-d", "-b", "-o", "NAME,SIZE,MODEL,SERIAL,WWN,VENDOR,REV,TRAN", disk]
+        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+        item = json.loads(result.stdout).get('blockdevices', [{}])[0]
+        for key in ['model', 'serial', 'wwn', 'vendor', 'rev', 'tran']:
+            value = item.get(key)
+            identity[key] = value.strip() if isinstance(value, str) else value
+        identity['size_bytes'] = int(item.get('size') or 0)
+    except Exception:
+        pass
+    return identity
+
+
+def _rate(nbytes, seconds):
+    return round(nbytes / seconds / 1e6, 2) if seconds > 0 else None
+
+
+def _timestamp(t):
+    return time.strftime("%Y-%m-%dT%H:%M:%S%z", time.localtime(t))
+
+
+class BadBlocks:
+    """
+    Sectors that failed SECTOR_RETRIES times. A buffer that fails is split
+    in halves down to the logical sector, so only the bad sectors are
+    skipped and the next buffer goes at full size again. The job gives up
+    after limit sectors (a dead drive would otherwise be retried sector by
+    sector end to end).
+    """
+
+    def __init__(self, sector_size, limit=MAX_BAD_SECTORS):
+        self.sector_size = sector_size
+        self.limit = limit
+        self.sectors = 0
+        self.bytes = 0
+        self.retries = 0
+        self._extents = []
+        # zones are written in parallel
+        self.lock = threading.Lock()
+
+    @property
+    def extents(self):
+        with self.lock:
+            return uee_alloc.merge(self._extents)
+
+    def _add(self, offset, length):
+        with self.lock:
+            if self._extents and sum(self._extents[-1]) == offset:
+                self._extents[-1] = (self._extents[-1][0], self._extents[-1][1] + length)
+            else:
+                self._extents.append((offset, length))
+            self.sectors += -(-length // self.sector_size)
+            self.bytes += length
+
+    def mark(self, offset, length):
+        self._add(offset, length)
+        uee_trace.emit("i", "bad sector", args={"offset": offset, "length": length})
+        if self.sectors > self.limit:
+            raise OSError(errno.EIO, f"more than {self.limit} bad sectors, giving up")
+
+    def abandon(self, offset, length):
+        """
+        The rest of a sequential zone after a write error: nothing can be
+        written past the failed sector, so it is skipped as a whole and
+        does not count towards the limit.
+        """
+        self._add(offset, length)
+        uee_trace.emit("i", "abandoned zone", args={"offset": offset, "length": length})
+
+    def summary(self):
+        extents = self.extents
+        return {"sector_size": self.sector_size, "sectors": self.sectors, "bytes": self.bytes,
+                "retries": self.retries, "extents": [list(e) for e in extents]}
+
+
+def _split(view, sector_size):
+    return max(len(view) // 2 // sector_size, 1) * sector_size
+
+
+def write_all(target, chunk, offset, hasher, bad=None):
+    """
+    Write all of chunk at offset and hash what was written. With bad,
+    medium errors are retried in smaller pieces and sectors that stay
+    unwritable are skipped and recorded.
+    """
+    attempts = 0
+    while chunk:
+        try:
+            written = target.pwrite(chunk, offset)
+        except OSError as e:
+            if bad is None or e.errno not in MEDIUM_ERRORS:
+                raise
+            bad.retries += 1
+            if len(chunk) > bad.sector_size:
+                half = _split(chunk, bad.sector_size)
+                write_all(target, chunk[:half], offset, hasher, bad)
+                write_all(target, chunk[half:], offset + half, hasher, bad)
+                return
+            attempts += 1
+            if attempts < SECTOR_RETRIES:
+                continue
+            bad.mark(offset, len(chunk))
+            return
+        hasher.update(chunk[:written])
+        chunk = chunk[written:]
+        offset += written
+
+
+def read_all(target, view, offset, unreadable=None):
+    """
+    Fill view from offset; short only at the end of the device. With
+    unreadable, sectors that cannot be read are zeroed and recorded there.
+    """
+    n = 0
+    attempts = 0
+    while n < len(view):
+        try:
+            got = target.preadv(view[n:], offset + n)
+        except OSError as e:
+            if unreadable is None or e.errno not in MEDIUM_ERRORS:
+                raise
+            unreadable.retries += 1
+            rest = view[n:]
+            if len(rest) > unreadable.sector_size:
+                half = _split(rest, unreadable.sector_size)
+                got = read_all(target, rest[:half], offset + n, unreadable)
+                if got == half:
+                    got += read_all(target, rest[half:], offset + n + half, unreadable)
+                return n + got
+            attempts += 1
+            if attempts < SECTOR_RETRIES:
+                continue
+            rest[:] = bytes(len(rest))
+            unreadable.mark(offset + n, len(rest))
+            return len(view)
+        if got == 0:
+            break
+        n += got
+    return n
+
+
+def differs(expected, actual):
+    # expected views a bytearray: bytearray != memoryview compares with memcmp,
+    # memoryview != memoryview element by element
+    owner = expected.obj
+    return (owner if len(owner) == len(actual) else owner[:len(actual)]) != actual
+
+
+def write_pass(target, pattern, label, hash_name=HASH_ALGORITHM, device=None, throttle=None, extents=None,
+               stream=None, bad=None, profile=None):
+    hasher = hashlib.new(hash_name)
+    extents = [(0, target.size)] if extents is None else extents
+    progress = Progress(label, sum(length for _, length in extents), device=device, throttle=throttle)
+    view = None if pattern == 'random' else pattern_view(pattern)
+    randoms = uee_prng.blocks(stream, extents, BLOCK_SIZE) if view is None else None
+    bad_bytes = bad.bytes if bad is not None else 0
+    started = time.monotonic()
+    done = 0
+    for start, length in extents:
+        offset, end = start, start + length
+        while offset < end:
+            n = min(BLOCK_SIZE, end - offset)
+            chunk = next(randoms) if view is None else view[:n]
+            if throttle is not None:
+                throttle.pace(n)
+            io_started = time.monotonic()
+            write_all(target, chunk, offset, hasher, bad)
+            # progress counts what has reached the device, not the page cache
+            unsynced = target.written(offset, n)
+            if profile is not None:
+                profile.add(offset, n, time.monotonic() - io_started)
+            offset += n
+            done += n
+            progress.update(done - unsynced)
+    target.flush()
+    seconds = time.monotonic() - started
+    progress.update(done, force=True)
+    # skipped bad sectors were not written
+    done -= (bad.bytes if bad is not None else 0) - bad_bytes
+    result = {"bytes": done, "seconds": round(seconds, 3), "mb_per_s": _rate(done, seconds),
+              "digest": hasher.hexdigest()}
+    if profile is not None:
+        result["profile"] = profile.summary()
+    return result
+
+
+class ZoneDigest:
+    """
+    Digest of a pass over a zoned device: the hash over each zone's own
+    digest, in LBA order, so zones can be hashed as they are written in
+    parallel. Zones nothing was written to are left out.
+    """
+
+    def __init__(self, hash_name, zones):
+        self.hash_name = hash_name
+        self.starts = [zone["start"] for zone in zones]
+        self.hashers = [None] * len(zones)
+
+    def zone(self, offset):
+        """The hasher of the zone holding offset."""
+        i = bisect.bisect_right(self.starts, offset) - 1
+        if self.hashers[i] is None:
+            self.hashers[i] = hashlib.new(self.hash_name)
+        return self.hashers[i]
+
+    def hexdigest(self):
+        empty = hashlib.new(self.hash_name).digest()
+        combined = hashlib.new(self.hash_name)
+        for hasher in self.hashers:
+            if hasher is not None and hasher.digest() != empty:
+                combined.update(hasher.digest())
+        return combined.hexdigest()
+
+
+def zone_extents(zoned, bad_extents):
+    """
+    What a pass over a zoned device writes, zone by zone: [(zone, extents)]
+    with the capacity of each writable zone minus the bad sectors. A
+    sequential-write-required zone is only written up to its first bad
+    sector, nothing past it can be.
+    """
+    bad_extents = uee_alloc.merge(bad_extents)
+    bad_ends = [start + length for start, length in bad_extents]
+    result = []
+    for zone in zoned["zones"]:
+        if not uee_zoned.writable(zone):
+            continue
+        start, end = zone["start"], zone["start"] + zone["capacity"]
+        i = bisect.bisect_right(bad_ends, start)
+        holes = []
+        while i < len(bad_extents) and bad_extents[i][0] < end:
+            holes.append(bad_extents[i])
+            i += 1
+        extents = uee_alloc.subtract([(start, zone["capacity"])], holes)
+        if zone["type"] == 'seq-required':
+            extents = [e for e in extents[:1] if e[0] == start]
+        if extents:
+            result.append((zone, extents))
+    return result
+
+
+def write_zones(target, zoned, pattern, label, hash_name=HASH_ALGORITHM, device=None, throttle=None,
+                extents=None, stream=None, bad=None, profile=None):
+    """
+    write_pass for a zoned device. extents come from zone_extents; each
+    zone is written start to end by one worker, as many zones at once as
+    the device may have open (uee_zoned.workers).
+    """
+    extents = zone_extents(zoned, []) if extents is None else extents
+    digest = ZoneDigest(hash_name, zoned["zones"])
+    progress = Progress(label, sum(uee_alloc.total(e) for _, e in extents), device=device, throttle=throttle)
+    view = None if pattern == 'random' else pattern_view(pattern)
+    bad_bytes = bad.bytes if bad is not None else 0
+    lock = threading.Lock()
+    pacing = threading.Lock()
+    stop = threading.Event()
+    failed_zones = []
+    done = 0
+
+    def write_zone(zone, pieces):
+        nonlocal done
+        hasher = digest.zone(zone["start"])
+        # every worker generates its random data into its own buffer
+        buffer = memoryview(uee_target.aligned_buffer(BLOCK_SIZE)) if view is None else None
+        sequential = zone["type"] != 'conventional'
+        if sequential:
+            target.reset_zone(zone["start"], zone["length"])
+        for start, length in pieces:
+            offset, end = start, start + length
+            while offset < end:
+                if stop.is_set():
+                    return
+                n = min(BLOCK_SIZE, end - offset)
+                if view is None:
+                    chunk = buffer[:n]
+                    stream.fill(offset, chunk)
+                else:
+                    chunk = view[:n]
+                if throttle is not None:
+                    with pacing:
+                        throttle.pace(n)
+                io_started = time.monotonic()
+                if zone["type"] == 'seq-required':
+                    # a skipped sector would leave the write pointer behind: no retries in pieces
+                    try:
+                        write_all(target, chunk, offset, hasher)
+                    except OSError as e:
+                        if bad is None or e.errno not in MEDIUM_ERRORS:
+                            raise
+                        skipped = zone["start"] + zone["capacity"] - offset
+                        bad.abandon(offset, skipped)
+                        with lock:
+                            failed_zones.append({"start": zone["start"], "offset": offset, "error": e.strerror})
+                            # counted like skipped bad sectors, which are taken off at the end
+                            done += skipped
+                        end = offset
+                        break
+                else:
+                    write_all(target, chunk, offset, hasher, bad)
+                seconds = time.monotonic() - io_started
+                offset += n
+                with lock:
+                    done += n
+                    if profile is not None:
+                        profile.add(offset - n, n, seconds)
+                    progress.update(done)
+        if sequential and end < zone["start"] + zone["capacity"]:
+            # stopped short: release the zone's open resources for the zones after it
+            target.finish_zone(zone["start"], zone["length"])
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=uee_zoned.workers(zoned), thread_name_prefix="uee-zone") as pool:
+        # submitted in LBA order, so no more zones than workers are open at any time
+        futures = [pool.submit(write_zone, zone, pieces) for zone, pieces in extents]
+        try:
+            for future in futures:
+                future.result()
+        except BaseException:
+            stop.set()
+            for future in futures:
+                future.cancel()
+            raise
+    target.flush()
+    seconds = time.monotonic() - started
+    progress.update(done, force=True)
+    done -= (bad.bytes if bad is not None else 0) - bad_bytes
+    result = {"bytes": done, "seconds": round(seconds, 3), "mb_per_s": _rate(done, seconds),
+              "digest": digest.hexdigest(), "zones": len(extents), "failed_zones": sorted(
+                  failed_zones, key=lambda z: z["start"])}
+    if profile is not None:
+        result["profile"] = profile.summary()
+    return result
+
+
+def verify_pass(target, pattern, expected_digest, hash_name=HASH_ALGORITHM, device=None, throttle=None,
+                extents=None, stream=None, profile=None, zones=None):
+    # drop the cached pages of the last pass so the read comes from the media
+    os.posix_fadvise(target.fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    # zoned passes are hashed zone by zone (ZoneDigest)
+    hasher = hashlib.new(hash_name) if zones is None else ZoneDigest(hash_name, zones)
+    extents = [(0, target.size)] if extents is None else extents
+    expected_bytes = sum(length for _, length in extents)
+    progress = Progress("Verify", expected_bytes, device=device, throttle=throttle)
+    # random passes are regenerated from their seed, block by block as they are read
+    pattern_data = None if pattern == 'random' else memoryview(pattern_buffer(pattern))
+    randoms = None
+    if pattern == 'random' and stream:
+        randoms = uee_prng.blocks(stream, extents, BLOCK_SIZE, allocate=bytearray)
+    view = memoryview(uee_target.aligned_buffer(BLOCK_SIZE))
+    mismatches = []
+    mismatched_bytes = 0
+    unreadable = BadBlocks(target.sector_size)
+    started = time.monotonic()
+    done = 0
+    for start, length in extents:
+        offset, end = start, start + length
+        while offset < end:
+            want = min(BLOCK_SIZE, end - offset)
+            if throttle is not None:
+                throttle.pace(want)
+            unreadable_before = unreadable.sectors
+            io_started = time.monotonic()
+            n = read_all(target, view[:want], offset, unreadable)
+            if n == 0:
+                break
+            if profile is not None:
+                profile.add(offset, n, time.monotonic() - io_started)
+            target.read(offset, n)
+            (hasher if zones is None else hasher.zone(offset)).update(view[:n])
+            expected = pattern_data if randoms is None else next(randoms)
+            if unreadable.sectors > unreadable_before or (expected is not None and differs(expected, view[:n])):
+                mismatched_bytes += n
+                if len(mismatches) < MAX_MISMATCHES:
+                    mismatches.append(offset)
+            offset += n
+            done += n
+            progress.update(done)
+            if n < want:
+                break
+    seconds = time.monotonic() - started
+    progress.update(done, force=True)
+    digest = hasher.hexdigest()
+    passed = done == expected_bytes and not mismatches and digest == expected_digest
+    result = {"result": "passed" if passed else "failed", "bytes": done,
+              "seconds": round(seconds, 3), "mb_per_s": _rate(done, seconds),
+              "digest": digest, "mismatched_blocks": mismatches, "mismatched_bytes": mismatched_bytes,
+              "unreadable": unreadable.summary() if unreadable.sectors else None}
+    if profile is not None:
+        result["profile"] = profile.summary()
+    return result
+
+
+def thermal_governor(disk, max_temp, critical_temp, sensor_path=None, sysfs_root=uee_thermal.SYSFS_ROOT):
+    if not max_temp or (not sensor_path and os.path.isfile(disk)):
+        return None
+    if uee_sim.is_sim(disk):
+        sysfs_root = uee_sim.SYSFS_ROOT
+    if sensor_path:
+        sensor = uee_thermal.FileSensor(sensor_path)
+    else:
+        sensor = uee_thermal.find_sensor(disk, sysfs_root)
+    if sensor is None:
+        print("No temperature sensor found, thermal throttling disabled.", flush=True)
+        return None
+    print(f"Thermal throttling above {max_temp}C, pause at {critical_temp}C ({sensor.name}).", flush=True)
+    return uee_thermal.ThermalGovernor(sensor, max_temp, critical_temp)
+
+
+def _skip_bad(extents, size, bad):
+    if not bad.sectors:
+        return extents
+    return uee_alloc.subtract([(0, size)] if extents is None else extents, bad.extents)
+
+
+def wipe(disk, pattern, passes, verify=False, hash_name=HASH_ALGORITHM, rate=0, cgroup=False,
+         governor=None, scope='full', release='discard', generator=None, seed=None, affinity=None, io='direct'):
+    started = time.time()
+    random_plan = None
+    if pattern == 'random':
+        random_plan = {"generator": generator or uee_prng.GENERATORS[0], "seed": seed or uee_prng.new_seed()}
+    target = uee_target.open_target(disk)
+    identity = device_identity(disk) if target.kind == 'block' else target.identity()
+    fd, size = target.fd, target.size
+    try:
+        layout = extents = released = None
+        zoned = target.zoned()
+        if zoned is not None:
+            print(uee_zoned.describe(zoned) + ".", flush=True)
+            if scope == 'allocated':
+                print("Zones are reset and rewritten whole: --scope allocated does not apply.", flush=True)
+                scope = 'full'
+            if io != 'direct':
+                # the page cache could reorder writes within a zone
+                print("Zoned devices are written with O_DIRECT.", flush=True)
+                io = 'direct'
+        if scope == 'allocated':
+            # must be read before the first pass destroys it
+            print("Reading partition table and filesystem allocation...", flush=True)
+            trace_start = uee_trace.now_us()
+            layout = uee_alloc.scan(fd, size)
+            uee_trace.emit("X", "scan-allocation", ts=trace_start, dur=uee_trace.now_us() - trace_start,
+                           args={"extents": len(layout["overwrite"])})
+        if target.kind == 'file':
+            layout = uee_alloc.restrict(layout or uee_alloc.full_layout(size), target.data_extents())
+        if layout is not None:
+            extents = layout["overwrite"]
+            for line in uee_alloc.describe(layout):
+                print(line, flush=True)
+        total = uee_alloc.total(extents) if extents is not None else size
+        if zoned is not None:
+            total = uee_zoned.summary(zoned)["capacity_bytes"]
+        io_mode = target.set_io_mode(io)
+        if io_mode != io:
+            if zoned is not None:
+                raise OSError(errno.EINVAL, f"zoned device {disk} does not support O_DIRECT")
+            print(f"O_DIRECT is not supported on {disk}, using {io_mode} I/O.", flush=True)
+        uee_metrics.clear_job(disk)
+        uee_metrics.publish_job(disk, model=identity.get('model'), serial=identity.get('serial'),
+                                pattern=pattern, passes=passes, phase="start")
+        throttle = uee_qos.Throttle(disk, rate, cgroup=cgroup, governor=governor)
+        bad = BadBlocks(target.sector_size)
+        pass_results = []
+        for i in range(1, passes + 1):
+            print(f"Pass {i} of {passes} ({pattern})...", flush=True)
+            uee_metrics.publish_job(disk, phase=f"pass {i}/{passes}", done=0, total=total)
+            trace_start = uee_trace.now_us()
+            stream = uee_prng.stream(random_plan["generator"], random_plan["seed"], i) if random_plan else None
+            bad_before = bad.sectors
+            # sectors found bad in an earlier pass are not tried again
+            if zoned is not None:
+                result = write_zones(target, zoned, pattern, f"Pass {i}/{passes}", hash_name, disk, throttle,
+                                     zone_extents(zoned, bad.extents), stream, bad,
+                                     uee_profile.Profile(f"Pass {i}/{passes}", size, device=disk, parallel=True))
+            else:
+                result = write_pass(target, pattern, f"Pass {i}/{passes}", hash_name, disk, throttle,
+                                    _skip_bad(extents, size, bad), stream, bad,
+                                    uee_profile.Profile(f"Pass {i}/{passes}", size, device=disk))
+            uee_trace.emit("X", f"pass {i}", ts=trace_start, dur=uee_trace.now_us() - trace_start,
+                           args={"bytes": result["bytes"], "mb_per_s": result["mb_per_s"]})
+            result["pass"] = i
+            result["pattern"] = pattern
+            result["bad_sectors"] = bad.sectors - bad_before
+            pass_results.append(result)
+            print(f"Pass {i} complete: {result['mb_per_s']} MB/s, {hash_name} {result['digest']}", flush=True)
+            if result["bad_sectors"]:
+                print(f"Skipped {result['bad_sectors']} unwritable sectors in pass {i}.", flush=True)
+            if result.get("failed_zones"):
+                print(f"Pass {i}: {len(result['failed_zones'])} zones stopped at a write error.", flush=True)
+            if result["profile"]["slow_zones"]:
+                print(f"Pass {i}: {len(result['profile']['slow_zones'])} slow zones, "
+                      f"{result['profile']['stragglers']['count']} stragglers.", flush=True)
+
+        verification = {"result": "skipped"}
+        if verify:
+            print("Verifying last pass...", flush=True)
+            uee_metrics.publish_job(disk, phase="verify", done=0, total=total)
+            trace_start = uee_trace.now_us()
+            if zoned is not None:
+                verify_extents = [e for _, pieces in zone_extents(zoned, bad.extents) for e in pieces]
+            else:
+                verify_extents = _skip_bad(extents, size, bad)
+            verification = verify_pass(target, pattern, pass_results[-1]["digest"], hash_name, disk, throttle,
+                                       verify_extents, stream, uee_profile.Profile("Verify", size, device=disk),
+                                       zones=zoned["zones"] if zoned is not None else None)
+            uee_trace.emit("X", "verify", ts=trace_start, dur=uee_trace.now_us() - trace_start,
+                           args={"bytes": verification["bytes"], "result": verification["result"]})
+            print(f"Verification {verification['result']}.", flush=True)
+
+        # free space is released; on images the overwritten extents are punched out as well
+        to_release = []
+        if layout is not None:
+            to_release = layout["free"] + (layout["overwrite"] if target.kind == 'file' else [])
+        if to_release:
+            to_release = uee_alloc.merge(to_release)
+            nbytes = uee_alloc.total(to_release)
+            print(f"Releasing {nbytes // (1024 * 1024)} MiB ({release})...", flush=True)
+            uee_metrics.publish_job(disk, phase="release", done=0, total=nbytes)
+            trace_start = uee_trace.now_us()
+            released = target.release(to_release, release, Progress("Release", nbytes))
+            uee_trace.emit("X", "release", ts=trace_start, dur=uee_trace.now_us() - trace_start,
+                           args=released)
+            print("Released: " + ", ".join(f"{method} {n // (1024 * 1024)} MiB"
+                                           for method, n in released.items()), flush=True)
+    finally:
+        target.close()
+        uee_metrics.clear_job(disk)
+    finished = time.time()
+
+    return {
+        "version": CERTIFICATE_VERSION,
+        "tool": "UEE",
+        "host": socket.gethostname(),
+        "device": identity,
+        "plan": {"pattern": pattern, "passes": passes, "verify": verify, "scope": scope,
+                 "block_size": BLOCK_SIZE, "hash": hash_name, "rate_limit": rate, "random": random_plan,
+                 "affinity": affinity, "io": io_mode,
+                 "zoned": uee_zoned.summary(zoned) if zoned is not None else None},
+        "started": _timestamp(started),
+        "finished": _timestamp(finished),
+        "seconds": round(finished - started, 3),
+        "size_bytes": size,
+        "passes": pass_results,
+        "verification": verification,
+        "thermal": governor.summary() if governor else None,
+        "coverage": uee_alloc.coverage(layout, scope, passes, released or {}) if layout else None,
+        "bad_blocks": bad.summary(),
+        "health": uee_profile.health([(f"pass {r['pass']}", r["profile"]) for r in pass_results]
+                                     + [("verify", verification.get("profile"))]),
+        "digest": pass_results[-1]["digest"] if pass_results else None,
+        "result": ("failed" if verification["result"] == "failed"
+                   else "erased-with-bad-blocks" if bad.sectors else "erased"),
+    }
+
+
+def crypto_erase(disk, scrub=False, psid=None, hash_name=HASH_ALGORITHM):
+    """
+    Destroy the key material of the LUKS volumes on disk, after an OPAL
+    PSID revert when the drive supports it and psid is given, then
+    optionally scrub the signatures. Returns the certificate.
+    """
+    started = time.time()
+    target = uee_target.open_target(disk)
+    identity = device_identity(disk) if target.kind == 'block' else target.identity()
+    fd, size = target.fd, target.size
+    try:
+        found = uee_crypto.detect(disk, fd, size)
+        steps = []
+        uee_metrics.clear_job(disk)
+        uee_metrics.publish_job(disk, model=identity.get('model'), serial=identity.get('serial'),
+                                pattern="crypto", passes=1, phase="crypto-erase")
+        io_mode = target.set_io_mode('direct')
+        if found["opal"] and psid:
+            print("Reverting the OPAL drive with its PSID...", flush=True)
+            trace_start = uee_trace.now_us()
+            output = uee_crypto.opal_revert(disk, psid)
+            uee_trace.emit("X", "opal-revert", ts=trace_start, dur=uee_trace.now_us() - trace_start)
+            steps.append({"method": "opal-revert", "output": output})
+            # what was encrypted under the old media key reads back as noise now
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        luks = uee_crypto.find_luks(fd, size)
+        if not steps and not luks:
+            hint = " (OPAL drive found, but a revert needs --psid)" if found["opal"] else ""
+            raise OSError(errno.ENOENT, f"nothing to crypto-erase on {disk}: no LUKS header{hint}")
+        for header in luks:
+            print(f"Destroying LUKS{header['version']} header and key material at offset {header['offset']} "
+                  f"({uee_alloc.total(header['erase']) // 1024} KiB)...", flush=True)
+            trace_start = uee_trace.now_us()
+            # random data whose seed is not kept: nothing about the old keys can be recovered or derived
+            result = write_pass(target, 'random', "Key material", hash_name, disk, extents=header["erase"],
+                                stream=uee_prng.stream(uee_prng.GENERATORS[0], uee_prng.new_seed(), 1))
+            uee_trace.emit("X", "luks-erase", ts=trace_start, dur=uee_trace.now_us() - trace_start,
+                           args={"bytes": result["bytes"]})
+            steps.append({"method": "luks-erase", "version": header["version"], "offset": header["offset"],
+                          "uuid": header["uuid"], "active_keyslots": header["active_keyslots"],
+                          "extents": [list(e) for e in header["erase"]], "bytes": result["bytes"],
+                          "digest": result["digest"]})
+
+        scrubbed = None
+        if scrub:
+            extents = uee_crypto.scrub_extents(fd, size)
+            print(f"Scrubbing signatures ({uee_alloc.total(extents) // (1024 * 1024)} MiB)...", flush=True)
+            uee_metrics.publish_job(disk, phase="scrub")
+            trace_start = uee_trace.now_us()
+            scrubbed = write_pass(target, 'zeros', "Scrub", hash_name, disk, extents=extents)
+            uee_trace.emit("X", "scrub", ts=trace_start, dur=uee_trace.now_us() - trace_start,
+                           args={"bytes": scrubbed["bytes"]})
+            scrubbed["extents"] = [list(e) for e in extents]
+
+        # read back: no header may still carry its magic
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        remaining = [h["offset"] for h in luks if uee_crypto.luks_header(fd, h["offset"]) is not None]
+        verification = {"result": "failed" if remaining else "passed", "headers_remaining": remaining}
+        print(f"Verification {verification['result']}"
+              + (f": LUKS headers remain at {remaining}." if remaining else "."), flush=True)
+    finally:
+        target.close()
+        uee_metrics.clear_job(disk)
+    finished = time.time()
+
+    return {
+        "version": CERTIFICATE_VERSION,
+        "tool": "UEE",
+        "host": socket.gethostname(),
+        "device": identity,
+        "plan": {"method": "crypto-erase", "scrub": scrub, "hash": hash_name, "io": io_mode},
+        "started": _timestamp(started),
+        "finished": _timestamp(finished),
+        "seconds": round(finished - started, 3),
+        "size_bytes": size,
+        "crypto_erase": {"found": uee_crypto.describe(found), "steps": steps},
+        "scrub": scrubbed,
+        "passes": [],
+        "verification": verification,
+        "digest": None,
+        "result": "failed" if remaining else "crypto-erased",
+    }
+
+
+def scrub(disk, hash_name=HASH_ALGORITHM):
+    """
+    Zero every signature location on disk (uee_signatures) in one batch
+    of writes and read them back. Sequential zones holding one are reset
+    instead. Returns the certificate.
+    """
+    started = time.time()
+    target = uee_target.open_target(disk)
+    identity = device_identity(disk) if target.kind == 'block' else target.identity()
+    size = target.size
+    try:
+        uee_metrics.clear_job(disk)
+        uee_metrics.publish_job(disk, model=identity.get('model'), serial=identity.get('serial'),
+                                pattern="scrub", passes=1, phase="scrub")
+        io_mode = target.set_io_mode('direct')
+        # the areas are remembered: once the partition table is gone they cannot be found again
+        areas = uee_signatures.areas(target.fd, size)
+        found = uee_signatures.detect(target.fd, size, areas)
+        sector = target.sector_size
+        extents = []
+        for start, length in uee_signatures.locations(target.fd, size):
+            # whole logical sectors, so the writes can go around the page cache
+            end = min(-(-(start + length) // sector) * sector, size)
+            start -= start % sector
+            extents.append((start, end - start))
+        extents = uee_alloc.merge(extents)
+        print(f"Found: {uee_signatures.describe(found)}.", flush=True)
+
+        reset = []
+        zoned = target.zoned()
+        if zoned is not None:
+            # sequential zones only take writes at their write pointer; a reset reads back as zeros
+            for zone in zoned["zones"]:
+                span = [(zone["start"], zone["length"])]
+                if zone["wp"] is not None and uee_zoned.writable(zone) and uee_alloc.intersect(extents, span):
+                    target.reset_zone(zone["start"], zone["length"])
+                    reset += span
+            extents = uee_alloc.subtract(extents, reset)
+
+        print(f"Zeroing {len(extents)} signature extents ({uee_alloc.total(extents) // 1024} KiB)"
+              + (f", resetting {len(reset)} zones" if reset else "") + "...", flush=True)
+        trace_start = uee_trace.now_us()
+        bad = BadBlocks(sector)
+        result = write_pass(target, 'zeros', "Scrub", hash_name, disk, extents=extents, bad=bad)
+        uee_trace.emit("X", "scrub", ts=trace_start, dur=uee_trace.now_us() - trace_start,
+                       args={"bytes": result["bytes"]})
+
+        # read back: nothing may be recognized in the same places
+        os.posix_fadvise(target.fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        remaining = uee_signatures.detect(target.fd, size, areas)
+        verification = {"result": "failed" if remaining else "passed",
+                        "remaining": [list(r) for r in remaining]}
+        print(f"Verification {verification['result']}"
+              + (f": still found {uee_signatures.describe(remaining)}." if remaining else "."), flush=True)
+    finally:
+        target.close()
+        uee_metrics.clear_job(disk)
+    finished = time.time()
+
+    return {
+        "version": CERTIFICATE_VERSION,
+        "tool": "UEE",
+        "host": socket.gethostname(),
+        "device": identity,
+        "plan": {"method": "signature-scrub", "hash": hash_name, "io": io_mode},
+        "started": _timestamp(started),
+        "finished": _timestamp(finished),
+        "seconds": round(finished - started, 3),
+        "size_bytes": size,
+        "scrub": dict(result, found=[list(f) for f in found], areas=[list(a) for a in areas],
+                      extents=[list(e) for e in extents], zones_reset=[list(z) for z in reset]),
+        "bad_blocks": bad.summary(),
+        "passes": [],
+        "verification": verification,
+        "digest": None,
+        "result": "failed" if remaining else "scrubbed",
+    }
+
+
+def check(disk, certificate):
+    """Re-read disk and compare it with the last pass recorded in certificate, e.g. for an audit."""
+    plan = certificate["plan"]
+    random_plan = plan.get("random")
+    if plan["pattern"] == 'random' and not random_plan:
+        raise ValueError("the certificate has no random seed to regenerate the pass from")
+    stream = uee_prng.stream(random_plan["generator"], random_plan["seed"], plan["passes"]) if random_plan else None
+    coverage = certificate.get("coverage")
+    extents = [tuple(e) for e in coverage["overwritten_extents"]] if coverage else None
+    bad_blocks = certificate.get("bad_blocks") or {}
+    target = uee_target.open_target(disk, readonly=True)
+    try:
+        size = target.size
+        if size != certificate["size_bytes"]:
+            print(f"Warning: {disk} is {size} bytes, the certificate says {certificate['size_bytes']}.", flush=True)
+        zones = None
+        if plan.get("zoned"):
+            # the zone layout is reported again rather than stored with every zone
+            zoned = target.zoned()
+            if zoned is None:
+                raise ValueError(f"the certificate is for a zoned device, {disk} is not one")
+            zones = zoned["zones"]
+            extents = [e for _, pieces in zone_extents(zoned, [tuple(e) for e in bad_blocks.get("extents", [])])
+                       for e in pieces]
+        elif bad_blocks.get("extents"):
+            extents = uee_alloc.subtract([(0, size)] if extents is None else extents,
+                                         [tuple(e) for e in bad_blocks["extents"]])
+        target.set_io_mode(plan.get("io") or 'direct')
+        return verify_pass(target, plan["pattern"], certificate["digest"], plan["hash"], extents=extents,
+                           stream=stream, zones=zones)
+    finally:
+        target.close()
+
+
+def write_certificate(certificate, path):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(certificate, f, indent=2)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="uee_engine.py", description="UEE wipe engine")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    wipe_parser = sub.add_parser("wipe", help="overwrite a device and write its certificate")
+    wipe_parser.add_argument("disk")
+    wipe_parser.add_argument("pattern", choices=PATTERNS)
+    wipe_parser.add_argument("passes", type=int)
+    wipe_parser.add_argument("--verify", action="store_true", help="read back and check the last pass")
+    wipe_parser.add_argument("--certificate", metavar="FILE", help="write the wipe certificate to FILE")
+    wipe_parser.add_argument("--hash", dest="hash_name", default=HASH_ALGORITHM,
+                             choices=sorted(a for a in hashlib.algorithms_guaranteed if not a.startswith('shake')))
+    wipe_parser.add_argument("--rate", type=uee_qos.parse_rate, default=0,
+                             help="throughput cap, e.g. 200M (bytes/s); qos.json can lower it at runtime")
+    wipe_parser.add_argument("--cgroup", action="store_true", help="also enforce the cap with cgroup v2 io.max")
+    wipe_parser.add_argument("--max-temp", type=int, default=uee_thermal.DEFAULT_MAX_TEMP,
+                             help="slow down above this temperature in C (0 disables thermal throttling)")
+    wipe_parser.add_argument("--critical-temp", type=int, default=uee_thermal.DEFAULT_CRITICAL_TEMP,
+                             help="pause above this temperature in C")
+    wipe_parser.add_argument("--temp-sensor", metavar="FILE", help="read millidegrees C from FILE instead of probing")
+    wipe_parser.add_argument("--scope", choices=['full', 'allocated'], default='full',
+                             help="'allocated' overwrites only used blocks and filesystem metadata")
+    wipe_parser.add_argument("--release", choices=uee_target.RELEASE_METHODS, default='discard',
+                             help="how space that is not overwritten is dropped: discard/punch holes or zero it")
+    wipe_parser.add_argument("--generator", choices=uee_prng.GENERATORS, default=uee_prng.GENERATORS[0],
+                             help="seeded generator for random passes")
+    wipe_parser.add_argument("--io", choices=uee_target.IO_MODES, default='direct',
+                             help="O_DIRECT, or page cache with sync_file_range and fadvise (used where O_DIRECT is "
+                                  "not supported)")
+    wipe_parser.add_argument("--numa", choices=uee_numa.MODES, default='auto',
+                             help="run on the CPUs and memory of the device controller's NUMA node")
+    wipe_parser.add_argument("--sysfs-root", default=uee_thermal.SYSFS_ROOT, help=argparse.SUPPRESS)
+
+    crypto_parser = sub.add_parser("crypto-erase", help="destroy LUKS key material / OPAL revert, then scrub")
+    crypto_parser.add_argument("disk")
+    crypto_parser.add_argument("--scrub", action="store_true",
+                               help="also zero the signatures at the head and tail of the disk and its partitions")
+    crypto_parser.add_argument("--psid", help="PSID from the drive label, for an OPAL revert")
+    crypto_parser.add_argument("--certificate", metavar="FILE", help="write the certificate to FILE")
+    crypto_parser.add_argument("--hash", dest="hash_name", default=HASH_ALGORITHM,
+                               choices=sorted(a for a in hashlib.algorithms_guaranteed if not a.startswith('shake')))
+
+    scrub_parser = sub.add_parser("scrub", help="zero partition tables, RAID/LVM labels and filesystem superblocks")
+    scrub_parser.add_argument("disk")
+    scrub_parser.add_argument("--certificate", metavar="FILE", help="write the certificate to FILE")
+    scrub_parser.add_argument("--hash", dest="hash_name", default=HASH_ALGORITHM,
+                              choices=sorted(a for a in hashlib.algorithms_guaranteed if not a.startswith('shake')))
+
+    check_parser = sub.add_parser("check", help="re-verify a wiped device against its certificate")
+    check_parser.add_argument("disk")
+    check_parser.add_argument("certificate", metavar="FILE")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "wipe":
+        if args.passes < 1:
+            parser.error("passes must be at least 1")
+        try:
+            # before any buffer or thread exists, so both end up on the device's node
+            affinity = uee_numa.place(args.disk, args.numa, args.sysfs_root)
+            if affinity:
+                print(f"Running on NUMA node {affinity['node']} (CPUs {affinity['cpus']}).", flush=True)
+            governor = thermal_governor(args.disk, args.max_temp, args.critical_temp,
+                                        args.temp_sensor, args.sysfs_root)
+            certificate = wipe(args.disk, args.pattern, args.passes, args.verify, args.hash_name,
+                               args.rate, args.cgroup, governor, args.scope, args.release, args.generator,
+                               affinity=affinity, io=args.io)
+        except OSError as e:
+            print(f"Wipe failed on {args.disk}: {e}", file=sys.stderr)
+            return 1
+        if args.certificate:
+            write_certificate(certificate, args.certificate)
+            print(f"Certificate written to {args.certificate}")
+        if certificate["result"] == "failed":
+            print(f"Verification failed on {args.disk}.", file=sys.stderr)
+            return 1
+        if certificate["bad_blocks"]["sectors"]:
+            print(f"Warning: {certificate['bad_blocks']['sectors']} sectors on {args.disk} could not be written; "
+                  f"see bad_blocks in the certificate.", file=sys.stderr)
+        if certificate["health"]["degraded"]:
+            print(f"Warning: {args.disk} has {len(certificate['health']['slow_zones'])} slow zones; "
+                  f"see health in the certificate.", file=sys.stderr)
+    elif args.command == "crypto-erase":
+        try:
+            certificate = crypto_erase(args.disk, args.scrub, args.psid, args.hash_name)
+        except OSError as e:
+            print(f"Crypto erase failed on {args.disk}: {e}", file=sys.stderr)
+            return 1
+        if args.certificate:
+            write_certificate(certificate, args.certificate)
+            print(f"Certificate written to {args.certificate}")
+        if certificate["result"] == "failed":
+            print(f"Key material is still present on {args.disk}.", file=sys.stderr)
+            return 1
+    elif args.command == "scrub":
+        try:
+            certificate = scrub(args.disk, args.hash_name)
+        except OSError as e:
+            print(f"Signature scrub failed on {args.disk}: {e}", file=sys.stderr)
+            return 1
+        if args.certificate:
+            write_certificate(certificate, args.certificate)
+            print(f"Certificate written to {args.certificate}")
+        if certificate["result"] == "failed":
+            print(f"Signatures are still present on {args.disk}.", file=sys.stderr)
+            return 1
+    elif args.command == "check":
+        try:
+            with open(args.certificate) as f:
+                certificate = json.load(f)
+            result = check(args.disk, certificate)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Check failed on {args.disk}: {e}", file=sys.stderr)
+            return 1
+        if result["result"] != "passed":
+            print(f"{args.disk} no longer matches its certificate: {result['mismatched_bytes'] // (1024 * 1024)} MiB "
+                  f"of {result['bytes'] // (1024 * 1024)} MiB differ"
+                  + (f", first at offset {result['mismatched_blocks'][0]}." if result['mismatched_blocks'] else "."),
+                  file=sys.stderr)
+            return 1
+        print(f"{args.disk} still matches its certificate ({result['mb_per_s']} MB/s).")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
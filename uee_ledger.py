@@ -0,0 +1,207 @@
+"""
+UEE job ledger.
+
+Every job is recorded in an indexed SQLite database: device identity,
+plan, per-phase durations, throughput and outcome. Lookups by serial,
+model, outcome and date range use indexes, so they stay fast with
+hundreds of thousands of rows. The history also predicts how long a new
+job will take from the throughput earlier jobs reached on the same model.
+A coordinator (uee_station) keeps one ledger for all stations and records
+the station each job ran on.
+"""
+import json
+import os
+import sqlite3
+import statistics
+import time
+from pathlib import Path
+
+import uee_sim
+
+LEDGER_FILE = Path("uee_ledger.db")
+HISTORY_JOBS = 20
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    started REAL NOT NULL,
+    finished REAL NOT NULL,
+    kind TEXT NOT NULL,
+    device TEXT,
+    serial TEXT,
+    model TEXT,
+    size_bytes INTEGER,
+    pattern TEXT,
+    passes INTEGER,
+    verify INTEGER,
+    filesystem TEXT,
+    outcome TEXT NOT NULL,
+    total_seconds REAL,
+    wipe_seconds REAL,
+    wipe_bytes INTEGER,
+    mb_per_s REAL,
+    verify_seconds REAL,
+    verify_mb_per_s REAL,
+    phases TEXT,
+    certificate TEXT,
+    station TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_serial ON jobs (serial, started);
+CREATE INDEX IF NOT EXISTS jobs_model ON jobs (model, started);
+CREATE INDEX IF NOT EXISTS jobs_started ON jobs (started);
+CREATE INDEX IF NOT EXISTS jobs_outcome ON jobs (outcome, started);
+"""
+STATION_INDEX = "CREATE INDEX IF NOT EXISTS jobs_station ON jobs (station, started)"
+
+def device_size_bytes(disk, sysfs_root="/sys"):
+    if uee_sim.is_sim(disk):
+        sysfs_root = uee_sim.SYSFS_ROOT
+    try:
+        with open(os.path.join(sysfs_root, "block", os.path.basename(disk), "size")) as f:
+            return int(f.read()) * 512
+    except (OSError, ValueError):
+        return None
+
+
+def format_duration(seconds):
+    if seconds is None:
+        return "unknown"
+    minutes = int(seconds + 59) // 60
+    if minutes < 60:
+        return f"{minutes}m"
+    return f"{minutes // 60}h {minutes % 60:02d}m"
+
+
+class Ledger:
+
+    def __init__(self, path=LEDGER_FILE):
+        self.path = path
+        self.db = sqlite3.connect(str(path), timeout=30)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(SCHEMA)
+        if "station" not in {row["name"] for row in self.db.execute("PRAGMA table_info(jobs)")}:
+            # ledgers from before stations
+            self.db.execute("ALTER TABLE jobs ADD COLUMN station TEXT")
+        self.db.execute(STATION_INDEX)
+
+    def close(self):
+        self.db.close()
+
+    def record(self, kind, started, outcome, device=None, serial=None, model=None, size_bytes=None,
+               pattern=None, passes=None, verify=None, filesystem=None, phases=None, certificate=None,
+               certificate_path=None, finished=None, station=None, wipe_bytes=None, wipe_seconds=None):
+        """
+        Insert a finished job; throughput is taken from its certificate,
+        or from wipe_bytes/wipe_seconds for jobs without one (Android).
+        """
+        finished = finished or time.time()
+        mb_per_s = verify_seconds = verify_mb_per_s = None
+        if wipe_bytes and wipe_seconds:
+            mb_per_s = round(wipe_bytes / wipe_seconds / 1e6, 2)
+        if certificate:
+            pass_results = certificate.get("passes") or []
+            wipe_bytes = sum(p["bytes"] for p in pass_results)
+            wipe_seconds = sum(p["seconds"] for p in pass_results)
+            if wipe_seconds:
+                mb_per_s = round(wipe_bytes / wipe_seconds / 1e6, 2)
+            verification = certificate.get("verification") or {}
+            verify_seconds = verification.get("seconds")
+            verify_mb_per_s = verification.get("mb_per_s")
+            size_bytes = size_bytes or certificate.get("size_bytes")
+        with self.db:
+            cursor = self.db.execute(
+                "INSERT INTO jobs (started, finished, kind, device, serial, model, size_bytes, pattern, passes,"
+                " verify, filesystem, outcome, total_seconds, wipe_seconds, wipe_bytes, mb_per_s,"
+                " verify_seconds, verify_mb_per_s, phases, certificate, station)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (started, finished, kind, device, serial or None, model or None, size_bytes, pattern, passes,
+                 None if verify is None else int(bool(verify)), filesystem, outcome,
+                 round(finished - started, 3), wipe_seconds, wipe_bytes, mb_per_s, verify_seconds, verify_mb_per_s,
+                 json.dumps(phases or {}), certificate_path, station))
+        return cursor.lastrowid
+
+    def query(self, serial=None, model=None, since=None, until=None, limit=50, outcome=None, station=None):
+        clauses, params = [], []
+        if station:
+            clauses.append("station = ?")
+            params.append(station)
+        if outcome:
+            clauses.append("outcome = ?")
+            params.append(outcome)
+        if serial:
+            clauses.append("serial = ?")
+            params.append(serial)
+        if model:
+            clauses.append("model = ?")
+            params.append(model)
+        if since is not None:
+            clauses.append("started >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("started < ?")
+            params.append(until)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self.db.execute(f"SELECT * FROM jobs {where} ORDER BY started DESC LIMIT ?", params + [limit])
+        return [dict(row) for row in rows]
+
+    def throughput(self, model):
+        """Median MB/s of the recent successful jobs on model, None without history."""
+        if not model:
+            return None
+        rows = self.db.execute(
+            "SELECT mb_per_s FROM jobs WHERE model = ? AND kind = 'format' AND outcome = 'success'"
+            " AND mb_per_s IS NOT NULL"
+            " ORDER BY started DESC LIMIT ?", (model, HISTORY_JOBS)).fetchall()
+        return statistics.median(row["mb_per_s"] for row in rows) if rows else None
+
+    def predict(self, model, size_bytes, passes, verify=False):
+        """
+        Predicted (seconds, number of jobs it is based on) for a job on
+        size_bytes of model; seconds is None without history.
+        """
+        if not model or not size_bytes:
+            return None, 0
+        rows = self.db.execute(
+            "SELECT mb_per_s, verify_mb_per_s, total_seconds, wipe_seconds, verify_seconds FROM jobs"
+            " WHERE model = ? AND kind = 'format' AND outcome = 'success' AND mb_per_s IS NOT NULL"
+            " ORDER BY started DESC LIMIT ?", (model, HISTORY_JOBS)).fetchall()
+        if not rows:
+            return None, 0
+        rate = statistics.median(row["mb_per_s"] for row in rows) * 1e6
+        seconds = size_bytes * passes / rate
+        if verify:
+            verify_rates = [row["verify_mb_per_s"] for row in rows if row["verify_mb_per_s"]]
+            seconds += size_bytes / (statistics.median(verify_rates) * 1e6 if verify_rates else rate)
+        # unmount, partitioning, mkfs...
+        seconds += statistics.median(
+            max(0.0, row["total_seconds"] - row["wipe_seconds"] - (row["verify_seconds"] or 0)) for row in rows)
+        return seconds, len(rows)
+
+
+def android_jobs(report):
+    """record() arguments for each device of an Android wipe report (uee_android.py wipe --report)."""
+    jobs = []
+    for device in (report or {}).get("devices", []):
+        overwrite = device.get("overwrite") or {}
+        jobs.append({"kind": 'fastboot-wipe' if device.get("path") == 'fastboot' else 'android-wipe',
+                     "started": device["started"], "finished": device["finished"],
+                     "outcome": 'success' if device.get("reset") and not device.get("error") else 'failed',
+                     "device": device.get("path"), "serial": device["serial"], "model": device.get("model"),
+                     "size_bytes": overwrite.get("target_bytes"), "pattern": overwrite.get("pattern"),
+                     "passes": 1 if overwrite else 0, "phases": device.get("phases"),
+                     "wipe_bytes": overwrite.get("bytes"), "wipe_seconds": overwrite.get("seconds")})
+    return jobs
+
+
+def load_report(path):
+    """An Android wipe report, None when it is missing or unreadable."""
+    return load_certificate(path)
+
+
+def load_certificate(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError, TypeError):
+        return None
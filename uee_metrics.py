@@ -0,0 +1,330 @@
+"""
+UEE instrumentation.
+
+Active jobs publish their state (device, phase, progress) as small JSON
+files in a run directory. The sampler reads /sys/block/<dev>/stat for
+every active job, so throughput, in-flight I/O and latency reflect what
+the media actually completed rather than page-cache writes. The same
+snapshot is served as OpenMetrics on localhost and read by the CLI/TUI.
+
+Usage: python3 uee_metrics.py [--port 9477] [--interval 1.0]
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import uee_sim
+
+RUN_DIR = Path(os.environ.get("UEE_RUN_DIR", "/run/uee"))
+SYSFS_ROOT = Path("/sys")
+SECTOR_SIZE = 512
+DEFAULT_PORT = 9477
+DEFAULT_INTERVAL = 1.0
+LATENCY_BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5]
+CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+STAT_FIELDS = ["read_ios", "read_merges", "read_sectors", "read_ticks",
+               "write_ios", "write_merges", "write_sectors", "write_ticks",
+               "in_flight", "io_ticks", "time_in_queue"]
+
+
+def _jobs_dir(run_dir=None):
+    return Path(run_dir or RUN_DIR) / "jobs"
+
+
+def publish_job(device, run_dir=None, **state):
+    """Create or update the state file of the job running on device."""
+    jobs = _jobs_dir(run_dir)
+    try:
+        jobs.mkdir(parents=True, exist_ok=True)
+        path = jobs / (os.path.basename(device) + ".json")
+        current = {}
+        if path.exists():
+            with open(path) as f:
+                current = json.load(f)
+        current.update(state)
+        current.update({"device": device, "pid": os.getpid(), "updated": time.time()})
+        tmp = path.with_suffix(".tmp")
+        with open(tmp, "w") as f:
+            json.dump(current, f)
+        os.replace(tmp, path)
+    except (OSError, ValueError):
+        # metrics must never break a wipe
+        pass
+
+
+def clear_job(device, run_dir=None):
+    try:
+        (_jobs_dir(run_dir) / (os.path.basename(device) + ".json")).unlink()
+    except OSError:
+        pass
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+
+def active_jobs(run_dir=None):
+    jobs = []
+    jobs_dir = _jobs_dir(run_dir)
+    if not jobs_dir.is_dir():
+        return jobs
+    for path in sorted(jobs_dir.glob("*.json")):
+        try:
+            with open(path) as f:
+                job = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if _alive(job.get("pid", 0)):
+            jobs.append(job)
+        else:
+            clear_job(path.stem, run_dir)
+    return jobs
+
+
+def read_diskstats(dev, sysfs_root=SYSFS_ROOT):
+    """Return the /sys/block/<dev>/stat counters of dev as a dict."""
+    if uee_sim.is_sim(dev):
+        sysfs_root = uee_sim.SYSFS_ROOT
+    name = os.path.basename(os.path.realpath(dev)) if str(dev).startswith("/dev/") else dev
+    with open(Path(sysfs_root) / "block" / name / "stat") as f:
+        values = [int(v) for v in f.read().split()]
+    return dict(zip(STAT_FIELDS, values))
+
+
+class DeviceStats:
+    """Running counters, rates and a write latency histogram for one device."""
+
+    def __init__(self, device):
+        self.device = device
+        self.last = None
+        self.last_time = None
+        self.counters = {}
+        self.write_rate = 0.0
+        self.read_rate = 0.0
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.latency_count = 0
+        self.latency_sum = 0.0
+
+    def update(self, counters, now):
+        if self.last is not None and now > self.last_time:
+            elapsed = now - self.last_time
+            d_write = counters["write_sectors"] - self.last["write_sectors"]
+            d_read = counters["read_sectors"] - self.last["read_sectors"]
+            self.write_rate = max(0, d_write) * SECTOR_SIZE / elapsed
+            self.read_rate = max(0, d_read) * SECTOR_SIZE / elapsed
+
+            # diskstats only has totals, so every I/O completed in the
+            # interval is counted at the interval's mean latency
+            d_ios = counters["write_ios"] - self.last["write_ios"]
+            d_ticks = counters["write_ticks"] - self.last["write_ticks"]
+            if d_ios > 0 and d_ticks >= 0:
+                mean = d_ticks / 1000.0 / d_ios
+                for i, bound in enumerate(LATENCY_BUCKETS):
+                    if mean <= bound:
+                        self.buckets[i] += d_ios
+                        break
+                self.latency_count += d_ios
+                self.latency_sum += d_ticks / 1000.0
+        self.last = counters
+        self.last_time = now
+        self.counters = counters
+
+
+class Sampler:
+    """Samples diskstats for every active job; thread-safe snapshots."""
+
+    def __init__(self, run_dir=None, sysfs_root=SYSFS_ROOT, interval=DEFAULT_INTERVAL):
+        self.run_dir = run_dir
+        self.sysfs_root = sysfs_root
+        self.interval = interval
+        self.stats = {}
+        self.jobs = {}
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+
+    def sample(self):
+        jobs = {job["device"]: job for job in active_jobs(self.run_dir)}
+        now = time.monotonic()
+        with self.lock:
+            for device in jobs:
+                try:
+                    counters = read_diskstats(device, self.sysfs_root)
+                except (OSError, ValueError):
+                    continue
+                self.stats.setdefault(device, DeviceStats(device)).update(counters, now)
+            for device in list(self.stats):
+                if device not in jobs:
+                    del self.stats[device]
+            self.jobs = jobs
+
+    def snapshot(self):
+        """List of per-device dicts: job state merged with media statistics."""
+        with self.lock:
+            rows = []
+            for device, job in sorted(self.jobs.items()):
+                stats = self.stats.get(device)
+                row = dict(job)
+                if stats is not None:
+                    row.update({
+                        "written_bytes": stats.counters.get("write_sectors", 0) * SECTOR_SIZE,
+                        "read_bytes": stats.counters.get("read_sectors", 0) * SECTOR_SIZE,
+                        "in_flight": stats.counters.get("in_flight", 0),
+                        "write_mb_per_s": round(stats.write_rate / 1e6, 2),
+                        "read_mb_per_s": round(stats.read_rate / 1e6, 2),
+                        "latency_buckets": list(stats.buckets),
+                        "latency_count": stats.latency_count,
+                        "latency_sum": stats.latency_sum,
+                    })
+                rows.append(row)
+            return rows
+
+    def run(self):
+        while not self.stopped.is_set():
+            self.sample()
+            self.stopped.wait(self.interval)
+
+    def start(self):
+        thread = threading.Thread(target=self.run, daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self.stopped.set()
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(**labels):
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+def render_openmetrics(rows):
+    lines = []
+
+    def family(name, kind, help_text):
+        lines.append(f"# TYPE {name} {kind}")
+        lines.append(f"# HELP {name} {help_text}")
+
+    family("uee_job", "info", "Wipe job running on a device.")
+    for row in rows:
+        labels = _labels(device=row["device"], model=row.get("model") or "",
+                         serial=row.get("serial") or "", phase=row.get("phase") or "")
+        lines.append(f"uee_job_info{labels} 1")
+
+    family("uee_job_done_bytes", "gauge", "Bytes completed in the current job phase.")
+    for row in rows:
+        if "done" in row:
+            lines.append(f"uee_job_done_bytes{_labels(device=row['device'])} {row['done']}")
+    family("uee_job_total_bytes", "gauge", "Bytes to process in the current job phase.")
+    for row in rows:
+        if "total" in row:
+            lines.append(f"uee_job_total_bytes{_labels(device=row['device'])} {row['total']}")
+
+    family("uee_job_rate_limit_bytes_per_second", "gauge", "Effective throughput cap of the job (0 = none).")
+    for row in rows:
+        lines.append(f"uee_job_rate_limit_bytes_per_second{_labels(device=row['device'])} {row.get('rate_limit', 0)}")
+
+    family("uee_device_temperature_celsius", "gauge", "Drive temperature reported by the thermal governor.")
+    for row in rows:
+        if row.get("temperature") is not None:
+            lines.append(f"uee_device_temperature_celsius{_labels(device=row['device'])} {row['temperature']}")
+
+    family("uee_job_slow_zones", "gauge", "Slow zones found so far in the current job phase (uee_profile).")
+    for row in rows:
+        if "slow_zones" in row:
+            lines.append(f"uee_job_slow_zones{_labels(device=row['device'])} {row['slow_zones']}")
+    family("uee_job_stragglers", "gauge", "Straggler I/Os found so far in the current job phase.")
+    for row in rows:
+        if "stragglers" in row:
+            lines.append(f"uee_job_stragglers{_labels(device=row['device'])} {row['stragglers']}")
+
+    media = [row for row in rows if "written_bytes" in row]
+    family("uee_device_written_bytes", "counter", "Bytes written to the media (diskstats).")
+    for row in media:
+        lines.append(f"uee_device_written_bytes_total{_labels(device=row['device'])} {row['written_bytes']}")
+    family("uee_device_read_bytes", "counter", "Bytes read from the media (diskstats).")
+    for row in media:
+        lines.append(f"uee_device_read_bytes_total{_labels(device=row['device'])} {row['read_bytes']}")
+    family("uee_device_in_flight_ios", "gauge", "I/Os currently in flight.")
+    for row in media:
+        lines.append(f"uee_device_in_flight_ios{_labels(device=row['device'])} {row['in_flight']}")
+    family("uee_device_write_throughput_bytes_per_second", "gauge", "Media write rate over the last sample.")
+    for row in media:
+        lines.append(f"uee_device_write_throughput_bytes_per_second{_labels(device=row['device'])} "
+                     f"{row['write_mb_per_s'] * 1e6:.0f}")
+    family("uee_device_read_throughput_bytes_per_second", "gauge", "Media read rate over the last sample.")
+    for row in media:
+        lines.append(f"uee_device_read_throughput_bytes_per_second{_labels(device=row['device'])} "
+                     f"{row['read_mb_per_s'] * 1e6:.0f}")
+
+    family("uee_device_write_latency_seconds", "histogram", "Write latency (interval means from diskstats).")
+    for row in media:
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS, row["latency_buckets"]):
+            cumulative += count
+            lines.append(f"uee_device_write_latency_seconds_bucket{_labels(device=row['device'], le=bound)} {cumulative}")
+        lines.append(f"uee_device_write_latency_seconds_bucket{_labels(device=row['device'], le='+Inf')} {row['latency_count']}")
+        lines.append(f"uee_device_write_latency_seconds_count{_labels(device=row['device'])} {row['latency_count']}")
+        lines.append(f"uee_device_write_latency_seconds_sum{_labels(device=row['device'])} {row['latency_sum']:.6f}")
+
+    lines.append("# EOF")
+    return "\n".join(lines) + "\n"
+
+
+def make_server(sampler, port=DEFAULT_PORT, host="127.0.0.1"):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path not in ("/metrics", "/"):
+                self.send_error(404)
+                return
+            body = render_openmetrics(sampler.snapshot()).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return ThreadingHTTPServer((host, port), Handler)
+
+
+def serve(port=DEFAULT_PORT, interval=DEFAULT_INTERVAL, run_dir=None):
+    sampler = Sampler(run_dir=run_dir, interval=interval)
+    sampler.start()
+    server = make_server(sampler, port)
+    print(f"Serving OpenMetrics on http://127.0.0.1:{port}/metrics", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sampler.stop()
+        server.server_close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="uee_metrics.py", description="UEE OpenMetrics exporter")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--interval", type=float, default=DEFAULT_INTERVAL)
+    args = parser.parse_args(argv)
+    serve(args.port, args.interval)
+    return 0
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""
+UEE NUMA placement.
+
+On multi-socket stations each HBA or NVMe controller hangs off one
+socket. Before it allocates any buffer, the engine pins itself to the
+CPUs of the node its device's controller is attached to, so pattern
+generation, hashing and verification (and the threads started for them)
+run there, and the buffers, placed on first touch, live in that node's
+memory instead of crossing the interconnect for every block. That
+includes the constant pattern buffers: the shared pool (uee_pool) keeps
+one file per node, written by the first engine pinned there, so an
+engine never maps pattern pages that another node created.
+
+The node is the nearest numa_node attribute above <root>/block/<dev>/device
+(the controller's PCI function). -1 or no attribute, as on single-node
+machines and virtual devices, means no placement.
+"""
+import os
+
+SYSFS_ROOT = "/sys"
+MODES = ['auto', 'off']
+
+_node = None
+
+
+def parse_cpulist(text):
+    """'0-3,8-11' -> [0, 1, 2, 3, 8, 9, 10, 11]"""
+    cpus = []
+    for part in text.strip().split(","):
+        if not part:
+            continue
+        first, _, last = part.partition("-")
+        cpus.extend(range(int(first), int(last or first) + 1))
+    return cpus
+
+
+def format_cpulist(cpus):
+    ranges = []
+    for cpu in sorted(cpus):
+        if ranges and cpu == ranges[-1][1] + 1:
+            ranges[-1][1] = cpu
+        else:
+            ranges.append([cpu, cpu])
+    return ",".join(f"{a}-{b}" if a != b else str(a) for a, b in ranges)
+
+
+def device_node(device, sysfs_root=SYSFS_ROOT):
+    """NUMA node of the controller device is attached to, or None."""
+    name = os.path.basename(os.path.realpath(device))
+    path = os.path.join(sysfs_root, "class", "block", name)
+    if not os.path.exists(path):
+        return None
+    if os.path.exists(os.path.join(path, "partition")):
+        # sda1 -> sda
+        path = os.path.dirname(os.path.realpath(path))
+    path = os.path.realpath(os.path.join(path, "device"))
+    devices_root = os.path.realpath(os.path.join(sysfs_root, "devices"))
+    while path.startswith(devices_root + os.sep):
+        try:
+            with open(os.path.join(path, "numa_node")) as f:
+                node = int(f.read().strip())
+            return node if node >= 0 else None
+        except (OSError, ValueError):
+            path = os.path.dirname(path)
+    return None
+
+
+def node_cpus(node, sysfs_root=SYSFS_ROOT):
+    """CPUs of node this process may run on (the cgroup cpuset may hide some)."""
+    try:
+        with open(os.path.join(sysfs_root, "devices", "system", "node", f"node{node}", "cpulist")) as f:
+            cpus = parse_cpulist(f.read())
+    except (OSError, ValueError):
+        return []
+    allowed = os.sched_getaffinity(0)
+    return [cpu for cpu in cpus if cpu in allowed]
+
+
+def nodes(sysfs_root=SYSFS_ROOT):
+    """Nodes that have CPUs, e.g. [0, 1]."""
+    try:
+        with open(os.path.join(sysfs_root, "devices", "system", "node", "has_cpu")) as f:
+            return parse_cpulist(f.read())
+    except (OSError, ValueError):
+        return []
+
+
+def current_node():
+    """Node this process was placed on, or None."""
+    return _node
+
+
+def place(device, mode='auto', sysfs_root=SYSFS_ROOT):
+    """
+    Pin this process to the CPUs of device's node. Call it before any
+    buffer or thread is created. Returns {"node", "cpus"} or None.
+    """
+    global _node
+    if mode == 'off':
+        return None
+    node = device_node(device, sysfs_root)
+    if node is None:
+        return None
+    cpus = node_cpus(node, sysfs_root)
+    if not cpus:
+        # memory-only node
+        return None
+    os.sched_setaffinity(0, cpus)
+    _node = node
+    return {"node": node, "cpus": format_cpulist(cpus)}
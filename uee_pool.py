@@ -0,0 +1,196 @@
+"""
+UEE shared pattern buffers.
+
+Constant pattern data (zeros, ones) is the same in every engine process,
+so instead of each one allocating its own copy, the first process to need
+a pattern creates it once as a shared memory file and every other process
+maps the same pages read-only. The file is created on hugetlbfs when it
+is mounted with free hugepages (two 2 MiB pages instead of 1024 4 KiB
+ones for a 4 MiB block), otherwise in the run directory (a tmpfs under
+/run) with a transparent hugepage hint. Files are named by pattern and
+size, with the NUMA node for pinned engines (uee_engine.pattern_view):
+tmpfs and hugetlbfs pages sit on the node of the process that first
+wrote them, so each node gets its own copy. They stay in the pool for
+later jobs; they are only a few MiB, and 'uee_pool.py purge' removes
+them.
+
+What is in a pool file ends up on the disk, so the pool directories are
+private to the engine's user (mode 0700). A file is only used when it is
+a regular file, not a symlink, owned by that user, writable by no one
+else and holds exactly what make() returns; anything else is replaced.
+"""
+import argparse
+import mmap
+import os
+import stat
+import sys
+from pathlib import Path
+
+import uee_metrics
+
+HUGETLB_DIR = Path("/dev/hugepages")
+POOL_DIRS = [HUGETLB_DIR / "uee", uee_metrics.RUN_DIR / "pool"]
+PREFIX = "uee-pattern-"
+HUGEPAGE_SIZE = 2 * 1024 * 1024
+
+_buffers = {}
+
+
+class SharedBuffer:
+    """One read-only mapping of a pool file."""
+
+    def __init__(self, path, size, hugetlb):
+        self.path = path
+        self.size = size
+        self.hugetlb = hugetlb
+        fd = os.open(path, os.O_RDONLY | os.O_NOFOLLOW)
+        try:
+            info = os.fstat(fd)
+            if (not stat.S_ISREG(info.st_mode) or info.st_uid != os.geteuid()
+                    or info.st_mode & 0o022 or info.st_size != size):
+                raise ValueError(f"{path} is not a private pool file")
+            self.map = mmap.mmap(fd, size, mmap.MAP_SHARED, mmap.PROT_READ)
+        finally:
+            os.close(fd)
+        if not hugetlb and hasattr(mmap, "MADV_HUGEPAGE"):
+            try:
+                self.map.madvise(mmap.MADV_HUGEPAGE)
+            except OSError:
+                pass
+        self.view = memoryview(self.map)
+
+
+def _is_hugetlbfs(directory):
+    try:
+        with open("/proc/mounts") as f:
+            return any(line.split()[1] == str(directory) and line.split()[2] == "hugetlbfs" for line in f)
+    except OSError:
+        return False
+
+
+def _pool_dir(directory):
+    """directory, created if needed, when it is ours alone; None otherwise."""
+    try:
+        directory.mkdir(mode=0o700, parents=True, exist_ok=True)
+        info = os.lstat(directory)
+    except OSError:
+        return None
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.geteuid() or info.st_mode & 0o077:
+        return None
+    return directory
+
+
+def _create(path, size, make, hugetlb):
+    """Fill a private temporary file, then rename it into place so readers never see it half written."""
+    tmp = path.with_name(f".{path.name}.{os.getpid()}")
+    fd = os.open(tmp, os.O_RDWR | os.O_CREAT | os.O_EXCL | os.O_NOFOLLOW, 0o600)
+    try:
+        os.ftruncate(fd, size)
+        # hugetlbfs files can only be filled through a mapping
+        with mmap.mmap(fd, size, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE) as m:
+            m[:] = make()
+        os.rename(tmp, path)
+    except BaseException:
+        os.close(fd)
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+    os.close(fd)
+
+
+def shared_buffer(name, size, make):
+    """
+    Shared read-only buffer of size bytes whose content make() returns,
+    or None when no pool directory is usable (callers keep a private copy).
+    """
+    key = (name, size)
+    if key in _buffers:
+        return _buffers[key]
+    for directory in POOL_DIRS:
+        hugetlb = _is_hugetlbfs(directory.parent)
+        if directory.parent == HUGETLB_DIR and (not hugetlb or size % HUGEPAGE_SIZE):
+            continue
+        if _pool_dir(directory) is None:
+            continue
+        path = directory / f"{PREFIX}{name}-{size}"
+        try:
+            _buffers[key] = _open_checked(path, size, make, hugetlb)
+            return _buffers[key]
+        except (OSError, ValueError):
+            # e.g. no free hugepages left: try the next directory
+            continue
+    return None
+
+
+def _open_checked(path, size, make, hugetlb):
+    """Map path, (re)creating it unless it is a private file holding exactly make()."""
+    try:
+        buffer = SharedBuffer(path, size, hugetlb)
+        if buffer.view == make():
+            return buffer
+        buffer.view.release()
+        buffer.map.close()
+    except (OSError, ValueError):
+        # missing, foreign or tampered with
+        pass
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+    _create(path, size, make, hugetlb)
+    return SharedBuffer(path, size, hugetlb)
+
+
+def purge():
+    removed = []
+    for directory in POOL_DIRS:
+        for path in directory.glob(PREFIX + "*") if directory.is_dir() else []:
+            path.unlink()
+            removed.append(str(path))
+    return removed
+
+
+def page_size(buffer):
+    """Page size backing buffer's mapping in this process, from /proc/self/smaps."""
+    try:
+        with open("/proc/self/smaps") as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return None
+    for i, line in enumerate(lines):
+        if line.endswith(str(buffer.path)):
+            info = {}
+            for entry in lines[i + 1:i + 30]:
+                key, _, value = entry.partition(":")
+                if " " in key.strip() or not value:
+                    break
+                info[key] = value.strip()
+            if info.get("KernelPageSize") != "4 kB":
+                return info.get("KernelPageSize")
+            if any(info.get(k, "0 kB") != "0 kB" for k in ("ShmemPmdMapped", "FilePmdMapped")):
+                return "2048 kB (THP)"
+            return "4 kB"
+    return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="uee_pool.py", description="UEE shared pattern buffers")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("list", help="show the pattern files in the pool")
+    sub.add_parser("purge", help="remove the pattern files from the pool")
+    args = parser.parse_args(argv)
+
+    if args.command == "purge":
+        for path in purge():
+            print(f"Removed {path}")
+    else:
+        for directory in POOL_DIRS:
+            for path in sorted(directory.glob(PREFIX + "*")) if directory.is_dir() else []:
+                print(f"{path}  {path.stat().st_size // 1024} KiB")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,147 @@
+"""
+UEE seeded random streams.
+
+Random passes are written from a keystream derived from a per-job seed
+instead of /dev/urandom, so the data never has to be stored: the
+verifier, or an audit months later, regenerates the identical bytes for
+any offset from the seed in the certificate and compares block by block.
+
+Both generators are seekable, every byte depends only on the key and its
+offset on the device:
+  aes-256-ctr  AES in counter mode from libcrypto (via ctypes), counter =
+               offset / 16; several GB/s per core with AES-NI
+  shake128     SHAKE128(key || chunk index) per 64 KiB chunk, stdlib only
+
+Each pass has its own key, derived from the job seed and the pass number.
+Blocks are generated ahead on a thread pool (hashlib and ctypes both
+release the GIL), so generation keeps up with the disk on both the write
+and the read side. The pool has at most MAX_WORKERS threads: a few cores
+outrun any single drive, and each worker holds a block in the ring, so
+a job's buffers stay a few blocks however many CPUs the station has.
+"""
+import collections
+import ctypes
+import ctypes.util
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import uee_target
+
+SEED_BYTES = 32
+SHAKE_CHUNK = 64 * 1024
+AES_BLOCK = 16
+MAX_WORKERS = 4
+
+
+def _load_libcrypto():
+    path = ctypes.util.find_library("crypto")
+    if not path:
+        return None
+    try:
+        lib = ctypes.CDLL(path)
+        lib.EVP_aes_256_ctr.restype = ctypes.c_void_p
+        lib.EVP_CIPHER_CTX_new.restype = ctypes.c_void_p
+        lib.EVP_CIPHER_CTX_free.argtypes = [ctypes.c_void_p]
+        lib.EVP_EncryptInit_ex.argtypes = [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_void_p,
+                                           ctypes.c_char_p, ctypes.c_char_p]
+        lib.EVP_EncryptUpdate.argtypes = [ctypes.c_void_p, ctypes.c_void_p, ctypes.POINTER(ctypes.c_int),
+                                          ctypes.c_void_p, ctypes.c_int]
+        return lib
+    except (OSError, AttributeError):
+        return None
+
+
+_crypto = _load_libcrypto()
+GENERATORS = (['aes-256-ctr'] if _crypto else []) + ['shake128']
+
+
+class AesCtrStream:
+    name = 'aes-256-ctr'
+
+    def __init__(self, key):
+        if _crypto is None:
+            raise ValueError("aes-256-ctr needs libcrypto, which was not found")
+        self.key = key
+        self.zeros = bytes(AES_BLOCK)
+
+    def fill(self, offset, view):
+        """Write the keystream bytes for [offset, offset + len(view)) into view."""
+        if len(self.zeros) < len(view):
+            self.zeros = bytes(len(view))
+        counter, skip = divmod(offset, AES_BLOCK)
+        iv = (counter % 2 ** 128).to_bytes(AES_BLOCK, 'big')
+        out = (ctypes.c_char * len(view)).from_buffer(view)
+        written = ctypes.c_int()
+        ctx = _crypto.EVP_CIPHER_CTX_new()
+        try:
+            if not _crypto.EVP_EncryptInit_ex(ctx, _crypto.EVP_aes_256_ctr(), None, self.key, iv):
+                raise ValueError("EVP_EncryptInit_ex failed")
+            if skip:
+                scratch = ctypes.create_string_buffer(skip)
+                _crypto.EVP_EncryptUpdate(ctx, scratch, ctypes.byref(written), self.zeros, skip)
+            if not _crypto.EVP_EncryptUpdate(ctx, out, ctypes.byref(written), self.zeros, len(view)):
+                raise ValueError("EVP_EncryptUpdate failed")
+        finally:
+            _crypto.EVP_CIPHER_CTX_free(ctx)
+
+
+class ShakeStream:
+    name = 'shake128'
+
+    def __init__(self, key):
+        self.key = key
+
+    def fill(self, offset, view):
+        position = 0
+        while position < len(view):
+            index, skip = divmod(offset + position, SHAKE_CHUNK)
+            take = min(SHAKE_CHUNK - skip, len(view) - position)
+            data = hashlib.shake_128(self.key + index.to_bytes(8, 'little')).digest(skip + take)
+            view[position:position + take] = data[skip:]
+            position += take
+
+
+STREAMS = {AesCtrStream.name: AesCtrStream, ShakeStream.name: ShakeStream}
+
+
+def new_seed():
+    return os.urandom(SEED_BYTES).hex()
+
+
+def stream(generator, seed, pass_number):
+    """The keystream of one pass of a job with seed (hex)."""
+    if generator not in STREAMS:
+        raise ValueError(f"unknown random generator '{generator}'")
+    key = hashlib.sha256(bytes.fromhex(seed) + b"uee-pass" + pass_number.to_bytes(4, 'little')).digest()
+    return STREAMS[generator](key)
+
+
+def blocks(source, extents, block_size, workers=None, allocate=uee_target.aligned_buffer):
+    """
+    Yield the keystream for extents in block_size pieces, in the order the
+    engine writes them. Each view is valid until the next one is requested.
+    Buffers come from allocate: page aligned for O_DIRECT writes by default.
+    """
+    # the CPUs this process is pinned to (uee_numa), not all of them
+    workers = workers or min(MAX_WORKERS, len(os.sched_getaffinity(0)))
+    depth = workers + 1
+    ring = [allocate(block_size) for _ in range(depth + 1)]
+    pieces = ((offset, min(block_size, start + length - offset))
+              for start, length in extents for offset in range(start, start + length, block_size))
+
+    def generate(slot, offset, n):
+        view = memoryview(ring[slot])[:n]
+        source.fill(offset, view)
+        return view
+
+    pending = collections.deque()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="uee-prng") as pool:
+        slot = 0
+        for offset, n in pieces:
+            pending.append(pool.submit(generate, slot, offset, n))
+            slot = (slot + 1) % len(ring)
+            if len(pending) >= depth:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
@@ -0,0 +1,194 @@
+"""
+UEE throughput profile.
+
+A dying drive usually shows itself in where it is slow long before it
+returns hard errors: a region whose throughput collapses, or single I/Os
+that take many times longer than their neighbours. dd's one progress
+line averages that away.
+
+The profile splits the device into at most BUCKETS fixed-size LBA
+buckets (of at least MIN_BUCKET) and keeps, per bucket, the sectors and seconds of the I/O that
+landed in it, in two flat arrays: 8 bytes a bucket, 4 KiB per pass
+whatever the size of the drive.
+
+  slow zone   a bucket whose throughput is below SLOW_FRACTION of the
+              median of the WINDOW buckets on either side, so the gradual
+              outer-to-inner decline of an HDD is not flagged (live, only
+              the buckets before it are known)
+  straggler   a single I/O that takes STRAGGLER_FACTOR times as long as
+              the pass's throughput so far predicts, and at least
+              STRAGGLER_SECONDS; its bucket is charged the predicted time,
+              so one stall does not make a slow zone
+
+Both are reported as they happen and summarized for the certificate.
+A pass that writes several regions at once (zoned devices) is profiled
+with parallel=True: a bucket is judged once it is complete, against the
+buckets on both sides, instead of when the pass moves on from it.
+"""
+import array
+import heapq
+import statistics
+
+import uee_metrics
+import uee_trace
+
+BUCKETS = 512
+# enough I/Os per bucket that host jitter on single requests averages out
+MIN_BUCKET = 64 * 1024 * 1024
+SECTOR = 512
+WINDOW = 8
+MIN_NEIGHBOURS = 3
+SLOW_FRACTION = 0.5
+STRAGGLER_FACTOR = 8.0
+STRAGGLER_SECONDS = 0.05
+MAX_STRAGGLERS = 16
+# live reports per pass; the summary has all of them
+MAX_REPORTS = 16
+
+
+def _gib(offset):
+    return f"{offset / 2 ** 30:.1f} GiB"
+
+
+class Profile:
+    """Throughput per LBA bucket of one pass over a device of size bytes."""
+
+    def __init__(self, label, size, buckets=BUCKETS, device=None, parallel=False):
+        self.label = label
+        self.size = size
+        self.device = device
+        bucket = max(-(-size // buckets), MIN_BUCKET)
+        self.bucket_size = -(-bucket // MIN_BUCKET) * MIN_BUCKET
+        count = max(-(-size // self.bucket_size), 1)
+        self.sectors = array.array('I', bytes(4 * count))
+        self.seconds = array.array('f', bytes(4 * count))
+        self.total_bytes = 0
+        self.total_seconds = 0.0
+        self.current = None
+        self.judged = bytearray(count) if parallel else None
+        self.last_slow = None
+        self.live_slow = 0
+        self.stragglers = 0
+        self.worst = []
+        self.reports = 0
+
+    def rate(self, i):
+        """MB/s of bucket i, None if nothing was timed in it."""
+        seconds = self.seconds[i]
+        return self.sectors[i] * SECTOR / seconds / 1e6 if seconds > 0 else None
+
+    def add(self, offset, nbytes, seconds):
+        """Account one I/O of nbytes at offset that took seconds."""
+        if nbytes <= 0:
+            return
+        if self.total_seconds > 0:
+            expected = nbytes / (self.total_bytes / self.total_seconds)
+            if seconds >= STRAGGLER_SECONDS and seconds > STRAGGLER_FACTOR * expected:
+                self._straggler(offset, nbytes, seconds, expected)
+                # a single stall is not a slow zone: the bucket gets the expected time
+                seconds = expected
+        self.total_bytes += nbytes
+        self.total_seconds += seconds
+        end = offset + nbytes
+        while offset < end:
+            i = min(offset // self.bucket_size, len(self.sectors) - 1)
+            n = end - offset if i == len(self.sectors) - 1 else min(end, (i + 1) * self.bucket_size) - offset
+            if self.judged is None and self.current is not None and i != self.current:
+                self._finished(self.current)
+            self.current = i
+            self.sectors[i] += n // SECTOR
+            self.seconds[i] += seconds * n / nbytes
+            if self.judged is not None and not self.judged[i] and self.sectors[i] * SECTOR >= self._length(i):
+                self.judged[i] = 1
+                self._finished(i, before_only=False)
+            offset += n
+
+    def _length(self, i):
+        return min(self.bucket_size, self.size - i * self.bucket_size)
+
+    def _report(self, name, message, **args):
+        uee_trace.emit("i", name, args=args)
+        if self.device:
+            uee_metrics.publish_job(self.device, slow_zones=self.live_slow, stragglers=self.stragglers)
+        self.reports += 1
+        if self.reports <= MAX_REPORTS:
+            print(f"{self.label}: {message}", flush=True)
+
+    def _straggler(self, offset, nbytes, seconds, expected):
+        self.stragglers += 1
+        entry = (seconds, offset, nbytes)
+        if len(self.worst) < MAX_STRAGGLERS:
+            heapq.heappush(self.worst, entry)
+        elif entry > self.worst[0]:
+            heapq.heapreplace(self.worst, entry)
+        self._report("straggler", f"Straggler at {_gib(offset)}: {seconds * 1000:.0f} ms for {nbytes // 1024} KiB "
+                     f"(expected {expected * 1000:.1f} ms)", offset=offset, seconds=round(seconds, 4))
+
+    def _neighbours(self, i, before_only=False):
+        lo, hi = max(i - WINDOW, 0), i if before_only else min(i + WINDOW + 1, len(self.sectors))
+        rates = [self.rate(j) for j in range(lo, hi) if j != i]
+        return [r for r in rates if r is not None]
+
+    def _slow(self, i, before_only=False):
+        """(rate, median of the neighbours) when bucket i is a slow zone, else None."""
+        rate = self.rate(i)
+        if rate is None or self.sectors[i] * SECTOR < self.bucket_size // 2:
+            # too little of the bucket was timed to judge it
+            return None
+        rates = self._neighbours(i, before_only)
+        if len(rates) < MIN_NEIGHBOURS:
+            return None
+        around = statistics.median(rates)
+        return (rate, around) if rate < SLOW_FRACTION * around else None
+
+    def _finished(self, i, before_only=True):
+        slow = self._slow(i, before_only)
+        if slow:
+            continued, self.last_slow = self.last_slow == i - 1, i
+            if continued:
+                return
+            self.live_slow += 1
+            self._report("slow zone", f"Slow zone at {_gib(i * self.bucket_size)}: {slow[0]:.1f} MB/s, "
+                         f"{slow[1]:.1f} MB/s before it", offset=i * self.bucket_size, mb_per_s=round(slow[0], 1))
+
+    def slow_zones(self):
+        """Runs of adjacent slow buckets: [{"offset", "length", "mb_per_s", "around_mb_per_s"}]."""
+        zones = []
+        for i in range(len(self.sectors)):
+            slow = self._slow(i)
+            if slow is None:
+                continue
+            start = i * self.bucket_size
+            length = self._length(i)
+            last = zones[-1] if zones else None
+            if last and last["offset"] + last["length"] == start:
+                last["length"] += length
+                last["mb_per_s"] = round(min(last["mb_per_s"], slow[0]), 1)
+            else:
+                zones.append({"offset": start, "length": length, "mb_per_s": round(slow[0], 1),
+                              "around_mb_per_s": round(slow[1], 1)})
+        return zones
+
+    def summary(self):
+        if self.judged is None and self.current is not None:
+            self._finished(self.current)
+            self.current = None
+        rates = [self.rate(i) for i in range(len(self.sectors))]
+        timed = [r for r in rates if r is not None]
+        return {
+            "bucket_bytes": self.bucket_size,
+            "mb_per_s": [round(r, 1) if r is not None else None for r in rates],
+            "median_mb_per_s": round(statistics.median(timed), 1) if timed else None,
+            "min_mb_per_s": round(min(timed), 1) if timed else None,
+            "slow_zones": self.slow_zones(),
+            "stragglers": {"count": self.stragglers,
+                           "worst": [{"offset": offset, "bytes": nbytes, "seconds": round(seconds, 4)}
+                                     for seconds, offset, nbytes in sorted(self.worst, reverse=True)]},
+        }
+
+
+def health(profiles):
+    """Job-level verdict over the summaries of all passes (and the verify)."""
+    zones = [dict(z, phase=phase) for phase, p in profiles if p for z in p["slow_zones"]]
+    stragglers = sum(p["stragglers"]["count"] for _, p in profiles if p)
+    return {"slow_zones": zones, "stragglers": stragglers, "degraded": bool(zones)}
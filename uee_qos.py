@@ -0,0 +1,186 @@
+"""
+UEE bandwidth QoS.
+
+Per-device and aggregate throughput caps for wipe jobs. The engine paces
+every buffer through a token bucket; limits live in <run dir>/qos.json so
+they can be changed while jobs are running ('uee-cli.py qos'). The
+aggregate cap is shared equally between the active jobs. Optionally the
+engine also moves itself into a cgroup v2 group with a matching io.max so
+the kernel enforces the cap on writeback as well.
+
+qos.json: {"aggregate": 400000000, "devices": {"sdb": 100000000}}
+"""
+import json
+import math
+import os
+import time
+from pathlib import Path
+
+import uee_metrics
+
+LIMITS_FILE = "qos.json"
+CGROUP_ROOT = Path("/sys/fs/cgroup")
+CGROUP_NAME = "uee"
+REFRESH_INTERVAL = 1.0
+UNITS = {"": 1, "K": 10 ** 3, "M": 10 ** 6, "G": 10 ** 9, "T": 10 ** 12,
+         "KI": 2 ** 10, "MI": 2 ** 20, "GI": 2 ** 30, "TI": 2 ** 40}
+
+
+def parse_rate(text):
+    """Parse '100M', '1.5G', '500000' (bytes/s) into an int; 0/'none' = unlimited."""
+    value = str(text).strip().upper().removesuffix("/S").removesuffix("B")
+    if value in ("", "0", "NONE", "OFF"):
+        return 0
+    number = value.rstrip("KMGTI")
+    unit = value[len(number):]
+    if unit not in UNITS:
+        raise ValueError(f"invalid rate '{text}'")
+    rate = float(number) * UNITS[unit]
+    # also keeps inf/nan away from int()
+    if not math.isfinite(rate) or rate < 0:
+        raise ValueError(f"invalid rate '{text}'")
+    return int(rate)
+
+
+def format_rate(rate):
+    return f"{rate / 1e6:.1f} MB/s" if rate else "unlimited"
+
+
+def limits_path(run_dir=None):
+    return Path(run_dir or uee_metrics.RUN_DIR) / LIMITS_FILE
+
+
+def load_limits(run_dir=None):
+    try:
+        with open(limits_path(run_dir)) as f:
+            limits = json.load(f)
+    except (OSError, ValueError):
+        limits = {}
+    limits.setdefault("aggregate", 0)
+    limits.setdefault("devices", {})
+    return limits
+
+
+def save_limits(limits, run_dir=None):
+    path = limits_path(run_dir)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "w") as f:
+        json.dump(limits, f, indent=2)
+    os.replace(tmp, path)
+
+
+class TokenBucket:
+    """Byte pacing; consume() sleeps once the bucket runs into debt."""
+
+    def __init__(self, rate=0, burst=None):
+        self.burst = burst
+        self.set_rate(rate)
+
+    def set_rate(self, rate):
+        self.rate = rate
+        self.capacity = self.burst or max(rate / 4, 1)
+        self.tokens = self.capacity
+        self.stamp = time.monotonic()
+
+    def consume(self, n):
+        if not self.rate:
+            return 0.0
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+        self.tokens -= n
+        if self.tokens >= 0:
+            return 0.0
+        delay = -self.tokens / self.rate
+        time.sleep(delay)
+        return delay
+
+
+def _device_numbers(device):
+    st = os.stat(device)
+    return f"{os.major(st.st_rdev)}:{os.minor(st.st_rdev)}"
+
+
+class IoMaxGroup:
+    """A cgroup v2 group for one job whose io.max mirrors the current limit."""
+
+    def __init__(self, device, root=CGROUP_ROOT):
+        self.device = device
+        self.numbers = _device_numbers(device)
+        parent = Path(root) / CGROUP_NAME
+        parent.mkdir(exist_ok=True)
+        for directory in (Path(root), parent):
+            with open(directory / "cgroup.subtree_control", "w") as f:
+                f.write("+io")
+        self.path = parent / os.path.basename(device)
+        self.path.mkdir(exist_ok=True)
+        with open(self.path / "cgroup.procs", "w") as f:
+            f.write(str(os.getpid()))
+
+    def set_rate(self, rate):
+        limit = str(rate) if rate else "max"
+        with open(self.path / "io.max", "w") as f:
+            f.write(f"{self.numbers} rbps={limit} wbps={limit}")
+
+
+class Throttle:
+    """Effective limit for one job, refreshed from qos.json while it runs."""
+
+    def __init__(self, device, rate=0, run_dir=None, cgroup=False, governor=None):
+        self.device = device
+        self.name = os.path.basename(device)
+        self.requested = rate
+        self.run_dir = run_dir
+        self.governor = governor
+        self.thermal_cap = 0
+        self.bucket = TokenBucket()
+        self.group = None
+        self.next_refresh = 0.0
+        self.rate = None
+        if cgroup:
+            try:
+                self.group = IoMaxGroup(device)
+            except OSError as e:
+                print(f"cgroup io.max unavailable ({e}), pacing in the writer only.", flush=True)
+        self.refresh(force=True)
+
+    def effective_rate(self):
+        limits = load_limits(self.run_dir)
+        candidates = [self.requested, int(limits["devices"].get(self.name) or 0), self.thermal_cap]
+        if limits["aggregate"]:
+            jobs = max(1, len(uee_metrics.active_jobs(self.run_dir)))
+            candidates.append(int(limits["aggregate"]) // jobs)
+        candidates = [c for c in candidates if c]
+        return min(candidates) if candidates else 0
+
+    def refresh(self, force=False):
+        now = time.monotonic()
+        if not force and now < self.next_refresh:
+            return
+        self.next_refresh = now + REFRESH_INTERVAL
+        rate = self.effective_rate()
+        if rate == self.rate:
+            return
+        self.rate = rate
+        self.bucket.set_rate(rate)
+        if self.group is not None:
+            try:
+                self.group.set_rate(rate)
+            except OSError:
+                pass
+        uee_metrics.publish_job(self.device, rate_limit=rate)
+
+    def pace(self, n):
+        self.refresh()
+        if self.governor is not None:
+            self.governor.poll(self, n)
+        return self.bucket.consume(n)
+
+    def describe(self):
+        parts = []
+        if self.rate:
+            parts.append(f"limit {format_rate(self.rate)}" + (" (thermal)" if self.rate == self.thermal_cap else ""))
+        if self.governor is not None and self.governor.temperature is not None:
+            parts.append(self.governor.describe())
+        return ", ".join(parts)
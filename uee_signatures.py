@@ -0,0 +1,264 @@
+"""
+UEE signature scrub.
+
+A quick format only rewrites the partition table. Whatever else the
+disk carried stays where blkid, mdadm, LVM and the kernel look for it:
+the backup GPT at the end of the disk, RAID and LVM labels, filesystem
+superblocks and their backup copies, which get auto-assembled or
+misdetected later. The scrub zeroes every place a known signature can
+live, on the disk, in each partition and in the data area of md members:
+
+  head (first HEAD_BYTES)  MBR, primary GPT, md 1.1/1.2, LVM2 label and
+                           metadata, ZFS labels L0/L1, btrfs, ext, XFS,
+                           NTFS, exFAT and FAT boot regions, LUKS, swap
+  tail (last TAIL_BYTES)   backup GPT, md 0.90/1.0, ZFS labels L2/L3,
+                           the NTFS backup boot sector
+  further in               btrfs superblock mirrors at 64 MiB and
+                           256 GiB, ext2/3/4 backup superblocks, XFS
+                           secondary superblocks of every allocation
+                           group, the NTFS backup boot sector of a
+                           volume shorter than its partition
+
+The ext backups follow the geometry of the primary superblock. Without
+one, the mke2fs defaults (4 KiB blocks, 32768 per group, sparse
+superblocks) are assumed, so e2fsck -b finds nothing either. That is a
+few MiB per partition, written in one batch (uee_engine scrub), well
+under a second on any drive.
+
+Usage: python3 uee_signatures.py scan /dev/sdb
+"""
+import argparse
+import struct
+import sys
+
+import uee_alloc
+import uee_target
+
+SECTOR = 512
+HEAD_BYTES = 1024 * 1024
+TAIL_BYTES = 1024 * 1024
+BTRFS_OFFSETS = [64 * 1024, 64 * 1024 * 1024, 256 * 1024 ** 3]
+BTRFS_SUPER = 4096
+MD_MAGIC = 0xA92B4EFC
+ZFS_LABEL = 256 * 1024
+ZFS_UBERBLOCK_MAGIC = 0x00BAB10C
+# mke2fs defaults, for backups whose primary superblock is gone
+EXT_BLOCK = 4096
+EXT_BLOCKS_PER_GROUP = 32768
+
+
+def _u16(data, offset):
+    return struct.unpack_from("<H", data, offset)[0]
+
+
+def _u32(data, offset, order="<"):
+    return struct.unpack_from(order + "I", data, offset)[0]
+
+
+def _u64(data, offset, order="<"):
+    return struct.unpack_from(order + "Q", data, offset)[0]
+
+
+def _backup_group(group):
+    """Whether a sparse_super filesystem keeps a superblock copy in group (0, 1 and powers of 3, 5, 7)."""
+    if group <= 1:
+        return True
+    for base in (3, 5, 7):
+        n = base
+        while n < group:
+            n *= base
+        if n == group:
+            return True
+    return False
+
+
+def _ext_backups(fd, start, length):
+    sb = uee_alloc.read_at(fd, start + 1024, 1024)
+    groups = None
+    if len(sb) == 1024 and _u16(sb, 56) == 0xEF53:
+        first_data_block, log_block_size, _, blocks_per_group = struct.unpack_from("<IIII", sb, 20)
+        block_size = 1024 << log_block_size
+        compat, _, ro_compat = struct.unpack_from("<III", sb, 92)
+        sparse = bool(ro_compat & 0x1)
+        if compat & 0x200:
+            # sparse_super2: at most two backups, named in the superblock
+            groups = [g for g in struct.unpack_from("<II", sb, 0x24C) if g]
+    else:
+        first_data_block, block_size, blocks_per_group, sparse = 0, EXT_BLOCK, EXT_BLOCKS_PER_GROUP, True
+    if not blocks_per_group:
+        return []
+    if groups is None:
+        count = length // (blocks_per_group * block_size) + 1
+        groups = [g for g in range(1, count) if not sparse or _backup_group(g)]
+    locations = []
+    for g in groups:
+        offset = (first_data_block + g * blocks_per_group) * block_size
+        if offset + block_size <= length:
+            locations.append((start + offset, block_size))
+    return locations
+
+
+def _xfs_backups(fd, start, length):
+    sb = uee_alloc.read_at(fd, start, 512)
+    if len(sb) < 512 or sb[:4] != b"XFSB":
+        return []
+    block_size = _u32(sb, 4, ">")
+    ag_blocks, ag_count = _u32(sb, 84, ">"), _u32(sb, 88, ">")
+    sector_size = struct.unpack_from(">H", sb, 102)[0] or SECTOR
+    return [(start + ag * ag_blocks * block_size, sector_size) for ag in range(1, ag_count)
+            if ag * ag_blocks * block_size + sector_size <= length]
+
+
+def _ntfs_backup(fd, start, length):
+    boot = uee_alloc.read_at(fd, start, 512)
+    if len(boot) < 512 or boot[3:11] != b"NTFS    ":
+        return []
+    sector_size = _u16(boot, 0x0B) or SECTOR
+    # the backup boot sector sits right after the last sector the volume counts
+    offset = _u64(boot, 0x28) * sector_size
+    if offset + sector_size > length:
+        return []
+    return [(start + offset, sector_size)]
+
+
+def _md_data_area(fd, start, length):
+    """Data area of an md 1.1/1.2 member, which holds a filesystem of its own; None otherwise."""
+    for offset in (0, 4096):
+        sb = uee_alloc.read_at(fd, start + offset, 256)
+        if len(sb) < 256 or _u32(sb, 0) != MD_MAGIC or _u32(sb, 4) != 1:
+            continue
+        data_offset = _u64(sb, 128) * SECTOR
+        if 0 < data_offset < length:
+            return start + data_offset, length - data_offset
+    return None
+
+
+def areas(fd, size):
+    """The disk, its partitions and the data areas of md members in them, as (start, length)."""
+    result = [(0, size)] + uee_alloc.partitions(fd, size)
+    for start, length in list(result):
+        try:
+            inner = _md_data_area(fd, start, length)
+        except struct.error:
+            inner = None
+        if inner is not None:
+            result.append(inner)
+    return result
+
+
+def locations(fd, size):
+    """Merged (start, length) extents that hold or may hold a signature."""
+    extents = []
+    for start, length in areas(fd, size):
+        head, tail = min(HEAD_BYTES, length), min(TAIL_BYTES, length)
+        extents += [(start, head), (start + length - tail, tail)]
+        extents += [(start + o, BTRFS_SUPER) for o in BTRFS_OFFSETS if o + BTRFS_SUPER <= length]
+        for find in (_ext_backups, _xfs_backups, _ntfs_backup):
+            try:
+                extents += find(fd, start, length)
+            except struct.error:
+                pass
+    return uee_alloc.merge(extents)
+
+
+def _found_at(fd, start, length):
+    """(name, absolute offset) of each signature present in the area."""
+    head = uee_alloc.read_at(fd, start, min(HEAD_BYTES, length))
+    tail_start = max(0, length - TAIL_BYTES)
+    tail = uee_alloc.read_at(fd, start + tail_start, length - tail_start)
+    found = []
+
+    def at(name, data, offset, magic, base):
+        if offset >= 0 and data[offset:offset + len(magic)] == magic:
+            found.append((name, start + base + offset))
+
+    at("mbr", head, 510, b"\x55\xaa", 0)
+    at("luks", head, 0, b"LUKS\xba\xbe", 0)
+    at("xfs", head, 0, b"XFSB", 0)
+    at("ntfs", head, 3, b"NTFS    ", 0)
+    at("exfat", head, 3, b"EXFAT   ", 0)
+    at("fat32", head, 82, b"FAT32   ", 0)
+    at("ext", head, 1024 + 56, b"\x53\xef", 0)
+    at("swap", head, 4096 - 10, b"SWAPSPACE2", 0)
+    for sector_size in (512, 4096):
+        at("gpt", head, sector_size, b"EFI PART", 0)
+        at("gpt-backup", tail, len(tail) - sector_size, b"EFI PART", tail_start)
+    for sector in range(4):
+        at("lvm2", head, sector * SECTOR, b"LABELONE", 0)
+    md_magic = struct.pack("<I", MD_MAGIC)
+    for name, offset in (("md-1.1", 0), ("md-1.2", 4096)):
+        at(name, head, offset, md_magic, 0)
+    if length >= 8192:
+        # 1.0 at 8 KiB before the end, 4 KiB aligned; 0.90 in the last 64 KiB block
+        at("md-1.0", tail, (((length - 8192) & ~4095) - tail_start), md_magic, tail_start)
+        at("md-0.90", tail, (((length & ~65535) - 65536) - tail_start), md_magic, tail_start)
+    ub = struct.pack("<Q", ZFS_UBERBLOCK_MAGIC)
+    for label in (0, 1):
+        at("zfs", head, label * ZFS_LABEL + 128 * 1024, ub, 0)
+    base = (length & ~(ZFS_LABEL - 1)) - 2 * ZFS_LABEL - tail_start
+    for label in (0, 1):
+        at("zfs-backup", tail, base + label * ZFS_LABEL + 128 * 1024, ub, tail_start)
+    for offset in BTRFS_OFFSETS:
+        if offset + BTRFS_SUPER <= length:
+            if uee_alloc.read_at(fd, start + offset + 64, 8) == b"_BHRfS_M":
+                found.append(("btrfs", start + offset))
+    for name, find in (("ext-backup", _ext_backups), ("xfs-backup", _xfs_backups), ("ntfs-backup", _ntfs_backup)):
+        for offset, n in find(fd, start, length):
+            data = uee_alloc.read_at(fd, offset, n)
+            if name == "ext-backup" and data[56:58] == b"\x53\xef":
+                found.append((name, offset))
+            elif name == "xfs-backup" and data[:4] == b"XFSB":
+                found.append((name, offset))
+            elif name == "ntfs-backup" and data[3:11] == b"NTFS    ":
+                found.append((name, offset))
+    return found
+
+
+def detect(fd, size, area_list=None):
+    """
+    Signatures present on the device, as (name, offset). Pass the areas
+    found before a scrub to look in the same places afterwards, when
+    the partition table that named them is gone.
+    """
+    found = set()
+    for start, length in area_list or areas(fd, size):
+        try:
+            found.update(_found_at(fd, start, length))
+        except struct.error:
+            pass
+    return sorted(found, key=lambda f: (f[1], f[0]))
+
+
+def describe(found):
+    names = {}
+    for name, _ in found:
+        names[name] = names.get(name, 0) + 1
+    return ", ".join(f"{name} x{n}" if n > 1 else name for name, n in sorted(names.items())) or "none"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="uee_signatures.py", description="UEE signature scrub")
+    sub = parser.add_subparsers(dest="command", required=True)
+    scan_parser = sub.add_parser("scan", help="list the signatures and the extents a scrub would zero (read-only)")
+    scan_parser.add_argument("disk")
+    args = parser.parse_args(argv)
+
+    try:
+        target = uee_target.open_target(args.disk, readonly=True)
+        try:
+            found = detect(target.fd, target.size)
+            extents = locations(target.fd, target.size)
+        finally:
+            target.close()
+    except OSError as e:
+        print(f"Signature scan of {args.disk} failed: {e}", file=sys.stderr)
+        return 1
+    for name, offset in found:
+        print(f"{name:<12} at {offset}")
+    print(f"Found: {describe(found)}")
+    print(f"A scrub zeroes {len(extents)} extents, {uee_alloc.total(extents) // 1024} KiB.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,681 @@
+"""
+UEE simulated drives.
+
+A simulated drive is a wipe target named sim:NAME that behaves like a
+disk of a given class without the hardware, so scheduling, QoS, retries,
+verification and the front-ends can be rehearsed at station scale on one
+machine. Each I/O takes the time the modelled drive would need:
+
+  throughput   MB/s as a curve over the LBA range ([outer, ..., inner] for
+               HDD zones), an SLC cache after which SSD writes drop to
+               post_cache_mb_s (refilled at cache_recovery_mb_s while
+               idle), and a bridge cap for USB sticks
+  latency      per I/O, plus seek_ms whenever an I/O is not sequential
+  errors       sectors that fail writes and reads (bad), reads only
+               (unreadable), and a rate of transient failures
+  degradation  weak zones that run at weak_factor of the curve, and a
+               rate of stalls (single I/Os that take stall_ms longer)
+  thermal      heating per GB moved, Newtonian cooling to ambient, and a
+               throttle factor above the drive's own throttle temperature
+  zones        a zoned model like null_blk's: conventional zones first,
+               then sequential ones with a write pointer. Host-managed
+               zones fail writes that are not at the write pointer (EIO)
+               and opening more than max_open_zones (ETOOMANYREFS);
+               host-aware zones accept them at rmw_factor of the
+               throughput. Write pointers persist across opens.
+
+time_scale speeds the clock up: at 100 a 4 TB HDD pass takes a few
+minutes, with temperatures and latencies following the same clock.
+
+Data goes to a backing: 'null' stores nothing and reads zeros, 'memory'
+is a sparse file in the run directory (tmpfs), 'file' a sparse image
+elsewhere; blocks of zeros are punched out instead of stored. The drive
+also publishes a sysfs-shaped tree (size, stat, hwmon temp1_input), so
+the metrics sampler, the thermal governor and the ledger read it like a
+real disk.
+
+Usage: python3 uee_sim.py create bay 100 --profile hdd --time-scale 100
+       python3 uee_sim.py create smr --profile smr --size 64G --backing memory
+       python3 uee_sim.py list
+       python3 uee_sim.py remove bay --all
+"""
+import argparse
+import array
+import bisect
+import copy
+import errno
+import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+from pathlib import Path
+
+import uee_qos
+import uee_target
+
+PREFIX = "sim:"
+SIM_DIR = Path(os.environ.get("UEE_RUN_DIR", "/run/uee")) / "sim"
+SYSFS_ROOT = SIM_DIR / "sys"
+BACKINGS = ['null', 'memory', 'file']
+STATE_INTERVAL = 0.5
+# an I/O issued this soon (real seconds) after the previous one completed was queued behind it
+QUEUE_SLACK = 0.002
+ZERO_BLOCK = 4 * 1024 * 1024
+WEAK_ZONE_FRACTION = 0.005
+WEAK_FACTOR = 0.2
+STALL_MS = 300
+ZONED_MODELS = ['host-managed', 'host-aware']
+RMW_FACTOR = 0.1
+
+PROFILES = {
+    "hdd": {"model": "UEE SIM HDD", "size": "4T", "sector_size": 512,
+            "write_mb_s": [250, 230, 200, 160, 120], "read_mb_s": [260, 240, 210, 170, 125],
+            "latency_ms": 0.2, "seek_ms": 8, "error_ms": 400, "discard": False,
+            "thermal": {"ambient": 35, "heat_c_per_gb": 0.2, "cooling": 0.002,
+                        "throttle_temp": 65, "throttle_factor": 0.6}},
+    "ssd": {"model": "UEE SIM SSD", "size": "1T", "sector_size": 512,
+            "write_mb_s": 2000, "read_mb_s": 3000, "slc_cache": "24G", "post_cache_mb_s": 450,
+            "cache_recovery_mb_s": 500, "latency_ms": 0.05, "seek_ms": 0, "error_ms": 5, "discard": True,
+            "thermal": {"ambient": 40, "heat_c_per_gb": 0.03, "cooling": 0.002,
+                        "throttle_temp": 70, "throttle_factor": 0.3}},
+    "smr": {"model": "UEE SIM SMR", "size": "14T", "sector_size": 512,
+            "write_mb_s": [260, 240, 210, 170, 130], "read_mb_s": [270, 250, 220, 180, 135],
+            "latency_ms": 0.2, "seek_ms": 8, "error_ms": 400, "discard": False,
+            "zoned": {"model": "host-managed", "zone_size": "256Mi", "conventional_zones": 64,
+                      "max_open_zones": 128},
+            "thermal": {"ambient": 35, "heat_c_per_gb": 0.2, "cooling": 0.002,
+                        "throttle_temp": 65, "throttle_factor": 0.6}},
+    "usb": {"model": "UEE SIM USB", "size": "64G", "sector_size": 512,
+            "write_mb_s": 30, "read_mb_s": 100, "cap_mb_s": 40,
+            "latency_ms": 1.0, "seek_ms": 0, "error_ms": 50, "discard": False,
+            "thermal": {"ambient": 30, "heat_c_per_gb": 0, "cooling": 0.01,
+                        "throttle_temp": 80, "throttle_factor": 1.0}},
+}
+
+
+def is_sim(device):
+    return str(device).startswith(PREFIX)
+
+
+def _name(device):
+    return str(device)[len(PREFIX):] if is_sim(device) else str(device)
+
+
+def spec_path(device):
+    return SIM_DIR / (_name(device) + ".json")
+
+
+def sysfs_dir(device):
+    return SYSFS_ROOT / "block" / (PREFIX + _name(device))
+
+
+def zones_path(device):
+    return SIM_DIR / (_name(device) + ".zones")
+
+
+def load_spec(device):
+    try:
+        with open(spec_path(device)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        raise OSError(errno.ENOENT, f"no simulated drive '{device}'") from None
+
+
+def _write_file(path, text):
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "w") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+def _save_zones(device, pointers):
+    path = zones_path(device)
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        pointers.tofile(f)
+    os.replace(tmp, path)
+
+
+def _random_sectors(rng, count, size, sector_size):
+    sectors = rng.sample(range(size // sector_size), min(count, size // sector_size))
+    return [[s * sector_size, sector_size] for s in sorted(sectors)]
+
+
+def _random_zones(rng, count, size, sector_size):
+    length = max(int(size * WEAK_ZONE_FRACTION) // sector_size, 1) * sector_size
+    starts = sorted(rng.randrange(0, max(size - length, 1)) // sector_size * sector_size for _ in range(count))
+    return [[start, length] for start in starts]
+
+
+def _zoned_spec(spec, size, model=None, zone_size=None, conventional_zones=None, max_open_zones=None):
+    zoned = dict(spec.get("zoned") or {})
+    zoned["model"] = model or zoned.get("model")
+    if zoned["model"] not in ZONED_MODELS:
+        raise ValueError(f"unknown zoned model '{zoned['model']}'")
+    zone_size = uee_qos.parse_rate(str(zone_size or zoned.get("zone_size") or "256Mi"))
+    if zone_size < spec["sector_size"] or zone_size % spec["sector_size"]:
+        raise ValueError("the zone size must be a multiple of the sector size")
+    count = size // zone_size
+    if count < 1:
+        raise ValueError("the drive is smaller than one zone")
+    zoned["zone_size"] = zone_size
+    conventional = zoned.get("conventional_zones", 0) if conventional_zones is None else conventional_zones
+    zoned["conventional_zones"] = min(conventional, count // 2)
+    zoned["max_open_zones"] = zoned.get("max_open_zones", 0) if max_open_zones is None else max_open_zones
+    zoned.setdefault("rmw_factor", RMW_FACTOR)
+    return zoned, count * zone_size
+
+
+def create(name, profile='hdd', size=None, backing='null', image=None, time_scale=1.0,
+           bad_sectors=0, unreadable_sectors=0, transient=0.0, seed=None, weak_zones=0, stalls=0.0,
+           zoned=None, zone_size=None, conventional_zones=None, max_open_zones=None):
+    """Create (or replace) the simulated drive sim:name; returns its spec."""
+    if profile not in PROFILES:
+        raise ValueError(f"unknown profile '{profile}'")
+    if backing not in BACKINGS:
+        raise ValueError(f"unknown backing '{backing}'")
+    if backing == 'file' and not image:
+        raise ValueError("the 'file' backing needs an image path")
+    spec = copy.deepcopy(PROFILES[profile])
+    sector_size = spec["sector_size"]
+    size = uee_qos.parse_rate(size or spec.pop("size")) // sector_size * sector_size
+    spec.pop("size", None)
+    if spec.get("slc_cache"):
+        spec["slc_cache"] = uee_qos.parse_rate(spec["slc_cache"])
+    if zoned or spec.get("zoned"):
+        # a whole number of zones
+        spec["zoned"], size = _zoned_spec(spec, size, zoned, zone_size, conventional_zones, max_open_zones)
+    rng = random.Random(seed if seed is not None else name)
+    spec.update({
+        "name": name, "profile": profile, "size_bytes": size, "serial": f"SIM-{name.upper()}",
+        "backing": backing, "image": image or (str(SIM_DIR / (name + ".img")) if backing == 'memory' else None),
+        "time_scale": time_scale,
+        "errors": {"bad": _random_sectors(rng, bad_sectors, size, sector_size),
+                   "unreadable": _random_sectors(rng, unreadable_sectors, size, sector_size),
+                   "transient": transient,
+                   "weak": _random_zones(rng, weak_zones, size, sector_size), "weak_factor": WEAK_FACTOR,
+                   "stalls": stalls, "stall_ms": STALL_MS},
+    })
+    SIM_DIR.mkdir(parents=True, exist_ok=True)
+    remove(name)
+    if spec["image"]:
+        fd = os.open(spec["image"], os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o600)
+        try:
+            os.ftruncate(fd, size)
+        finally:
+            os.close(fd)
+    with open(spec_path(name), "w") as f:
+        json.dump(spec, f, indent=2)
+    block = sysfs_dir(name)
+    (block / "queue").mkdir(parents=True, exist_ok=True)
+    zoned = spec.get("zoned")
+    _write_file(block / "queue" / "zoned", f"{zoned['model'] if zoned else 'none'}\n")
+    if zoned:
+        # every sequential zone starts empty
+        zone_size = zoned["zone_size"]
+        _save_zones(name, array.array('Q', range(0, size, zone_size)))
+        _write_file(block / "queue" / "chunk_sectors", f"{zone_size // 512}\n")
+        _write_file(block / "queue" / "nr_zones", f"{size // zone_size}\n")
+        _write_file(block / "queue" / "max_open_zones", f"{zoned['max_open_zones']}\n")
+        _write_file(block / "queue" / "max_active_zones", "0\n")
+    (block / "device" / "hwmon" / "hwmon0").mkdir(parents=True, exist_ok=True)
+    _write_file(block / "size", f"{size // 512}\n")
+    _write_file(block / "queue" / "logical_block_size", f"{sector_size}\n")
+    _write_file(block / "stat", " ".join(["0"] * 11) + "\n")
+    _write_file(block / "device" / "hwmon" / "hwmon0" / "temp1_input",
+                f"{int(spec['thermal']['ambient'] * 1000)}\n")
+    return spec
+
+
+def remove(name):
+    """Remove sim:name, its sysfs tree and a backing in the run directory."""
+    try:
+        spec = load_spec(name)
+    except OSError:
+        spec = {}
+    if spec.get("backing") == 'memory' and spec.get("image"):
+        try:
+            os.unlink(spec["image"])
+        except OSError:
+            pass
+    try:
+        zones_path(name).unlink()
+    except OSError:
+        pass
+    block = sysfs_dir(name)
+    if block.is_dir():
+        for path in sorted(block.rglob("*"), key=lambda p: len(p.parts), reverse=True):
+            path.rmdir() if path.is_dir() else path.unlink()
+        block.rmdir()
+    try:
+        spec_path(name).unlink()
+    except OSError:
+        pass
+
+
+def devices():
+    """Specs of all simulated drives, sorted by name."""
+    specs = []
+    for path in sorted(SIM_DIR.glob("*.json")):
+        try:
+            with open(path) as f:
+                specs.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return specs
+
+
+def human_size(nbytes):
+    for unit in ["", "K", "M", "G", "T", "P"]:
+        if nbytes < 1000 or unit == "P":
+            return f"{nbytes:.1f}{unit}".replace(".0", "") if unit else f"{nbytes}B"
+        nbytes /= 1000
+
+
+def list_drives():
+    """Simulated drives in the shape the front-ends' drive scans return."""
+    return [{"name": PREFIX + s["name"], "size": human_size(s["size_bytes"]), "model": s["model"],
+             "serial": s["serial"]} for s in devices()]
+
+
+def _curve(value, position):
+    """Value of a constant or of evenly spaced points [outer, ..., inner] at position 0..1."""
+    if not isinstance(value, list):
+        return value
+    if len(value) == 1:
+        return value[0]
+    x = min(max(position, 0.0), 1.0) * (len(value) - 1)
+    i = min(int(x), len(value) - 2)
+    return value[i] + (value[i + 1] - value[i]) * (x - i)
+
+
+class _Errors:
+    def __init__(self, extents):
+        self.starts = [s for s, _ in extents]
+        self.ends = [s + n for s, n in extents]
+
+    def hit(self, offset, length):
+        i = bisect.bisect_right(self.ends, offset)
+        return i < len(self.starts) and self.starts[i] < offset + length
+
+
+class SimTarget(uee_target.Target):
+    kind = "sim"
+
+    def __init__(self, path, readonly=False):
+        spec = load_spec(path)
+        self.spec = spec
+        self.path = PREFIX + spec["name"]
+        self.readonly = readonly
+        self.size = spec["size_bytes"]
+        self.sector_size = spec["sector_size"]
+        self.io_mode = None
+        self.direct_fd = None
+        self._unsynced = None
+        if spec["backing"] == 'null':
+            self.fd = os.open("/dev/zero", os.O_RDWR)
+        else:
+            self.fd = os.open(spec["image"], os.O_RDONLY if readonly else os.O_RDWR)
+        self.scale = spec.get("time_scale") or 1.0
+        self.thermal = spec["thermal"]
+        errors = spec.get("errors", {})
+        self.bad = _Errors(errors.get("bad", []))
+        self.unreadable = _Errors(errors.get("unreadable", []))
+        self.transient = errors.get("transient", 0.0)
+        self.weak = _Errors(errors.get("weak", []))
+        self.weak_factor = errors.get("weak_factor", WEAK_FACTOR)
+        self.stalls = errors.get("stalls", 0.0)
+        self.stall_ms = errors.get("stall_ms", STALL_MS)
+        self.zone_spec = spec.get("zoned")
+        if self.zone_spec:
+            self.zone_size = self.zone_spec["zone_size"]
+            self.pointers = array.array('Q')
+            with open(zones_path(self.path), "rb") as f:
+                self.pointers.fromfile(f, self.size // self.zone_size)
+            # zones left open by an earlier job count as closed, as after a power cycle
+            self.open_zones = set()
+            self.zone_lock = threading.Lock()
+        self.rng = random.Random()
+        self.zeros = bytes(ZERO_BLOCK)
+        self.lock = threading.Lock()
+        self.origin = time.monotonic()
+        self.busy_until = 0.0
+        self.thermal_time = 0.0
+        self.head = 0
+        self.cache_used = 0
+        self.temperature = self._load_temperature()
+        self.counters = self._load_counters()
+        self.stopped = threading.Event()
+        self.publisher = threading.Thread(target=self._publish_loop, daemon=True)
+        self.publisher.start()
+
+    # simulated seconds since the target was opened
+    def _now(self):
+        return (time.monotonic() - self.origin) * self.scale
+
+    def _load_temperature(self):
+        ambient = self.thermal["ambient"]
+        path = sysfs_dir(self.path) / "device" / "hwmon" / "hwmon0" / "temp1_input"
+        try:
+            with open(path) as f:
+                temperature = int(f.read()) / 1000.0
+            idle = max(time.time() - os.stat(path).st_mtime, 0) * self.scale
+        except (OSError, ValueError):
+            return ambient
+        # cooled down since the last job left it
+        return ambient + (temperature - ambient) * math.exp(-self.thermal["cooling"] * idle)
+
+    def _load_counters(self):
+        try:
+            with open(sysfs_dir(self.path) / "stat") as f:
+                return [int(v) for v in f.read().split()] + [0] * 11
+        except (OSError, ValueError):
+            return [0] * 11
+
+    def _cool(self, now):
+        ambient = self.thermal["ambient"]
+        if now > self.thermal_time:
+            self.temperature = ambient + (self.temperature - ambient) * math.exp(
+                -self.thermal["cooling"] * (now - self.thermal_time))
+            self.thermal_time = now
+
+    def _service(self, op, offset, length, failing, factor=1.0):
+        """Simulated seconds one I/O takes; advances cache and thermal state."""
+        spec = self.spec
+        seconds = spec["latency_ms"] / 1000.0
+        if offset != self.head:
+            seconds += spec["seek_ms"] / 1000.0
+        if failing:
+            return seconds + spec["error_ms"] / 1000.0
+        rate = _curve(spec[op + "_mb_s"], offset / self.size)
+        if op == 'write' and spec.get("slc_cache"):
+            if self.cache_used >= spec["slc_cache"]:
+                rate = min(rate, spec["post_cache_mb_s"])
+            self.cache_used += length
+        if spec.get("cap_mb_s"):
+            rate = min(rate, spec["cap_mb_s"])
+        if self.temperature >= self.thermal["throttle_temp"]:
+            rate *= self.thermal["throttle_factor"]
+        if self.weak.hit(offset, length):
+            rate *= self.weak_factor
+        rate *= factor
+        if self.stalls and self.rng.random() < self.stalls:
+            seconds += self.stall_ms / 1000.0
+        return seconds + length / (rate * 1e6)
+
+    def _io(self, op, offset, length, errors, factor=1.0):
+        if offset + length > self.size:
+            raise OSError(errno.ENOSPC if op == 'write' else errno.EINVAL, "beyond the end of the simulated drive")
+        failing = errors.hit(offset, length) or (self.transient and self.rng.random() < self.transient)
+        with self.lock:
+            now = self._now()
+            idle = now - self.busy_until
+            if idle > 0 and self.cache_used:
+                self.cache_used = max(0, self.cache_used - int(idle * self.spec.get("cache_recovery_mb_s", 0) * 1e6))
+            start = self.busy_until if idle < QUEUE_SLACK * self.scale else now
+            seconds = self._service(op, offset, length, failing, factor)
+            self.busy_until = start + seconds
+            self.head = offset + length
+            self._cool(self.busy_until)
+            if not failing:
+                self.temperature += self.thermal["heat_c_per_gb"] * length / 1e9
+            ios, sectors, ticks = (4, 6, 7) if op == 'write' else (0, 2, 3)
+            self.counters[ios] += 1
+            self.counters[sectors] += 0 if failing else length // 512
+            self.counters[ticks] += int(seconds / self.scale * 1000)
+            self.counters[9] += int(seconds / self.scale * 1000)
+            wait = self.origin + self.busy_until / self.scale - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        if failing:
+            raise OSError(errno.EIO, f"simulated {op} error at {offset}")
+
+    def _publish(self):
+        block = sysfs_dir(self.path)
+        with self.lock:
+            self._cool(self._now())
+            temperature = self.temperature
+            counters = list(self.counters[:11])
+        try:
+            _write_file(block / "device" / "hwmon" / "hwmon0" / "temp1_input", f"{int(temperature * 1000)}\n")
+            _write_file(block / "stat", " ".join(str(v) for v in counters) + "\n")
+        except OSError:
+            pass
+
+    # keeps the sensor cooling while the engine is paused and not doing I/O
+    def _publish_loop(self):
+        while not self.stopped.wait(STATE_INTERVAL):
+            self._publish()
+
+    def close(self):
+        self.stopped.set()
+        self.publisher.join()
+        self._publish()
+        self.flush()
+        os.close(self.fd)
+
+    def set_io_mode(self, mode='direct'):
+        # the timing model is the device; there is no page cache in between
+        self.io_mode = mode
+        return mode
+
+    def _is_zero(self, view):
+        # memoryview == bytes compares element by element; tobytes() and bytes == bytes is a memcmp
+        return (len(view) <= len(self.zeros) and not view[0] and not view[-1]
+                and view.tobytes() == self.zeros[:len(view)])
+
+    def _sequential(self, zone):
+        return zone >= self.zone_spec["conventional_zones"]
+
+    def _zone_write(self, offset, length):
+        """Check a write against the zone rules; returns the zone and its throughput factor."""
+        zone = offset // self.zone_size
+        last = (offset + length - 1) // self.zone_size
+        if not any(self._sequential(z) for z in range(zone, last + 1)):
+            return None, 1.0
+        host_managed = self.zone_spec["model"] == 'host-managed'
+        with self.zone_lock:
+            if zone != last or offset != self.pointers[zone]:
+                if host_managed:
+                    raise OSError(errno.EIO, f"simulated unaligned write at {offset} "
+                                             f"(zone write pointer at {self.pointers[zone]})")
+                # host-aware: accepted, at the cost of rewriting the band
+                return None, self.zone_spec["rmw_factor"]
+            if zone not in self.open_zones:
+                limit = self.zone_spec["max_open_zones"]
+                if host_managed and limit and len(self.open_zones) >= limit:
+                    raise OSError(errno.ETOOMANYREFS, f"simulated open zone limit ({limit}) reached")
+                self.open_zones.add(zone)
+        return zone, 1.0
+
+    def _advance(self, zone, end):
+        with self.zone_lock:
+            self.pointers[zone] = end
+            if end == (zone + 1) * self.zone_size:
+                self.open_zones.discard(zone)
+
+    def pwrite(self, view, offset):
+        zone, factor = self._zone_write(offset, len(view)) if self.zone_spec else (None, 1.0)
+        self._io('write', offset, len(view), self.bad, factor)
+        if zone is not None:
+            self._advance(zone, offset + len(view))
+        if self.spec["backing"] != 'null' and self._is_zero(view):
+            uee_target.fallocate(self.fd, uee_target.FALLOC_FL_PUNCH_HOLE | uee_target.FALLOC_FL_KEEP_SIZE,
+                                 offset, len(view))
+            return len(view)
+        return os.pwrite(self.fd, view, offset)
+
+    def preadv(self, view, offset):
+        length = min(len(view), self.size - offset)
+        if length <= 0:
+            return 0
+        self._io('read', offset, length, self.unreadable if self.unreadable.hit(offset, length) else self.bad)
+        return os.preadv(self.fd, [view[:length]], offset)
+
+    def flush(self):
+        if self.zone_spec and not self.readonly:
+            with self.zone_lock:
+                _save_zones(self.path, self.pointers)
+
+    def zoned(self, sysfs_root=None):
+        if not self.zone_spec:
+            return None
+        zones = []
+        for i, pointer in enumerate(self.pointers):
+            start = i * self.zone_size
+            if not self._sequential(i):
+                zones.append({"start": start, "length": self.zone_size, "capacity": self.zone_size,
+                              "wp": None, "type": 'conventional', "cond": 'not-wp'})
+                continue
+            cond = ('empty' if pointer == start else 'full' if pointer == start + self.zone_size
+                    else 'implicit-open' if i in self.open_zones else 'closed')
+            zones.append({"start": start, "length": self.zone_size, "capacity": self.zone_size, "wp": pointer,
+                          "type": 'seq-required' if self.zone_spec["model"] == 'host-managed' else 'seq-preferred',
+                          "cond": cond})
+        return {"model": self.zone_spec["model"], "max_open_zones": self.zone_spec["max_open_zones"],
+                "max_active_zones": 0, "zones": zones}
+
+    def reset_zone(self, start, length):
+        if not self.zone_spec:
+            return super().reset_zone(start, length)
+        if start % self.zone_size or length % self.zone_size:
+            raise OSError(errno.EINVAL, f"zone reset at {start} is not zone aligned")
+        # one command, no bandwidth
+        self._io('write', start, 0, _Errors([]))
+        with self.zone_lock:
+            for zone in range(start // self.zone_size, (start + length) // self.zone_size):
+                if self._sequential(zone):
+                    self.pointers[zone] = zone * self.zone_size
+                    self.open_zones.discard(zone)
+        if self.spec["backing"] != 'null':
+            uee_target.fallocate(self.fd, uee_target.FALLOC_FL_PUNCH_HOLE | uee_target.FALLOC_FL_KEEP_SIZE,
+                                 start, length)
+
+    def _write_zeros(self, fd, start, length):
+        end = start + length
+        while start < end:
+            start += self.pwrite(memoryview(self.zeros)[:min(len(self.zeros), end - start)], start)
+
+    def _discard(self, fd, start, length):
+        if not self.spec.get("discard"):
+            raise OSError(errno.EOPNOTSUPP, "the simulated drive does not support discard")
+        # a trim costs one command per range, not the bandwidth
+        self._io('write', start, 0, _Errors([]))
+        if self.spec["backing"] != 'null':
+            uee_target.fallocate(self.fd, uee_target.FALLOC_FL_PUNCH_HOLE | uee_target.FALLOC_FL_KEEP_SIZE,
+                                 start, length)
+
+    def finish_zone(self, start, length):
+        if not self.zone_spec:
+            return super().finish_zone(start, length)
+        if start % self.zone_size or length % self.zone_size:
+            raise OSError(errno.EINVAL, f"zone finish at {start} is not zone aligned")
+        self._io('write', start, 0, _Errors([]))
+        with self.zone_lock:
+            for zone in range(start // self.zone_size, (start + length) // self.zone_size):
+                if self._sequential(zone):
+                    self.pointers[zone] = (zone + 1) * self.zone_size
+                    self.open_zones.discard(zone)
+
+    def release_methods(self, method):
+        methods = [('write', self._write_zeros)]
+        if method == 'discard':
+            methods.insert(0, ('discard', self._discard))
+        return methods
+
+    def identity(self):
+        spec = self.spec
+        return {"name": self.path, "type": "sim", "model": spec["model"], "serial": spec["serial"],
+                "size_bytes": self.size, "profile": spec["profile"], "backing": spec["backing"],
+                "time_scale": self.scale, "zoned": self.zone_spec["model"] if self.zone_spec else None}
+
+
+def _names(name, count):
+    if count == 1:
+        return [name]
+    width = len(str(count - 1))
+    return [f"{name}{i:0{width}d}" for i in range(count)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="uee_sim.py", description="UEE simulated drives")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    create_parser = sub.add_parser("create", help="create simulated drives sim:NAME (sim:NAME00.. with COUNT)")
+    create_parser.add_argument("name")
+    create_parser.add_argument("count", type=int, nargs="?", default=1)
+    create_parser.add_argument("--profile", choices=sorted(PROFILES), default='hdd')
+    create_parser.add_argument("--size", help="capacity, e.g. 500G or 4T (default: the profile's)")
+    create_parser.add_argument("--backing", choices=BACKINGS, default='null',
+                               help="null: store nothing, read zeros; memory: sparse file in the run directory; "
+                                    "file: sparse image at --image")
+    create_parser.add_argument("--image", metavar="PATH", help="backing image for --backing file")
+    create_parser.add_argument("--time-scale", type=float, default=1.0,
+                               help="run the drive's clock this many times faster than real time")
+    create_parser.add_argument("--bad-sectors", type=int, default=0, help="random sectors that fail writes and reads")
+    create_parser.add_argument("--unreadable-sectors", type=int, default=0, help="random sectors that fail reads")
+    create_parser.add_argument("--transient", type=float, default=0.0,
+                               help="probability that any I/O fails once, e.g. 0.001")
+    create_parser.add_argument("--weak-zones", type=int, default=0,
+                               help=f"random regions ({WEAK_ZONE_FRACTION * 100:.1f}%% of the drive each) "
+                                    f"that run at {WEAK_FACTOR:g} of the drive's throughput")
+    create_parser.add_argument("--stalls", type=float, default=0.0,
+                               help=f"probability that any I/O takes {STALL_MS} ms longer, e.g. 0.001")
+    create_parser.add_argument("--seed", type=int, help="seed for the placement of bad sectors and weak zones")
+    create_parser.add_argument("--zoned", choices=ZONED_MODELS,
+                               help="make the drive zoned (the smr profile is host-managed already)")
+    create_parser.add_argument("--zone-size", help="zone size, e.g. 256Mi (default: the profile's or 256Mi)")
+    create_parser.add_argument("--conventional-zones", type=int, help="zones at the start without a write pointer")
+    create_parser.add_argument("--max-open-zones", type=int, help="open zone limit (0: none)")
+
+    sub.add_parser("list", help="list simulated drives")
+
+    remove_parser = sub.add_parser("remove", help="remove simulated drives")
+    remove_parser.add_argument("names", nargs="*")
+    remove_parser.add_argument("--all", action="store_true", help="remove every simulated drive")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "create":
+        if args.count < 1:
+            parser.error("count must be at least 1")
+        names = _names(args.name, args.count)
+        if args.backing == 'file' and len(names) > 1:
+            parser.error("--backing file creates one drive per image")
+        try:
+            for name in names:
+                spec = create(name, args.profile, args.size, args.backing, args.image, args.time_scale,
+                              args.bad_sectors, args.unreadable_sectors, args.transient, args.seed,
+                              args.weak_zones, args.stalls, args.zoned, args.zone_size,
+                              args.conventional_zones, args.max_open_zones)
+        except (OSError, ValueError) as e:
+            print(f"Could not create simulated drive: {e}", file=sys.stderr)
+            return 1
+        print(f"Created {len(names)} simulated {args.profile} drive{'s' if len(names) > 1 else ''} "
+              f"({human_size(spec['size_bytes'])}, {args.backing} backing, time x{args.time_scale:g}): "
+              f"{PREFIX}{names[0]}{' .. ' + PREFIX + names[-1] if len(names) > 1 else ''}")
+    elif args.command == "list":
+        specs = devices()
+        if not specs:
+            print("No simulated drives.")
+        for spec in specs:
+            errors = spec.get("errors", {})
+            print(f"{PREFIX + spec['name']:<16} {human_size(spec['size_bytes']):>7}  {spec['profile']:<4} "
+                  f"{spec['backing']:<7} x{spec['time_scale']:<6g} bad {len(errors.get('bad', []))}, "
+                  f"unreadable {len(errors.get('unreadable', []))}, transient {errors.get('transient', 0)}, "
+                  f"weak zones {len(errors.get('weak', []))}, stalls {errors.get('stalls', 0)}"
+                  + (f", {spec['zoned']['model']} {human_size(spec['zoned']['zone_size'])} zones"
+                     if spec.get("zoned") else ""))
+    elif args.command == "remove":
+        names = [s["name"] for s in devices()] if args.all else [_name(n) for n in args.names]
+        for name in names:
+            remove(name)
+        print(f"Removed {len(names)} simulated drive{'s' if len(names) != 1 else ''}.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,542 @@
+"""
+UEE smoke scenarios.
+
+Runs the parts of UEE that need phones, several hosts or a storage stack
+against stand-ins on one machine, and checks what they claim:
+
+  android    uee_android.py wipe against a stand-in adb and fastboot:
+             a full overwrite, ENOSPC, a stream that ends early, a
+             refused write, a short userdata overwrite, a phone that does
+             not reach recovery, locked and unlocked bootloaders, and an
+             adb server that stops reading a stream. The --report rows
+             that go to the ledger are checked too.
+  stations   a coordinator and two station agents, each with its own
+             UEE_RUN_DIR and simulated drives: registration, placement on
+             the station that has the drive, rejection of drives no
+             station offers, results in the shared ledger, a station that
+             goes silent and comes back.
+  targets    an md array and a multipath LUN over loop devices, described
+             by a sysfs tree in a temporary directory (the kernel here
+             may have neither md nor device-mapper): the array resolves
+             to its members, the LUN to its best path, and the members
+             are wiped concurrently with the engine, each with its own
+             certificate. Needs root and losetup.
+
+Nothing outside temporary directories, loop devices it attached itself
+and sim:NAME drives is touched. Every check prints PASS or FAIL; the exit
+status is 1 when one failed.
+
+Usage: python3 uee_smoke.py android
+       python3 uee_smoke.py stations
+       sudo python3 uee_smoke.py targets [--keep]
+       sudo python3 uee_smoke.py all
+"""
+import argparse
+import importlib.util
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import uee_adb
+import uee_android
+import uee_ledger
+import uee_station
+import uee_topology
+
+HERE = Path(__file__).resolve().parent
+ANDROID_FILE = HERE / "uee_android.py"
+STATION_FILE = HERE / "uee_station.py"
+SIM_FILE = HERE / "uee_sim.py"
+ENGINE_FILE = HERE / "uee_engine.py"
+MiB = 1024 * 1024
+
+# stand-in adb: 8 MiB free on /sdcard and an 8 MiB userdata partition.
+# FAKE_CAT=ok|fail|full|eof decides what a remote 'cat >' does, FAKE_RECOVERY=stuck keeps
+# the phone from reaching recovery.
+FAKE_ADB = r'''#!/usr/bin/env python3
+import os
+import sys
+
+args = sys.argv[1:]
+if args[:1] == ["devices"]:
+    print("List of devices attached\nFAKE1\tdevice")
+    sys.exit(0)
+if args[:1] == ["-s"]:
+    args = args[2:]
+if args[0].startswith("wait-for-"):
+    sys.exit(1 if os.environ.get("FAKE_RECOVERY") == "stuck" else 0)
+if args[0] != "shell":
+    sys.exit(0)
+cmd = args[1]
+mode = os.environ.get("FAKE_CAT", "ok")
+if cmd.startswith("getprop ro.product.model"):
+    print("Fake Phone")
+elif cmd.startswith("df"):
+    print("Filesystem 1K-blocks Used Available Use% Mounted on\n/dev/fuse 100000 0 8192 0% /sdcard")
+elif cmd.startswith("blockdev"):
+    print(8 * 1024 * 1024)
+elif cmd.startswith("cat >"):
+    if mode == "fail":
+        sys.stderr.write("cat: /sdcard/uee_fill.bin: Permission denied\n")
+        sys.exit(1)
+    limit = 3 * 1024 * 1024 if mode in ("full", "eof") else None
+    n = 0
+    while True:
+        data = sys.stdin.buffer.read(65536)
+        if not data:
+            break
+        n += len(data)
+        if limit and n >= limit:
+            if mode == "full":
+                sys.stderr.write("cat: xwrite: No space left on device\n")
+                sys.exit(1)
+            sys.exit(0)
+sys.exit(0)
+'''
+
+# stand-in fastboot with one device, FB1; FAKE_UNLOCKED=no locks its bootloader
+FAKE_FASTBOOT = r'''#!/usr/bin/env python3
+import os
+import sys
+
+args = sys.argv[1:]
+if args[:1] == ["devices"]:
+    print("FB1\tfastboot")
+    sys.exit(0)
+if args[:1] == ["-s"]:
+    args = args[2:]
+if args[:1] == ["getvar"]:
+    value = {"unlocked": os.environ.get("FAKE_UNLOCKED", "yes"), "product": "fakeboard"}.get(args[1], "")
+    sys.stderr.write(f"{args[1]}: {value}\n")
+sys.exit(0)
+'''
+
+
+class Checks:
+    """PASS/FAIL lines and their tally."""
+
+    def __init__(self):
+        self.failed = []
+        self.passed = 0
+
+    def check(self, name, ok, detail=""):
+        print(f"  {'PASS' if ok else 'FAIL'}  {name}{f' ({detail})' if detail else ''}", flush=True)
+        if ok:
+            self.passed += 1
+        else:
+            self.failed.append(name)
+        return ok
+
+
+def _script(directory, name, text):
+    path = Path(directory) / name
+    path.write_text(text)
+    path.chmod(0o755)
+    return str(path)
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait(predicate, timeout, interval=0.5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        value = predicate()
+        if value:
+            return value
+        time.sleep(interval)
+    return predicate()
+
+
+# (name, serial, overwrite mode, environment, expected exit status, check of the device's report)
+ANDROID_CASES = [
+    ("free-space overwrite fills the free space", "FAKE1", 'free-space', {},
+     0, lambda d: d["reset"] and d["overwrite"]["bytes"] == 8 * MiB and d["model"] == "Fake Phone"),
+    ("ENOSPC ends a free-space fill early and counts as full", "FAKE1", 'free-space', {"FAKE_CAT": "full"},
+     0, lambda d: d["reset"] and d["overwrite"]["bytes"] < d["overwrite"]["target_bytes"]),
+    ("a stream that ends early without ENOSPC fails the phone", "FAKE1", 'free-space', {"FAKE_CAT": "eof"},
+     1, lambda d: not d["reset"] and d["error"]),
+    ("a refused write fails the phone", "FAKE1", 'free-space', {"FAKE_CAT": "fail"},
+     1, lambda d: not d["reset"] and "Permission denied" in (d["error"] or "")),
+    ("a short userdata overwrite fails the phone", "FAKE1", 'userdata', {"FAKE_CAT": "full"},
+     1, lambda d: not d["reset"] and d["error"]),
+    ("a phone that does not reach recovery is not reset", "FAKE1", 'none', {"FAKE_RECOVERY": "stuck"},
+     1, lambda d: not d["reset"] and "did not reach recovery" in (d["error"] or "")),
+    ("an unlocked bootloader is wiped from fastboot", "FB1", 'none', {},
+     0, lambda d: d["path"] == "fastboot" and d["reset"] and d["model"] == "fakeboard"),
+    ("a locked bootloader is left alone", "FB1", 'none', {"FAKE_UNLOCKED": "no"},
+     1, lambda d: not d["reset"] and d["error"] == "bootloader locked"),
+]
+
+
+def android(checks):
+    print("android: uee_android.py wipe against a stand-in adb and fastboot", flush=True)
+    with tempfile.TemporaryDirectory(prefix="uee-smoke-") as tmp:
+        adb = _script(tmp, "adb", FAKE_ADB)
+        fastboot = _script(tmp, "fastboot", FAKE_FASTBOOT)
+        for name, serial, mode, env, status, expect in ANDROID_CASES:
+            report = os.path.join(tmp, "report.json")
+            result = subprocess.run(
+                [sys.executable, str(ANDROID_FILE), "wipe", serial, "--transport", "cli", "--adb", adb,
+                 "--fastboot", fastboot, "--overwrite", mode, "--report", report],
+                capture_output=True, text=True, timeout=300, env=dict(os.environ, UEE_RUN_DIR=tmp, **env))
+            devices = (uee_ledger.load_report(report) or {}).get("devices", [])
+            device = devices[0] if len(devices) == 1 else None
+            try:
+                ok = result.returncode == status and device is not None and bool(expect(device))
+            except (KeyError, TypeError):
+                ok = False
+            detail = f"exit {result.returncode}"
+            if device and device["error"]:
+                detail += f", {device['error']}"
+            if not checks.check(name, ok, detail):
+                print(result.stdout + result.stderr)
+                continue
+            # the rows the front-ends put in the ledger, one per phone
+            jobs = uee_ledger.android_jobs({"devices": devices})
+            kind = 'fastboot-wipe' if serial == "FB1" else 'android-wipe'
+            checks.check(f"  ledger row: {kind} {serial} {jobs[0]['outcome']}",
+                         len(jobs) == 1 and jobs[0]["kind"] == kind and jobs[0]["serial"] == serial
+                         and (jobs[0]["outcome"] == 'success') == (status == 0))
+        android_stall(checks)
+
+
+def android_stall(checks):
+    """An adb server that accepts a shell stream and never reads it."""
+    server = socket.socket()
+    server.bind(("127.0.0.1", 0))
+    server.listen()
+    port = server.getsockname()[1]
+    stalled = []
+
+    def serve():
+        while True:
+            try:
+                conn, _ = server.accept()
+            except OSError:
+                return
+            conn.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+            # host:transport, then the shell service: answer both, then read nothing
+            for _ in range(2):
+                length = int(conn.recv(4), 16)
+                conn.recv(length)
+                conn.sendall(b"OKAY")
+            stalled.append(conn)
+
+    threading.Thread(target=serve, daemon=True).start()
+    stream_timeout, exit_timeout = uee_adb.STREAM_TIMEOUT, uee_android.STREAM_EXIT_TIMEOUT
+    uee_adb.STREAM_TIMEOUT, uee_android.STREAM_EXIT_TIMEOUT = 2.0, 1
+    started = time.monotonic()
+    try:
+        device = uee_adb.AdbClient(port=port).device("FAKE1")
+        uee_android.stream_fill(device, "cat > /sdcard/uee_fill.bin", 256 * MiB, "zeros",
+                                uee_android.UsbBudget(), "FAKE1")
+        error = None
+    except OSError as e:
+        error = str(e)
+    finally:
+        uee_adb.STREAM_TIMEOUT, uee_android.STREAM_EXIT_TIMEOUT = stream_timeout, exit_timeout
+        server.close()
+        for conn in stalled:
+            conn.close()
+    seconds = time.monotonic() - started
+    checks.check("a stream the adb server stops reading fails instead of hanging", error is not None and seconds < 30,
+                 f"{seconds:.1f} s: {error}")
+
+
+def stations(checks):
+    print("stations: a coordinator and two station agents on simulated drives", flush=True)
+    token = os.urandom(8).hex()
+    address = f"127.0.0.1:{_free_port()}"
+    processes = {}
+    with tempfile.TemporaryDirectory(prefix="uee-smoke-") as tmp:
+        ledger = os.path.join(tmp, "coordinator.db")
+        env = dict(os.environ, UEE_STATION_TOKEN=token)
+        logs = []
+
+        def start(name, args, run_dir):
+            log = open(os.path.join(tmp, f"{name}.log"), "w")
+            logs.append(log)
+            processes[name] = subprocess.Popen([sys.executable, str(STATION_FILE)] + args, cwd=run_dir,
+                                               stdout=log, stderr=subprocess.STDOUT,
+                                               env=dict(env, UEE_RUN_DIR=run_dir))
+
+        def status():
+            try:
+                return uee_station.request(address, {"type": "status"}, token)
+            except (OSError, ValueError):
+                return None
+
+        def online(name):
+            s = status()
+            return s and any(st["name"] == name and st["online"] for st in s["stations"])
+
+        try:
+            start("coordinator", ["coordinator", "--listen", address, "--ledger", ledger], tmp)
+            drives = {}
+            for name, prefix in (("bayA", "a"), ("bayB", "b")):
+                run_dir = os.path.join(tmp, name)
+                os.makedirs(run_dir)
+                subprocess.run([sys.executable, str(SIM_FILE), "create", prefix, "2", "--profile", "ssd",
+                                "--size", "256M", "--time-scale", "100"], check=True, capture_output=True,
+                               env=dict(env, UEE_RUN_DIR=run_dir))
+                start(name, ["station", name, "--coordinator", address, "--slots", "2"], run_dir)
+            registered = _wait(lambda: online("bayA") and online("bayB") and status(), 20)
+            if not checks.check("both stations register", bool(registered)):
+                return
+            for station in registered["stations"]:
+                drives[station["name"]] = sorted(d["name"] for d in station["drives"])
+            checks.check("each station offers its own simulated drives",
+                         [d for d in drives["bayA"] if d.startswith("sim:")] == ["sim:a0", "sim:a1"]
+                         and [d for d in drives["bayB"] if d.startswith("sim:")] == ["sim:b0", "sim:b1"],
+                         f"bayA {drives['bayA']}, bayB {drives['bayB']}")
+            topology = uee_topology.Topology()
+            offered = [d for names in drives.values() for d in names if d.startswith("/dev/")]
+            unsafe = [d for d in offered if topology.resolve(d) is None or topology.plan(d)["refused"]
+                      or os.path.basename(d).startswith(uee_station.RAM_DISKS)]
+            checks.check("no station offers a system disk or a RAM disk", not unsafe,
+                         f"{len(offered)} host drives offered{', unsafe: ' + ', '.join(unsafe) if unsafe else ''}")
+
+            plan = {"filesystem": "ext4", "pattern": "zeros", "passes": 1}
+            for name, message in (("a drive no station offers is rejected", {"targets": ["sim:nowhere"]}),
+                                  ("a drive is rejected for a station that does not offer it",
+                                   {"targets": ["sim:b0"], "station": "bayA"})):
+                try:
+                    uee_station.request(address, dict(message, type="submit", kind='format', plan=plan), token)
+                    rejected = None
+                except ValueError as e:
+                    rejected = str(e)
+                checks.check(name, rejected is not None, rejected or "queued")
+            after = status()
+            checks.check("rejected drives never reach the queue", after is not None and not after["jobs"])
+
+            reply = uee_station.request(address, {"type": "submit", "kind": 'format',
+                                                  "targets": ["sim:a0", "sim:b1"], "plan": plan}, token)
+            finished = _wait(lambda: (lambda s: s if s and all(j["state"] in uee_station.FINISHED
+                                                               for j in s["jobs"]) else None)(status()), 300)
+            jobs = {j["target"]: j for j in (finished or status() or {"jobs": []})["jobs"]}
+            checks.check("each job goes to the station that has the drive",
+                         len(reply["jobs"]) == 2 and jobs.get("sim:a0", {}).get("station") == "bayA"
+                         and jobs.get("sim:b1", {}).get("station") == "bayB",
+                         ", ".join(f"{t} -> {j['station']}" for t, j in sorted(jobs.items())))
+            rows = {}
+            if os.path.exists(ledger):
+                shared = uee_ledger.Ledger(ledger)
+                rows = {r["device"]: r for r in shared.query()}
+                shared.close()
+            checks.check("results land in the shared ledger with their station",
+                         rows.get("sim:a0", {}).get("station") == "bayA" and rows.get("sim:b1", {}).get("station") == "bayB",
+                         ", ".join(f"{d} {r['station']} {r['outcome']}" for d, r in sorted(rows.items())))
+            # the station runs jobs through its own uee-cli.py, which needs click and parted
+            if importlib.util.find_spec("click") and shutil.which("parted"):
+                checks.check("the jobs succeed", all(r["outcome"] == 'success' for r in rows.values()))
+            else:
+                print("  SKIP  job outcomes: uee-cli.py cannot run here (click or parted missing)", flush=True)
+
+            # a station that goes silent without closing its connection, like one behind a dead link
+            processes["bayB"].send_signal(signal.SIGSTOP)
+            started = time.monotonic()
+            gone = _wait(lambda: not online("bayB"), uee_station.STATION_TIMEOUT + 10)
+            checks.check("a silent station is taken offline", gone, f"after {time.monotonic() - started:.0f} s")
+            processes["bayB"].send_signal(signal.SIGCONT)
+            started = time.monotonic()
+            back = _wait(lambda: online("bayB"), uee_station.STATION_TIMEOUT + 20)
+            checks.check("it registers again when it comes back", back, f"after {time.monotonic() - started:.0f} s")
+        finally:
+            for process in processes.values():
+                process.send_signal(signal.SIGCONT)
+                process.terminate()
+            for process in processes.values():
+                try:
+                    process.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+            for log in logs:
+                log.close()
+            if checks.failed:
+                for name in processes:
+                    print(f"--- {name}.log")
+                    print(Path(tmp, f"{name}.log").read_text()[-3000:])
+
+
+def _fake_sysfs(root, nodes):
+    """A <root>/class/block tree for nodes {name: {dev, size, slaves, wwid, state, access_state, dm, md}}."""
+    base = Path(root, "class", "block")
+    for name, node in nodes.items():
+        path = base / name
+        (path / "holders").mkdir(parents=True)
+        (path / "slaves").mkdir()
+        (path / "dev").write_text(node["dev"] + "\n")
+        if node.get("size"):
+            (path / "size").write_text(node["size"] + "\n")
+        if node.get("wwid"):
+            (path / "device").mkdir()
+            for key in ("wwid", "state", "access_state"):
+                if node.get(key):
+                    (path / "device" / key).write_text(node[key] + "\n")
+        if node.get("dm"):
+            (path / "dm").mkdir()
+            (path / "dm" / "name").write_text(node["dm"]["name"] + "\n")
+            (path / "dm" / "uuid").write_text(node["dm"]["uuid"] + "\n")
+        if node.get("md"):
+            (path / "md").mkdir()
+            (path / "md" / "level").write_text(node["md"] + "\n")
+    for name, node in nodes.items():
+        for slave in node.get("slaves", ()):
+            (base / name / "slaves" / slave).symlink_to(base / slave)
+            (base / slave / "holders" / name).symlink_to(base / name)
+
+
+def _filled(path, byte):
+    expected = bytes([byte]) * MiB
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(MiB)
+            if not chunk:
+                return True
+            if chunk != expected[:len(chunk)]:
+                return False
+
+
+def targets(checks, keep=False):
+    print("targets: an md array and a multipath LUN over loop devices", flush=True)
+    if os.geteuid() != 0 or not shutil.which("losetup"):
+        print("  SKIP  needs root and losetup", flush=True)
+        return
+    tmp = tempfile.mkdtemp(prefix="uee-smoke-")
+    loops = []
+    try:
+        images = {}
+        for name in ("m0", "m1", "lun"):
+            images[name] = os.path.join(tmp, f"{name}.img")
+            with open(images[name], "wb") as f:
+                f.truncate(64 * MiB)
+
+        def attach(image):
+            loop = subprocess.run(["losetup", "-f", "--show", image], capture_output=True, text=True,
+                                  check=True).stdout.strip()
+            loops.append(loop)
+            return os.path.basename(loop)
+
+        # two members of a raid1, and two paths (loop devices on the same image) to one LUN
+        m0, m1 = attach(images["m0"]), attach(images["m1"])
+        standby, optimized = attach(images["lun"]), attach(images["lun"])
+
+        def real(name):
+            return {"dev": Path("/sys/class/block", name, "dev").read_text().strip(),
+                    "size": Path("/sys/class/block", name, "size").read_text().strip()}
+
+        wwid = "naa.600a0b80002a0a1c00005e5f6c1b2c3d"
+        _fake_sysfs(os.path.join(tmp, "sys"), {
+            m0: real(m0), m1: real(m1),
+            "md0": {"dev": "9:0", "md": "raid1", "slaves": [m0, m1]},
+            standby: dict(real(standby), wwid=wwid, state="running", access_state="standby"),
+            optimized: dict(real(optimized), wwid=wwid, state="running", access_state="active/optimized"),
+            "dm-0": {"dev": "253:0", "dm": {"name": "mpatha", "uuid": f"mpath-{wwid[4:]}"},
+                     "slaves": [standby, optimized]},
+        })
+        os.makedirs(os.path.join(tmp, "proc", "self"))
+        Path(tmp, "proc", "self", "mountinfo").write_text("")
+        Path(tmp, "proc", "swaps").write_text("Filename Type Size Used Priority\n")
+        topology = uee_topology.Topology(os.path.join(tmp, "sys"), os.path.join(tmp, "proc"))
+
+        resolutions = {}
+        for disk in ("/dev/md0", "/dev/mapper/mpatha"):
+            resolutions[disk] = topology.resolve_targets(disk)
+            print(f"  {disk}:")
+            for line in uee_topology.describe_targets(resolutions[disk]):
+                print(f"    {line}")
+            for target in resolutions[disk]["targets"]:
+                plan = topology.plan("/dev/" + target)
+                plan["shared_with"] = [s for s in plan["shared_with"] if s not in resolutions[disk]["targets"]]
+                for line in uee_topology.describe(plan):
+                    print(f"    /dev/{target}: {line}")
+        checks.check("the array expands into its members", resolutions["/dev/md0"]["targets"] == [m0, m1]
+                     and resolutions["/dev/md0"]["expanded"], ", ".join(resolutions["/dev/md0"]["targets"]))
+        checks.check("the LUN collapses into its active/optimized path",
+                     resolutions["/dev/mapper/mpatha"]["targets"] == [optimized]
+                     and resolutions["/dev/mapper/mpatha"]["paths"] == {optimized: [standby]},
+                     f"{optimized}, not {standby}")
+        listed = uee_topology.group_drives([{"name": f"/dev/{n}"} for n in (m0, m1, standby, optimized)]
+                                           + [{"name": "/dev/md0"}], topology)
+        names = [d["name"] for d in listed]
+        checks.check("the drive list shows the LUN once and the array with its members",
+                     f"/dev/{standby}" not in names and f"/dev/{optimized}" in names
+                     and next(d for d in listed if d["name"] == "/dev/md0").get("members") == [m0, m1],
+                     ", ".join(names))
+
+        # the members go concurrently, each with its own certificate, as format does after the shared teardown
+        members = resolutions["/dev/md0"]["targets"] + resolutions["/dev/mapper/mpatha"]["targets"]
+
+        def wipe(target):
+            certificate = os.path.join(tmp, f"cert-{target}.json")
+            result = subprocess.run([sys.executable, str(ENGINE_FILE), "wipe", f"/dev/{target}", "ones", "1",
+                                     "--verify", "--certificate", certificate], capture_output=True, text=True,
+                                    env=dict(os.environ, UEE_RUN_DIR=tmp))
+            return target, result, uee_ledger.load_certificate(certificate)
+
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=len(members)) as pool:
+            wiped = list(pool.map(wipe, members))
+        seconds = time.monotonic() - started
+        print(f"  wiped {len(members)} members in {seconds:.1f} s")
+        for target, result, cert in wiped:
+            if cert is None:
+                checks.check(f"/dev/{target} has a certificate", False, (result.stdout + result.stderr)[-500:])
+                continue
+            passes = ", ".join(f"pass {p['pass']} {p['pattern']} {p['mb_per_s']:.0f} MB/s" for p in cert["passes"])
+            print(f"    cert-{target}.json: {cert['device']['name']}, {cert['size_bytes'] // MiB} MiB, {passes}, "
+                  f"verification {cert['verification']['result']}, result {cert['result']}")
+            checks.check(f"/dev/{target} wiped and verified", result.returncode == 0
+                         and cert.get("verification", {}).get("result") == "passed")
+        checks.check("one certificate per member, none for the standby path",
+                     sorted(p.name for p in Path(tmp).glob("cert-*.json"))
+                     == sorted(f"cert-{t}.json" for t in members))
+        checks.check("every member image holds the pattern", all(_filled(images[n], 0xff) for n in ("m0", "m1", "lun")))
+        if keep:
+            print(f"  certificates kept in {tmp}")
+    finally:
+        for loop in loops:
+            subprocess.run(["losetup", "-d", loop], capture_output=True)
+        if not keep:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+
+SCENARIOS = {"android": android, "stations": stations, "targets": targets}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="uee_smoke.py", description="UEE smoke scenarios")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name in SCENARIOS:
+        scenario_parser = sub.add_parser(name, help=f"run the {name} scenario")
+        if name == "targets":
+            scenario_parser.add_argument("--keep", action="store_true", help="keep the images and certificates")
+    sub.add_parser("all", help="run every scenario")
+    args = parser.parse_args(argv)
+
+    checks = Checks()
+    for name, scenario in SCENARIOS.items():
+        if args.command not in (name, "all"):
+            continue
+        if name == "targets":
+            scenario(checks, keep=getattr(args, "keep", False))
+        else:
+            scenario(checks)
+    print(f"{checks.passed} passed, {len(checks.failed)} failed.")
+    return 1 if checks.failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,825 @@
+"""
+UEE multi-station coordination.
+
+An intake with several erase stations runs one coordinator, and every
+station runs an agent that registers with it. The protocol is one JSON
+object per line over TCP:
+
+  station -> coordinator   register (drives, Android devices, bandwidth,
+                           slots, the jobs it still knows), state (phase,
+                           progress and media throughput of its jobs,
+                           every STATE_INTERVAL), result (outcome, the
+                           station's ledger row, the certificate)
+  coordinator -> station   job (id, kind, target, plan)
+  client -> coordinator    submit (a batch of jobs), status
+
+Jobs are queued centrally. A job goes to a station that has a free slot
+and spare bandwidth. Spare bandwidth is the station's budget minus the
+throughput its running jobs measure (uee_metrics). A job that has not
+measured anything yet counts with the throughput the ledger expects for
+its model. A drive that several stations can reach (shared enclosures)
+goes to the one with the most headroom. Android batches go to stations
+with phones attached, one batch per station at a time. Results land in
+the coordinator's ledger together with the station that ran them, and
+certificates are copied next to it.
+
+A station runs every job through its own uee-cli.py (format --yes,
+android-wipe --yes). The same safety checks, certificates and local
+ledger apply as for an operator at that station. Every station can run
+from its own UEE_RUN_DIR with its own simulated drives, so a whole
+intake can be rehearsed on one machine.
+
+The state reports double as keepalives: a station that sends nothing
+for STATION_TIMEOUT is taken offline, and a station that registers
+again from the same host replaces its old connection once that has
+missed a report, so a half-open link never keeps a station's name or
+jobs. A refused agent keeps retrying instead of exiting.
+
+Registering, submitting and status need the shared token (--token or
+UEE_STATION_TOKEN) when the coordinator has one.
+
+Usage: python3 uee_station.py coordinator [--listen 127.0.0.1:9478]
+       python3 uee_station.py station bay1 [--coordinator 127.0.0.1:9478] [--bandwidth 1G] [--slots 4]
+       python3 uee_station.py submit sim:bay00 sim:bay01 --filesystem ext4 --pattern zeros --passes 1
+       python3 uee_station.py submit --android --overwrite free-space
+       python3 uee_station.py status
+"""
+import argparse
+import hmac
+import json
+import os
+import socket
+import socketserver
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+import uee_adb
+import uee_ledger
+import uee_metrics
+import uee_qos
+import uee_sim
+import uee_topology
+
+DEFAULT_ADDRESS = "127.0.0.1:9478"
+CLI_FILE = Path(__file__).resolve().with_name("uee-cli.py")
+CERT_DIR = Path("uee_certificates")
+STATE_INTERVAL = 2.0
+# a station that has not reported for this long is offline
+STATION_TIMEOUT = 5 * STATE_INTERVAL
+SCAN_INTERVAL = 10.0
+RECONNECT_INTERVAL = 2.0
+REQUEST_TIMEOUT = 10.0
+DEFAULT_SLOTS = 4
+# expected throughput of a job without history for its model
+DEFAULT_JOB_RATE = 150 * 10 ** 6
+ANDROID_JOB_RATE = 40 * 10 ** 6
+LOG_TAIL = 20
+KINDS = ['format', 'android-wipe']
+# ledger kinds of the per-device rows of an android-wipe job
+ANDROID_KINDS = ('android-wipe', 'fastboot-wipe')
+FINISHED = ('done', 'failed', 'lost')
+# RAM-backed block devices, never an intake drive
+RAM_DISKS = ("zram", "ram")
+
+
+def parse_address(text):
+    host, _, port = text.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+def _token(token):
+    return token if token is not None else os.environ.get("UEE_STATION_TOKEN", "")
+
+
+class Connection:
+    """One line-delimited JSON stream; send() may be called from any thread."""
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.reader = sock.makefile("r", encoding="utf-8")
+        self.lock = threading.Lock()
+
+    def send(self, message):
+        data = (json.dumps(message) + "\n").encode()
+        with self.lock:
+            self.sock.sendall(data)
+
+    def receive(self):
+        """The next message, None once the peer has closed the connection."""
+        line = self.reader.readline()
+        if not line:
+            return None
+        return json.loads(line)
+
+    def close(self):
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+
+
+def request(address, message, token=None, timeout=REQUEST_TIMEOUT):
+    """Send one client request to the coordinator and return its reply."""
+    sock = socket.create_connection(parse_address(address), timeout=timeout)
+    connection = Connection(sock)
+    try:
+        connection.send(dict(message, token=_token(token)))
+        reply = connection.receive()
+    finally:
+        connection.close()
+    if reply is None:
+        raise OSError("the coordinator closed the connection")
+    if reply.get("type") == "error":
+        raise ValueError(reply["error"])
+    return reply
+
+
+class Coordinator:
+    """Stations, the job queue and the shared ledger; every method runs under the lock."""
+
+    def __init__(self, token=None, ledger_path=uee_ledger.LEDGER_FILE, cert_dir=CERT_DIR):
+        self.token = _token(token)
+        # the handler threads open their own sqlite connections
+        self.ledger_path = ledger_path
+        uee_ledger.Ledger(ledger_path).close()
+        self.cert_dir = Path(cert_dir)
+        self.lock = threading.Lock()
+        self.stations = {}
+        self.jobs = {}
+        self.next_id = 1
+
+    def authorized(self, message):
+        return not self.token or hmac.compare_digest(str(message.get("token") or ""), self.token)
+
+    # --- stations ---
+
+    def register(self, message, connection):
+        name = message["station"]
+        old = self.stations.get(name)
+        if old is not None and old["online"]:
+            age = time.time() - old["seen"]
+            # a live agent reports every STATE_INTERVAL; a second one under its name is turned away
+            if age < STATION_TIMEOUT and (old["host"] != message.get("host") or age < 2 * STATE_INTERVAL):
+                raise ValueError(f"station '{name}' is already registered from {old['host']}")
+            # the same station back before its old connection timed out
+            self._drop(old, "reconnected")
+        station = {"name": name, "host": message.get("host"), "drives": message.get("drives", []),
+                   "android": message.get("android", []), "bandwidth": int(message.get("bandwidth") or 0),
+                   "slots": int(message.get("slots") or DEFAULT_SLOTS), "jobs": {}, "online": True,
+                   "connection": connection, "seen": time.time()}
+        known = set(message.get("jobs", []))
+        for job in self.jobs.values():
+            if job["station"] != name or job["state"] != 'running':
+                continue
+            if job["id"] in known:
+                station["jobs"][job["id"]] = old["jobs"].get(job["id"], {}) if old else {}
+            else:
+                # the station restarted without it
+                self._finish(job, 'lost', None)
+        self.stations[name] = station
+        print(f"Station {name} registered from {station['host']}: {len(station['drives'])} drives, "
+              f"{len(station['android'])} Android devices, {uee_qos.format_rate(station['bandwidth'])}.", flush=True)
+
+    def _drop(self, station, reason):
+        connection = station["connection"]
+        station["online"] = False
+        station["connection"] = None
+        if connection is not None:
+            # wakes its handler thread, which then finds the connection replaced
+            connection.close()
+        print(f"Station {station['name']} went offline ({reason}).", flush=True)
+
+    def disconnected(self, name, connection):
+        station = self.stations.get(name)
+        if station is not None and station["connection"] is connection:
+            self._drop(station, "disconnected")
+
+    def expire(self):
+        """Take stations offline that stopped reporting; their running jobs wait for them to register again."""
+        now = time.time()
+        for station in self.stations.values():
+            if station["online"] and now - station["seen"] > STATION_TIMEOUT:
+                self._drop(station, f"silent for {now - station['seen']:.0f} s")
+
+    def update_state(self, name, message):
+        station = self.stations[name]
+        station["seen"] = time.time()
+        if "drives" in message:
+            station["drives"] = message["drives"]
+        if "android" in message:
+            station["android"] = message["android"]
+        for job_id, state in message.get("jobs", {}).items():
+            job_id = int(job_id)
+            if job_id in station["jobs"]:
+                station["jobs"][job_id] = state
+                self.jobs[job_id]["progress"] = state
+
+    def _spare(self, station):
+        if not station["bandwidth"]:
+            return float("inf")
+        used = 0
+        for job_id, state in station["jobs"].items():
+            measured = int(state.get("rate") or 0)
+            used += measured if measured else self.jobs[job_id]["expected"]
+        return station["bandwidth"] - used
+
+    def _drive(self, station, job):
+        for drive in station["drives"]:
+            if job["serial"] and drive.get("serial") == job["serial"]:
+                return drive
+            if drive["name"] == job["target"]:
+                return drive
+        return None
+
+    def _can_run(self, station, job):
+        if not station["online"] or len(station["jobs"]) >= station["slots"]:
+            return False
+        if job["station"] and job["station"] != station["name"]:
+            return False
+        running = [self.jobs[i] for i in station["jobs"]]
+        if job["kind"] == 'android-wipe':
+            return bool(station["android"]) and not any(j["kind"] == 'android-wipe' for j in running)
+        drive = self._drive(station, job)
+        return drive is not None and not any(j["target"] == drive["name"] for j in running)
+
+    def dispatch(self):
+        """Assign queued jobs; returns the (connection, message) pairs to send outside the lock."""
+        outgoing = []
+        for job in sorted(self.jobs.values(), key=lambda j: j["id"]):
+            if job["state"] != 'queued':
+                continue
+            candidates = [s for s in self.stations.values() if self._can_run(s, job)]
+            if not candidates:
+                continue
+            station = max(candidates, key=lambda s: (self._spare(s), -len(s["jobs"])))
+            # an idle station always takes a job, however small its budget
+            if station["jobs"] and self._spare(station) < job["expected"]:
+                continue
+            if job["kind"] == 'format':
+                drive = self._drive(station, job)
+                job["target"], job["serial"] = drive["name"], drive.get("serial") or job["serial"]
+                job["model"] = drive.get("model")
+            job.update(state='running', station=station["name"], started=time.time())
+            station["jobs"][job["id"]] = {}
+            outgoing.append((station["connection"], {"type": "job", "job": job["id"], "kind": job["kind"],
+                                                     "target": job["target"], "plan": job["plan"]}))
+            print(f"Job {job['id']} ({job['kind']} {job['target'] or ''}) -> station {station['name']}.", flush=True)
+        return outgoing
+
+    # --- jobs ---
+
+    def _expected(self, kind, model):
+        if kind == 'android-wipe':
+            return ANDROID_JOB_RATE
+        ledger = uee_ledger.Ledger(self.ledger_path)
+        try:
+            rate = ledger.throughput(model)
+        finally:
+            ledger.close()
+        return int(rate * 1e6) if rate else DEFAULT_JOB_RATE
+
+    def _reported(self, target, station=None):
+        """Whether an online station (station, if given) reports target by name or serial."""
+        return any(s["online"] and (station is None or s["name"] == station)
+                   and any(target in (d["name"], d.get("serial")) for d in s["drives"])
+                   for s in self.stations.values())
+
+    def _model(self, target):
+        for station in self.stations.values():
+            for drive in station["drives"]:
+                if target in (drive["name"], drive.get("serial")):
+                    return drive.get("model")
+        return None
+
+    def submit(self, message):
+        """Queue a batch; returns the new job ids."""
+        plan = message.get("plan") or {}
+        kind = message.get("kind", 'format')
+        if kind not in KINDS:
+            raise ValueError(f"unknown job kind '{kind}'")
+        if kind == 'format' and not plan.get("filesystem"):
+            raise ValueError("a format plan needs a filesystem")
+        targets = message.get("targets") or []
+        if kind == 'format' and not targets:
+            raise ValueError("no drives given")
+        if kind == 'android-wipe':
+            targets = [None] * max(int(message.get("count") or 1), 1)
+        busy = {j["target"] for j in self.jobs.values() if j["state"] not in FINISHED}
+        busy |= {j["serial"] for j in self.jobs.values() if j["state"] not in FINISHED and j["serial"]}
+        taken = [t for t in targets if t is not None and t in busy]
+        if taken:
+            raise ValueError(f"already queued or running: {', '.join(taken)}")
+        # a drive no station offers would wait in the queue forever
+        unknown = [t for t in targets if t is not None and not self._reported(t, message.get("station"))]
+        if unknown:
+            where = f"station '{message['station']}'" if message.get("station") else "any online station"
+            raise ValueError(f"not offered by {where}: {', '.join(unknown)}")
+        ids = []
+        for target in targets:
+            model = self._model(target) if target else None
+            # a target that looks like a device path is a drive name, anything else a serial
+            is_name = target is not None and (target.startswith("/dev/") or uee_sim.is_sim(target))
+            job = {"id": self.next_id, "kind": kind, "target": target if is_name else None,
+                   "serial": None if is_name else target, "model": model, "plan": plan,
+                   "station": message.get("station"), "state": 'queued', "submitted": time.time(),
+                   "started": None, "finished": None, "outcome": None, "progress": {},
+                   "expected": self._expected(kind, model), "log": []}
+            self.jobs[job["id"]] = job
+            ids.append(job["id"])
+            self.next_id += 1
+        return ids
+
+    def _finish(self, job, state, outcome):
+        job.update(state=state, outcome=outcome, finished=time.time())
+        station = self.stations.get(job["station"])
+        if station is not None:
+            station["jobs"].pop(job["id"], None)
+
+    def _save_certificate(self, station, job, certificate):
+        directory = self.cert_dir / station
+        directory.mkdir(parents=True, exist_ok=True)
+        name = (job["serial"] or os.path.basename(job["target"] or "android")).replace("/", "_")
+        path = directory / f"{name}-job{job['id']}.json"
+        with open(path, "w") as f:
+            json.dump(certificate, f, indent=2)
+        return str(path)
+
+    def result(self, name, message):
+        self.stations[name]["seen"] = time.time()
+        job = self.jobs.get(int(message["job"]))
+        if job is None or job["station"] != name or job["state"] != 'running':
+            return
+        row = message.get("row") or {}
+        certificate = message.get("certificate")
+        outcome = message.get("outcome") or ('success' if message.get("status") == 0 else 'failed')
+        job["log"] = message.get("log", [])
+        self._finish(job, 'done' if message.get("status") == 0 else 'failed', outcome)
+        try:
+            ledger = uee_ledger.Ledger(self.ledger_path)
+            try:
+                for device in message.get("devices") or []:
+                    ledger.record(
+                        kind=device["kind"], started=device["started"], outcome=device["outcome"],
+                        device=device.get("device"), serial=device.get("serial"), model=device.get("model"),
+                        size_bytes=device.get("size_bytes"), pattern=device.get("pattern"),
+                        passes=device.get("passes"), phases=json.loads(device.get("phases") or "{}"),
+                        finished=device.get("finished"), station=name,
+                        wipe_bytes=device.get("wipe_bytes"), wipe_seconds=device.get("wipe_seconds"))
+                if not message.get("devices"):
+                    ledger.record(
+                        kind=job["kind"], started=row.get("started") or job["started"], outcome=outcome,
+                        device=job["target"], serial=row.get("serial") or job["serial"], model=row.get("model") or job["model"],
+                        size_bytes=row.get("size_bytes"), pattern=row.get("pattern") or job["plan"].get("pattern"),
+                        passes=row.get("passes") or job["plan"].get("passes"), verify=row.get("verify"),
+                        filesystem=row.get("filesystem") or job["plan"].get("filesystem"),
+                        phases=json.loads(row.get("phases") or "{}"), certificate=certificate,
+                        certificate_path=self._save_certificate(name, job, certificate) if certificate else None,
+                        finished=row.get("finished"), station=name)
+            finally:
+                ledger.close()
+        except (OSError, ValueError, sqlite3.Error) as e:
+            print(f"Failed to record job {job['id']} in the ledger: {e}", file=sys.stderr, flush=True)
+        print(f"Job {job['id']} on station {name}: {outcome}.", flush=True)
+
+    def status(self):
+        stations = []
+        for station in sorted(self.stations.values(), key=lambda s: s["name"]):
+            spare = self._spare(station)
+            stations.append({key: station[key] for key in ("name", "host", "drives", "android", "bandwidth",
+                                                            "slots", "online", "seen")}
+                            | {"jobs": sorted(station["jobs"]), "spare": None if spare == float("inf") else spare})
+        return {"type": "status", "stations": stations,
+                "jobs": [{k: v for k, v in job.items()} for _, job in sorted(self.jobs.items())]}
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    """One connection: a station for its lifetime, or a client for one request."""
+
+    def handle(self):
+        coordinator = self.server.coordinator
+        connection = Connection(self.request)
+        station = None
+        try:
+            while True:
+                try:
+                    message = connection.receive()
+                except (OSError, ValueError):
+                    break
+                if message is None:
+                    break
+                reply, outgoing = None, []
+                with coordinator.lock:
+                    try:
+                        kind = message.get("type")
+                        if station is None and not coordinator.authorized(message):
+                            reply = {"type": "error", "error": "invalid token"}
+                        elif kind == "register":
+                            coordinator.register(message, connection)
+                            station = message["station"]
+                            reply = {"type": "welcome", "station": station}
+                            # state reports arrive every STATE_INTERVAL, silence means a dead link
+                            self.request.settimeout(STATION_TIMEOUT)
+                        elif kind == "state" and station:
+                            coordinator.update_state(station, message)
+                        elif kind == "result" and station:
+                            coordinator.result(station, message)
+                        elif kind == "submit":
+                            reply = {"type": "submitted", "jobs": coordinator.submit(message)}
+                        elif kind == "status":
+                            reply = coordinator.status()
+                        else:
+                            reply = {"type": "error", "error": f"unexpected message '{kind}'"}
+                    except (KeyError, ValueError, TypeError) as e:
+                        reply = {"type": "error", "error": str(e)}
+                    coordinator.expire()
+                    outgoing = coordinator.dispatch()
+                if reply is not None:
+                    connection.send(reply)
+                for target, job in outgoing:
+                    try:
+                        target.send(job)
+                    except OSError:
+                        # the station's reconnect finds the job again, or reports it lost
+                        pass
+                if station is None and reply is not None and reply["type"] != "welcome":
+                    break
+        finally:
+            if station is not None:
+                with coordinator.lock:
+                    coordinator.disconnected(station, connection)
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def _expire_loop(coordinator, stopped):
+    while not stopped.wait(STATE_INTERVAL):
+        with coordinator.lock:
+            coordinator.expire()
+
+
+def serve(listen=DEFAULT_ADDRESS, token=None, ledger_path=uee_ledger.LEDGER_FILE):
+    server = _Server(parse_address(listen), _Handler)
+    server.coordinator = Coordinator(token, ledger_path)
+    stopped = threading.Event()
+    threading.Thread(target=_expire_loop, args=(server.coordinator, stopped), daemon=True).start()
+    print(f"Coordinator listening on {listen}, ledger {ledger_path}.", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stopped.set()
+        server.server_close()
+
+
+def local_drives():
+    """
+    Whole disks of this station that may be wiped, in the shape of the
+    front-ends' drive scans. The disks of the running system (the ones
+    uee_topology refuses) and RAM disks are not offered to the coordinator.
+    """
+    drives = []
+    try:
+        result = subprocess.run(["lsblk", "-J", "-d", "-o", "NAME,SIZE,MODEL,SERIAL,TYPE"],
+                                capture_output=True, text=True, check=True)
+        topology = uee_topology.Topology()
+        for item in json.loads(result.stdout).get('blockdevices', []):
+            if item.get('type') in ['rom', 'loop'] or item['name'].startswith(RAM_DISKS):
+                continue
+            name = "/dev/" + item['name']
+            try:
+                if topology.plan(name)["refused"]:
+                    continue
+            except uee_topology.TopologyError:
+                continue
+            drives.append({"name": name, "size": item.get('size'),
+                           "model": (item.get('model') or '').strip(), "serial": item.get('serial') or ''})
+        drives = uee_topology.group_drives(drives, topology)
+    except (OSError, ValueError, subprocess.CalledProcessError):
+        pass
+    return drives + uee_sim.list_drives()
+
+
+def android_devices():
+    try:
+        return sorted(serial for serial, state in uee_adb.AdbClient().devices().items() if state == 'device')
+    except (OSError, uee_adb.AdbError, ValueError):
+        return []
+
+
+def command(job, certificate, cli=CLI_FILE):
+    """The uee-cli.py command line that runs job at this station."""
+    plan = job["plan"]
+    if job["kind"] == 'android-wipe':
+        cmd = [sys.executable, str(cli), 'android-wipe', '--yes']
+        if plan.get("overwrite"):
+            cmd += ['--overwrite', plan["overwrite"]]
+        if plan.get("usb_budget"):
+            cmd += ['--usb-budget', str(plan["usb_budget"])]
+        return cmd
+    cmd = [sys.executable, str(cli), 'format', job["target"], plan["filesystem"], '--yes',
+           '--certificate', str(certificate)]
+    for option in ("pattern", "passes", "scope", "rate"):
+        if plan.get(option) is not None:
+            cmd += [f'--{option}', str(plan[option])]
+    if plan.get("verify") is not None:
+        cmd.append('--verify' if plan["verify"] else '--no-verify')
+    return cmd
+
+
+class Station:
+    """The agent of one station: registers, runs the jobs it is given and reports back."""
+
+    def __init__(self, name, coordinator=DEFAULT_ADDRESS, token=None, bandwidth=0, slots=DEFAULT_SLOTS,
+                 cli=CLI_FILE):
+        self.name = name
+        self.coordinator = coordinator
+        self.token = _token(token)
+        self.bandwidth = bandwidth or int(uee_qos.load_limits()["aggregate"] or 0)
+        self.slots = slots
+        self.cli = cli
+        self.lock = threading.Lock()
+        self.jobs = {}
+        self.outbox = []
+        self.connection = None
+        self.sampler = uee_metrics.Sampler(interval=STATE_INTERVAL)
+        self.drives = []
+        self.android = []
+        self.scanned = 0.0
+        self.stopped = threading.Event()
+
+    def scan(self, force=False):
+        if force or time.monotonic() - self.scanned >= SCAN_INTERVAL:
+            self.scanned = time.monotonic()
+            self.drives = local_drives()
+            self.android = android_devices()
+        return self.drives, self.android
+
+    def _send(self, message):
+        connection = self.connection
+        if connection is None:
+            return False
+        try:
+            connection.send(message)
+            return True
+        except OSError:
+            return False
+
+    def _register(self, connection):
+        drives, android = self.scan(force=True)
+        with self.lock:
+            known = sorted(self.jobs) + [m["job"] for m in self.outbox]
+        connection.send({"type": "register", "station": self.name, "token": self.token,
+                         "host": socket.gethostname(), "drives": drives, "android": android,
+                         "bandwidth": self.bandwidth, "slots": self.slots, "jobs": known})
+        reply = connection.receive()
+        if reply is None or reply.get("type") != "welcome":
+            raise ValueError((reply or {}).get("error", "no reply"))
+
+    def run(self):
+        self.sampler.start()
+        threading.Thread(target=self._state_loop, daemon=True).start()
+        announced = False
+        while not self.stopped.is_set():
+            try:
+                sock = socket.create_connection(parse_address(self.coordinator), timeout=REQUEST_TIMEOUT)
+            except OSError as e:
+                if not announced:
+                    print(f"Waiting for the coordinator at {self.coordinator} ({e})...", flush=True)
+                    announced = True
+                self.stopped.wait(RECONNECT_INTERVAL)
+                continue
+            connection = Connection(sock)
+            refused = None
+            if hasattr(socket, "TCP_USER_TIMEOUT"):
+                # state reports that go unacknowledged this long break the connection
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_USER_TIMEOUT, int(STATION_TIMEOUT * 1000))
+            try:
+                self._register(connection)
+                sock.settimeout(None)
+                print(f"Station {self.name} registered with {self.coordinator}.", flush=True)
+                announced = False
+                self.connection = connection
+                # results of jobs that finished while the coordinator was away
+                with self.lock:
+                    outbox, self.outbox = self.outbox, []
+                for message in outbox:
+                    connection.send(message)
+                while True:
+                    message = connection.receive()
+                    if message is None:
+                        break
+                    if message.get("type") == "job":
+                        self._start(message)
+            except ValueError as e:
+                refused = e
+            except OSError:
+                pass
+            finally:
+                self.connection = None
+                connection.close()
+            if refused is not None:
+                # e.g. another host holds the name; it may go away, so keep trying
+                print(f"Registration refused: {refused}; retrying.", file=sys.stderr, flush=True)
+                self.stopped.wait(STATION_TIMEOUT)
+                continue
+            print("Lost the coordinator, reconnecting...", flush=True)
+            self.stopped.wait(RECONNECT_INTERVAL)
+        return 0
+
+    def _start(self, message):
+        job = {"id": message["job"], "kind": message["kind"], "target": message.get("target"),
+               "plan": message.get("plan") or {}}
+        with self.lock:
+            self.jobs[job["id"]] = {"target": job["target"], "phase": "starting"}
+        threading.Thread(target=self._run_job, args=(job,), daemon=True).start()
+
+    def _run_job(self, job):
+        started = time.time()
+        certificate = None
+        if job["kind"] == 'format':
+            name = os.path.basename(job["target"]).replace(":", "_")
+            CERT_DIR.mkdir(exist_ok=True)
+            certificate = (CERT_DIR / f"{name}-job{job['id']}.json").resolve()
+        print(f"Job {job['id']}: {job['kind']} {job['target'] or ''}", flush=True)
+        log = []
+        try:
+            process = subprocess.Popen(command(job, certificate, self.cli), stdout=subprocess.PIPE,
+                                       stderr=subprocess.STDOUT, text=True, stdin=subprocess.DEVNULL)
+            for line in process.stdout:
+                print(f"[job {job['id']}] {line}", end="", flush=True)
+                log = (log + [line.rstrip()])[-LOG_TAIL:]
+            status = process.wait()
+        except OSError as e:
+            log, status = [str(e)], 1
+        row, devices = None, []
+        try:
+            ledger = uee_ledger.Ledger()
+            try:
+                rows = ledger.query(since=started - 1, limit=LOG_TAIL)
+            finally:
+                ledger.close()
+            if job["kind"] == 'format':
+                rows = [r for r in rows if r["device"] == job["target"]]
+                row = rows[0] if rows else None
+            else:
+                # the local cli recorded one row per phone of the batch
+                devices = [r for r in rows if r["kind"] in ANDROID_KINDS]
+        except Exception:
+            row, devices = None, []
+        message = {"type": "result", "job": job["id"], "status": status, "log": log,
+                   "outcome": row["outcome"] if row else None, "row": row, "devices": devices,
+                   "certificate": uee_ledger.load_certificate(certificate) if certificate else None}
+        print(f"Job {job['id']} finished: {message['outcome'] or ('success' if status == 0 else 'failed')}.", flush=True)
+        with self.lock:
+            self.jobs.pop(job["id"], None)
+            if not self._send(message):
+                self.outbox.append(message)
+
+    def _state(self):
+        """Progress of the running jobs, with the media throughput they measure."""
+        rows = {row["device"]: row for row in self.sampler.snapshot()}
+        with self.lock:
+            jobs = {job_id: dict(state) for job_id, state in self.jobs.items()}
+        for job_id, state in jobs.items():
+            row = rows.get(state.pop("target"))
+            if row is not None:
+                state.update(phase=row.get("phase"), done=row.get("done"), total=row.get("total"),
+                             rate=int((row.get("write_mb_per_s", 0) + row.get("read_mb_per_s", 0)) * 1e6))
+        return jobs
+
+    def _state_loop(self):
+        while not self.stopped.wait(STATE_INTERVAL):
+            drives, android = self.scan()
+            self._send({"type": "state", "jobs": self._state(), "drives": drives, "android": android})
+
+
+def _rate(row):
+    return f"{row / 1e6:.0f} MB/s" if row else "-"
+
+
+def print_status(status):
+    stations = status["stations"]
+    if not stations:
+        print("No stations registered.")
+    else:
+        print(f"{'STATION':<12} {'HOST':<16} {'STATE':<8} {'DRIVES':>6} {'ANDROID':>7} {'JOBS':>6} "
+              f"{'BANDWIDTH':>12} {'SPARE':>10}")
+        for s in stations:
+            print(f"{s['name']:<12} {(s['host'] or '-')[:16]:<16} {'online' if s['online'] else 'offline':<8} "
+                  f"{len(s['drives']):>6} {len(s['android']):>7} {len(s['jobs']):>3}/{s['slots']:<2} "
+                  f"{uee_qos.format_rate(s['bandwidth']):>12} {_rate(s['spare']) if s['spare'] is not None else '-':>10}")
+    jobs = status["jobs"]
+    if jobs:
+        print()
+        print(f"{'JOB':>4} {'KIND':<13} {'TARGET':<16} {'STATION':<12} {'STATE':<8} {'PHASE':<12} {'DONE':>6}   OUTCOME")
+        for job in jobs:
+            progress = job.get("progress") or {}
+            done = f"{100 * progress['done'] // progress['total']}%" if progress.get("total") else "-"
+            print(f"{job['id']:>4} {job['kind']:<13} {(job['target'] or job['serial'] or '-')[:16]:<16} "
+                  f"{job['station'] or '-':<12} {job['state']:<8} {(progress.get('phase') or '-')[:12]:<12} "
+                  f"{done:>6}   {job['outcome'] or '-'}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="uee_station.py", description="UEE multi-station coordination")
+    parser.add_argument("--token", help="shared secret of the coordinator (default: $UEE_STATION_TOKEN)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    coordinator_parser = sub.add_parser("coordinator", help="run the coordinator")
+    coordinator_parser.add_argument("--listen", default=DEFAULT_ADDRESS, metavar="HOST:PORT")
+    coordinator_parser.add_argument("--ledger", default=str(uee_ledger.LEDGER_FILE), help="the shared job ledger")
+
+    station_parser = sub.add_parser("station", help="run a station agent")
+    station_parser.add_argument("name")
+    station_parser.add_argument("--coordinator", default=DEFAULT_ADDRESS, metavar="HOST:PORT")
+    station_parser.add_argument("--bandwidth", type=uee_qos.parse_rate, default=0,
+                                help="throughput the station's jobs may use together, e.g. 1G "
+                                     "(default: the aggregate qos limit, else unlimited)")
+    station_parser.add_argument("--slots", type=int, default=DEFAULT_SLOTS, help="jobs run at once")
+    station_parser.add_argument("--cli", default=str(CLI_FILE), help=argparse.SUPPRESS)
+
+    submit_parser = sub.add_parser("submit", help="queue a batch of jobs")
+    submit_parser.add_argument("targets", nargs="*", help="drives by device name or serial")
+    submit_parser.add_argument("--coordinator", default=DEFAULT_ADDRESS, metavar="HOST:PORT")
+    submit_parser.add_argument("--all", action="store_true", help="every drive of every station that is not busy")
+    submit_parser.add_argument("--station", help="only run on this station")
+    submit_parser.add_argument("--filesystem", choices=['ext4', 'fat32', 'exfat', 'ntfs'])
+    submit_parser.add_argument("--pattern", choices=['zeros', 'ones', 'random', 'crypto', 'scrub', 'none'])
+    submit_parser.add_argument("--passes", type=int)
+    submit_parser.add_argument("--verify", action=argparse.BooleanOptionalAction, default=None)
+    submit_parser.add_argument("--scope", choices=['full', 'allocated'])
+    submit_parser.add_argument("--rate", type=uee_qos.parse_rate)
+    submit_parser.add_argument("--android", type=int, nargs="?", const=1, metavar="COUNT",
+                               help="queue COUNT Android batches (each wipes the phones on one station)")
+    submit_parser.add_argument("--overwrite", choices=['none', 'free-space', 'userdata'])
+    submit_parser.add_argument("--usb-budget", type=uee_qos.parse_rate)
+    submit_parser.add_argument("--yes", "-y", action="store_true", help="do not ask for confirmation")
+
+    status_parser = sub.add_parser("status", help="show stations and jobs")
+    status_parser.add_argument("--coordinator", default=DEFAULT_ADDRESS, metavar="HOST:PORT")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "coordinator":
+        serve(args.listen, args.token, args.ledger)
+    elif args.command == "station":
+        return Station(args.name, args.coordinator, args.token, args.bandwidth, args.slots, args.cli).run()
+    elif args.command == "status":
+        try:
+            print_status(request(args.coordinator, {"type": "status"}, args.token))
+        except (OSError, ValueError) as e:
+            print(f"Status failed: {e}", file=sys.stderr)
+            return 1
+    elif args.command == "submit":
+        if args.android:
+            message = {"type": "submit", "kind": 'android-wipe', "count": args.android,
+                       "plan": {"overwrite": args.overwrite, "usb_budget": args.usb_budget}}
+            what = f"{args.android} Android batch{'es' if args.android > 1 else ''}"
+        else:
+            if not args.filesystem:
+                parser.error("--filesystem is required for drives")
+            targets = args.targets
+            try:
+                if args.all:
+                    status = request(args.coordinator, {"type": "status"}, args.token)
+                    busy = {j["target"] for j in status["jobs"] if j["state"] not in FINISHED}
+                    targets = sorted({d["name"] for s in status["stations"] if s["online"]
+                                      and (not args.station or s["name"] == args.station)
+                                      for d in s["drives"]} - busy)
+            except (OSError, ValueError) as e:
+                print(f"Submit failed: {e}", file=sys.stderr)
+                return 1
+            if not targets:
+                parser.error("no drives given (name them, or use --all)")
+            plan = {"filesystem": args.filesystem, "pattern": args.pattern, "passes": args.passes,
+                    "verify": args.verify, "scope": args.scope, "rate": args.rate}
+            message = {"type": "submit", "kind": 'format', "targets": targets,
+                       "plan": {k: v for k, v in plan.items() if v is not None}}
+            what = f"{len(targets)} drive{'s' if len(targets) > 1 else ''}: {', '.join(targets)}"
+        if args.station:
+            message["station"] = args.station
+        if not args.yes:
+            answer = input(f"PERMANENTLY DESTROY all data on {what}? Type 'yes' to queue: ")
+            if answer.strip() != "yes":
+                print("Cancelled.")
+                return 1
+        try:
+            reply = request(args.coordinator, message, args.token)
+        except (OSError, ValueError) as e:
+            print(f"Submit failed: {e}", file=sys.stderr)
+            return 1
+        print(f"Queued jobs {', '.join(str(i) for i in reply['jobs'])}.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
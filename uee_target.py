@@ -0,0 +1,277 @@
+"""
+UEE wipe targets.
+
+What the engine writes to: a block device, or a regular file holding a
+raw or qcow disk image. An image only holds data in its allocated
+extents (SEEK_DATA/SEEK_HOLE); its holes read back as zeros and cost
+nothing to wipe, so a sparse 1 TB image is wiped in time proportional to
+the data it actually holds. Space a wipe does not need to overwrite is
+released per target: BLKDISCARD/BLKZEROOUT on devices, fallocate hole
+punching/zero ranges on files, writing zeros when neither works.
+
+The passes do not go through the page cache. In 'direct' mode the target
+is opened a second time with O_DIRECT; buffers must be page aligned
+(aligned_buffer, mmap), and pieces whose offset or length is not a
+multiple of the logical sector, such as the tail of an image, go through
+the normal fd. Where O_DIRECT is refused (tmpfs, some FUSE filesystems),
+'writeback' mode writes through the cache but pushes every block out
+with sync_file_range, waits for the one before it and drops it with
+fadvise(DONTNEED). Either way host memory stays flat however many jobs
+run, and a pass only counts bytes that have reached the device.
+
+Zoned devices (host-managed/host-aware SMR, ZNS) report their zones and
+reset them through the target as well; see uee_zoned.
+"""
+import ctypes
+import ctypes.util
+import errno
+import fcntl
+import mmap
+import os
+import stat
+import struct
+
+BLKDISCARD = 0x1277
+BLKZEROOUT = 0x127f
+BLKSSZGET = 0x1268
+DEFAULT_SECTOR_SIZE = 512
+FALLOC_FL_KEEP_SIZE = 0x01
+FALLOC_FL_PUNCH_HOLE = 0x02
+FALLOC_FL_ZERO_RANGE = 0x10
+RELEASE_METHODS = ['discard', 'zero']
+IO_MODES = ['direct', 'writeback']
+SYNC_FILE_RANGE_WAIT_BEFORE = 1
+SYNC_FILE_RANGE_WRITE = 2
+SYNC_FILE_RANGE_WAIT_AFTER = 4
+ZERO_CHUNK = 4 * 1024 * 1024
+# errors that mean "this way of releasing is not supported here", not I/O failures
+UNSUPPORTED = (errno.EOPNOTSUPP, errno.ENOTTY, errno.EINVAL, errno.ENOSYS, errno.EPERM)
+
+_libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+_fallocate = getattr(_libc, "fallocate64", _libc.fallocate)
+_fallocate.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_int64, ctypes.c_int64]
+_sync_file_range = _libc.sync_file_range
+_sync_file_range.argtypes = [ctypes.c_int, ctypes.c_int64, ctypes.c_int64, ctypes.c_uint]
+
+
+def fallocate(fd, mode, offset, length):
+    if _fallocate(fd, mode, offset, length) != 0:
+        err = ctypes.get_errno()
+        raise OSError(err, os.strerror(err))
+
+
+def sync_file_range(fd, offset, length, flags):
+    if _sync_file_range(fd, offset, length, flags) != 0:
+        err = ctypes.get_errno()
+        raise OSError(err, os.strerror(err))
+
+
+def aligned_buffer(size):
+    """A page-aligned, writable buffer that O_DIRECT accepts."""
+    return mmap.mmap(-1, size)
+
+
+def zero_fill(fd, start, length):
+    buffer = memoryview(bytearray(min(ZERO_CHUNK, length)))
+    end = start + length
+    while start < end:
+        start += os.pwrite(fd, buffer[:min(len(buffer), end - start)], start)
+
+
+class Target:
+    kind = None
+
+    def __init__(self, path, readonly=False):
+        self.path = path
+        self.readonly = readonly
+        self.fd = os.open(path, os.O_RDONLY if readonly else os.O_RDWR)
+        self.size = os.lseek(self.fd, 0, os.SEEK_END)
+        self.sector_size = self.logical_sector_size()
+        self.io_mode = None
+        self.direct_fd = None
+        self._unsynced = None
+
+    def close(self):
+        if self.direct_fd is not None:
+            os.close(self.direct_fd)
+        os.close(self.fd)
+
+    def set_io_mode(self, mode='direct'):
+        """Choose how the passes reach the target; returns the mode actually used."""
+        if mode == 'direct' and self.direct_fd is None:
+            try:
+                flags = os.O_RDONLY if self.readonly else os.O_RDWR
+                self.direct_fd = os.open(self.path, flags | os.O_DIRECT)
+            except OSError as e:
+                if e.errno not in (errno.EINVAL, errno.EOPNOTSUPP):
+                    raise
+                mode = 'writeback'
+        self.io_mode = mode
+        return mode
+
+    def _fd(self, view, offset):
+        if self.direct_fd is not None and not (offset % self.sector_size or len(view) % self.sector_size):
+            return self.direct_fd
+        return self.fd
+
+    def pwrite(self, view, offset):
+        return os.pwrite(self._fd(view, offset), view, offset)
+
+    def preadv(self, view, offset):
+        return os.preadv(self._fd(view, offset), [view], offset)
+
+    def written(self, offset, length):
+        """
+        Called after each block of a pass; returns how many bytes of the
+        pass are not on the device yet.
+        """
+        if self.io_mode != 'writeback':
+            return 0
+        # start this block, then wait for the previous one and drop it from the cache
+        sync_file_range(self.fd, offset, length, SYNC_FILE_RANGE_WRITE)
+        previous, self._unsynced = self._unsynced, (offset, length)
+        if previous is not None:
+            sync_file_range(self.fd, previous[0], previous[1],
+                            SYNC_FILE_RANGE_WAIT_BEFORE | SYNC_FILE_RANGE_WRITE | SYNC_FILE_RANGE_WAIT_AFTER)
+            os.posix_fadvise(self.fd, previous[0], previous[1], os.POSIX_FADV_DONTNEED)
+        return length
+
+    def read(self, offset, length):
+        """Called after each block of a verify."""
+        if self.io_mode == 'writeback':
+            os.posix_fadvise(self.fd, offset, length, os.POSIX_FADV_DONTNEED)
+
+    def flush(self):
+        """Make a pass durable, including the device's write cache."""
+        os.fsync(self.fd)
+        if self._unsynced is not None:
+            os.posix_fadvise(self.fd, self._unsynced[0], self._unsynced[1], os.POSIX_FADV_DONTNEED)
+            self._unsynced = None
+
+    def data_extents(self):
+        return [(0, self.size)]
+
+    def zoned(self, sysfs_root=None):
+        """Zone model, limits and layout (uee_zoned), None for a regular device."""
+        return None
+
+    def reset_zone(self, start, length):
+        raise OSError(errno.EOPNOTSUPP, f"'{self.path}' is not a zoned device")
+
+    def finish_zone(self, start, length):
+        raise OSError(errno.EOPNOTSUPP, f"'{self.path}' is not a zoned device")
+
+    def logical_sector_size(self):
+        """Smallest unit the target can write; the engine does not retry failed writes below it."""
+        return DEFAULT_SECTOR_SIZE
+
+    def release_methods(self, method):
+        return [('write', zero_fill)]
+
+    def release(self, extents, method='discard', progress=None):
+        """
+        Release extents with the first method that works, dropping a
+        method for good once it proves unsupported. Returns bytes per
+        method actually used.
+        """
+        methods = self.release_methods(method)
+        used = {}
+        done = 0
+        for start, length in extents:
+            while True:
+                name, operation = methods[0]
+                try:
+                    operation(self.fd, start, length)
+                    break
+                except OSError as e:
+                    if len(methods) == 1 or e.errno not in UNSUPPORTED:
+                        raise
+                    methods.pop(0)
+            used[name] = used.get(name, 0) + length
+            done += length
+            if progress is not None:
+                progress.update(done)
+        return used
+
+
+def _ioctl_range(request):
+    def operation(fd, start, length):
+        fcntl.ioctl(fd, request, struct.pack("QQ", start, length))
+    return operation
+
+
+class BlockTarget(Target):
+    kind = "block"
+
+    def logical_sector_size(self):
+        try:
+            return struct.unpack("i", fcntl.ioctl(self.fd, BLKSSZGET, struct.pack("i", 0)))[0]
+        except OSError:
+            return DEFAULT_SECTOR_SIZE
+
+    def release_methods(self, method):
+        methods = [('zeroout', _ioctl_range(BLKZEROOUT)), ('write', zero_fill)]
+        if method == 'discard':
+            methods.insert(0, ('discard', _ioctl_range(BLKDISCARD)))
+        return methods
+
+    def zoned(self, sysfs_root=None):
+        # uee_zoned builds on this module
+        import uee_zoned
+        return uee_zoned.layout(self.path, self.fd, self.size, sysfs_root or uee_zoned.SYSFS_ROOT)
+
+    def reset_zone(self, start, length):
+        import uee_zoned
+        uee_zoned.reset_zone(self.fd, start, length)
+
+    def finish_zone(self, start, length):
+        import uee_zoned
+        uee_zoned.finish_zone(self.fd, start, length)
+
+
+class FileTarget(Target):
+    kind = "file"
+
+    def data_extents(self):
+        """The allocated extents of the file; the whole file where SEEK_DATA is unsupported."""
+        extents = []
+        offset = 0
+        while offset < self.size:
+            try:
+                start = os.lseek(self.fd, offset, os.SEEK_DATA)
+            except OSError as e:
+                if e.errno == errno.ENXIO:
+                    # only a hole after offset
+                    break
+                if e.errno in UNSUPPORTED:
+                    return [(0, self.size)]
+                raise
+            end = min(os.lseek(self.fd, start, os.SEEK_HOLE), self.size)
+            extents.append((start, end - start))
+            offset = end
+        return extents
+
+    def release_methods(self, method):
+        if method == 'discard':
+            mode, name = FALLOC_FL_PUNCH_HOLE | FALLOC_FL_KEEP_SIZE, 'punch'
+        else:
+            mode, name = FALLOC_FL_ZERO_RANGE | FALLOC_FL_KEEP_SIZE, 'zero-range'
+        return [(name, lambda fd, start, length: fallocate(fd, mode, start, length)), ('write', zero_fill)]
+
+    def identity(self):
+        st = os.fstat(self.fd)
+        return {"name": self.path, "type": "image", "size_bytes": self.size,
+                "allocated_bytes": st.st_blocks * 512, "inode": st.st_ino}
+
+
+def open_target(path, readonly=False):
+    if path.startswith("sim:"):
+        # uee_sim builds on this module
+        import uee_sim
+        return uee_sim.SimTarget(path, readonly)
+    mode = os.stat(path).st_mode
+    if stat.S_ISBLK(mode):
+        return BlockTarget(path, readonly)
+    if stat.S_ISREG(mode):
+        return FileTarget(path, readonly)
+    raise OSError(errno.EINVAL, f"'{path}' is neither a block device nor a regular file")
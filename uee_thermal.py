@@ -0,0 +1,219 @@
+"""
+UEE thermal-aware throttling.
+
+Polls the temperature of the device being wiped and lowers the engine's
+write rate while it is above the target, pausing entirely above the
+critical threshold. A pause that does not cool the device within
+MAX_PAUSE fails the job; a sensor that stops answering during a pause
+(SENSOR_LOST_READS reads in a row) ends throttling for the rest of the
+job with a warning. Sensors are looked up under a configurable sysfs
+root so a fake tree can stand in for real hardware:
+
+  <root>/block/<dev>/device/hwmon/hwmon*/temp1_input   (drivetemp, SATA/SAS)
+  <root>/block/<dev>/device/hwmon*/temp1_input         (NVMe controller)
+
+with 'nvme smart-log' and 'smartctl' (USB bridges) as fallbacks.
+"""
+import glob
+import json
+import os
+import re
+import subprocess
+import time
+
+import uee_trace
+
+SYSFS_ROOT = "/sys"
+DEFAULT_MAX_TEMP = 60
+DEFAULT_CRITICAL_TEMP = 70
+POLL_INTERVAL = 5.0
+COMMAND_POLL_INTERVAL = 30.0
+RECORD_INTERVAL = 60.0
+HYSTERESIS = 3
+DECREASE = 0.75
+INCREASE = 1.25
+MIN_RATE = 5 * 10 ** 6
+MAX_PAUSE = 30 * 60.0
+SENSOR_LOST_READS = 5
+
+
+class FileSensor:
+    """Millidegrees Celsius from a sysfs-style file (hwmon, drivetemp, fakes)."""
+
+    def __init__(self, path):
+        self.path = path
+        self.name = f"file:{path}"
+        self.interval = POLL_INTERVAL
+
+    def read(self):
+        with open(self.path) as f:
+            return int(f.read().strip()) / 1000.0
+
+
+class CommandSensor:
+    """Temperature parsed from the JSON output of a SMART tool."""
+
+    def __init__(self, name, cmd, parse, run=subprocess.run):
+        self.name = name
+        self.cmd = cmd
+        self.parse = parse
+        self.run = run
+        self.interval = COMMAND_POLL_INTERVAL
+
+    def read(self):
+        result = self.run(self.cmd, capture_output=True, text=True, timeout=10)
+        return float(self.parse(json.loads(result.stdout)))
+
+
+def _nvme_controller(name):
+    # nvme0n1 -> /dev/nvme0
+    match = re.match(r"(nvme\d+)n\d+$", name)
+    return "/dev/" + match.group(1) if match else None
+
+
+def find_sensor(device, sysfs_root=SYSFS_ROOT, run=subprocess.run):
+    """Return the first usable sensor for device, or None."""
+    name = os.path.basename(os.path.realpath(device)) if device.startswith("/dev/") else device
+    for pattern in ["block/{}/device/hwmon/hwmon*/temp1_input", "block/{}/device/hwmon*/temp1_input"]:
+        for path in sorted(glob.glob(os.path.join(sysfs_root, pattern.format(name)))):
+            sensor = FileSensor(path)
+            try:
+                sensor.read()
+                return sensor
+            except (OSError, ValueError):
+                continue
+
+    candidates = []
+    controller = _nvme_controller(name)
+    if controller:
+        candidates.append(CommandSensor("nvme smart-log", ["nvme", "smart-log", controller, "-o", "json"],
+                                        lambda data: data["temperature"] - 273.15, run))
+    candidates.append(CommandSensor("smartctl", ["smartctl", "-A", "-j", device],
+                                    lambda data: data["temperature"]["current"], run))
+    for sensor in candidates:
+        try:
+            sensor.read()
+            return sensor
+        except Exception:
+            continue
+    return None
+
+
+class ThermalGovernor:
+    """
+    AIMD control of a Throttle's thermal cap: cut the rate by DECREASE
+    every poll while above max_temp, raise it by INCREASE once it is
+    HYSTERESIS degrees below, pause while at or above critical_temp.
+    """
+
+    def __init__(self, sensor, max_temp=DEFAULT_MAX_TEMP, critical_temp=DEFAULT_CRITICAL_TEMP,
+                 sleep=time.sleep, clock=time.monotonic):
+        self.sensor = sensor
+        self.max_temp = max_temp
+        self.critical_temp = critical_temp
+        self.sleep = sleep
+        self.clock = clock
+        self.started = clock()
+        self.next_poll = 0.0
+        self.next_record = 0.0
+        self.temperature = None
+        self.peak = None
+        self.cap = 0
+        self.pauses = 0
+        self.paused_seconds = 0.0
+        self.sensor_lost = False
+        self.samples = []
+        self.bytes = 0
+        self.window_start = self.started
+        self.window_bytes = 0
+        self.rate = 0.0
+        self.peak_rate = 0.0
+
+    def _read(self):
+        try:
+            self.temperature = self.sensor.read()
+        except Exception:
+            return None
+        if self.peak is None or self.temperature > self.peak:
+            self.peak = self.temperature
+        uee_trace.emit("C", "temperature", args={"celsius": self.temperature})
+        return self.temperature
+
+    def poll(self, throttle, nbytes):
+        """Account nbytes and, once per sensor interval, adjust the cap."""
+        self.bytes += nbytes
+        self.window_bytes += nbytes
+        now = self.clock()
+        if now < self.next_poll or self.sensor_lost:
+            return
+        self.next_poll = now + self.sensor.interval
+        if now > self.window_start:
+            self.rate = self.window_bytes / (now - self.window_start)
+            if not self.cap:
+                self.peak_rate = max(self.peak_rate, self.rate)
+        self.window_start, self.window_bytes = now, 0
+
+        temp = self._read()
+        if temp is None:
+            return
+        if now >= self.next_record:
+            self.next_record = now + RECORD_INTERVAL
+            self.samples.append([round(now - self.started, 1), round(temp, 1), round(self.rate / 1e6, 1)])
+
+        if temp >= self.critical_temp:
+            self.pause(temp)
+            if self.sensor_lost:
+                self.set_cap(throttle, 0)
+        elif temp >= self.max_temp:
+            base = self.cap or self.rate or self.peak_rate
+            self.set_cap(throttle, max(MIN_RATE, int(base * DECREASE)))
+        elif self.cap and temp <= self.max_temp - HYSTERESIS:
+            raised = int(self.cap * INCREASE)
+            self.set_cap(throttle, 0 if self.peak_rate and raised >= self.peak_rate else raised)
+
+    def pause(self, temp):
+        print(f"Device at {temp:.0f}C (critical {self.critical_temp}C), pausing until it cools "
+              f"below {self.max_temp - HYSTERESIS}C...", flush=True)
+        self.pauses += 1
+        started = self.clock()
+        misses = 0
+        while temp is None or temp > self.max_temp - HYSTERESIS:
+            if self.clock() - started >= MAX_PAUSE:
+                self.paused_seconds += self.clock() - started
+                raise OSError(f"device still at {self.temperature:.0f}C after a {MAX_PAUSE / 60:.0f} min pause, "
+                              f"giving up")
+            self.sleep(self.sensor.interval)
+            temp = self._read()
+            misses = misses + 1 if temp is None else 0
+            if misses >= SENSOR_LOST_READS:
+                self.sensor_lost = True
+                break
+        self.paused_seconds += self.clock() - started
+        self.window_start = self.clock()
+        if self.sensor_lost:
+            print(f"Warning: temperature sensor {self.sensor.name} stopped answering, "
+                  f"resuming without thermal throttling.", flush=True)
+        else:
+            print(f"Device cooled to {temp:.0f}C, resuming.", flush=True)
+
+    def set_cap(self, throttle, cap):
+        if cap == self.cap:
+            return
+        self.cap = cap
+        throttle.thermal_cap = cap
+        throttle.refresh(force=True)
+
+    def describe(self):
+        return f"{self.temperature:.0f}C" if self.temperature is not None else ""
+
+    def summary(self):
+        return {
+            "sensor": self.sensor.name,
+            "max_temp_c": self.max_temp,
+            "critical_temp_c": self.critical_temp,
+            "peak_c": self.peak,
+            "pauses": self.pauses,
+            "paused_seconds": round(self.paused_seconds, 1),
+            "sensor_lost": self.sensor_lost,
+            "samples": self.samples,
+        }
@@ -0,0 +1,473 @@
+"""
+UEE device topology and teardown.
+
+Before a disk is wiped, everything stacked on it has to let go: mounts,
+swap, device-mapper targets (dm-crypt, LVM) and md arrays, on the disk
+itself and on its partitions. The index is built once from sysfs
+(<root>/class/block/*: dev, partition, holders, slaves, dm/, md/) and
+<proc>/self/mountinfo and <proc>/swaps, with no per-partition commands.
+
+Teardown goes top down: swap is switched off (swap files first, they
+keep their filesystem busy), filesystems are unmounted deepest first,
+then dm targets and md arrays are closed level by level, holders before
+the devices they sit on. Independent steps within a stage run in
+parallel. A disk that carries the running system (/, /boot, /usr, ...)
+is refused before anything is touched.
+
+Targets are resolved to the physical disks behind them first. An md
+array or a dm device (dm-raid, LVM, a multipath map) expands into the
+disks it sits on, which are wiped concurrently instead of through the
+array. Paths to the same LUN, held by one dm-multipath map or reporting
+the same globally unique WWID (naa., eui.), collapse into a single wipe
+over the best path: a running one, ALUA active/optimized before
+non-optimized before standby.
+
+Usage: python3 uee_topology.py show /dev/sdb
+       python3 uee_topology.py resolve /dev/md0
+       python3 uee_topology.py teardown /dev/sdb [--dry-run]
+"""
+import argparse
+import ctypes
+import ctypes.util
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+SYSFS_ROOT = "/sys"
+PROC_ROOT = "/proc"
+SYSTEM_MOUNTS = ["/", "/boot", "/boot/efi", "/efi", "/usr", "/var", "/etc", "/home", "/opt", "/nix"]
+# designators that are unique by construction; t10. and vendor ids can repeat across drives
+UNIQUE_WWIDS = ("naa.", "eui.", "nguid.", "uuid.")
+ALUA_RANK = {"active/optimized": 0, "active/non-optimized": 1, "transitioning": 2, "standby": 3}
+MAX_WORKERS = 8
+
+_libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+_libc.umount2.argtypes = [ctypes.c_char_p, ctypes.c_int]
+_libc.swapoff.argtypes = [ctypes.c_char_p]
+
+
+class TopologyError(Exception):
+    pass
+
+
+def _read(path, default=None):
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return default
+
+
+def _listdir(path):
+    try:
+        return sorted(os.listdir(path))
+    except OSError:
+        return []
+
+
+def _unescape(field):
+    # mountinfo and swaps escape space, tab, newline and backslash as \\ooo
+    return field.replace("\\040", " ").replace("\\011", "\t").replace("\\012", "\n").replace("\\134", "\\")
+
+
+class Topology:
+    """Block devices, their holders, mounts and swap, read once."""
+
+    def __init__(self, sysfs_root=SYSFS_ROOT, proc_root=PROC_ROOT):
+        self.nodes = {}
+        self.by_dev = {}
+        self.by_dm_name = {}
+        base = os.path.join(sysfs_root, "class", "block")
+        for name in _listdir(base):
+            path = os.path.join(base, name)
+            node = {"name": name, "dev": _read(os.path.join(path, "dev")), "kind": "disk", "parent": None,
+                    "holders": _listdir(os.path.join(path, "holders")),
+                    "slaves": _listdir(os.path.join(path, "slaves")), "mounts": [], "swaps": []}
+            if os.path.exists(os.path.join(path, "partition")):
+                node["kind"] = "part"
+                node["parent"] = os.path.basename(os.path.dirname(os.path.realpath(path)))
+            elif os.path.isdir(os.path.join(path, "dm")):
+                node["kind"] = "dm"
+                node["dm_name"] = _read(os.path.join(path, "dm", "name"))
+                node["dm_uuid"] = _read(os.path.join(path, "dm", "uuid"), "")
+                self.by_dm_name[node["dm_name"]] = name
+            elif os.path.isdir(os.path.join(path, "md")):
+                node["kind"] = "md"
+            else:
+                node["wwid"] = _read(os.path.join(path, "device", "wwid")) or _read(os.path.join(path, "wwid"))
+                node["size"] = _read(os.path.join(path, "size"))
+                node["state"] = _read(os.path.join(path, "device", "state"))
+                node["access_state"] = _read(os.path.join(path, "device", "access_state"))
+            self.nodes[name] = node
+            if node["dev"]:
+                self.by_dev[node["dev"]] = name
+
+        self.mounts = []
+        for line in (_read(os.path.join(proc_root, "self", "mountinfo"), "") or "").splitlines():
+            fields = line.split()
+            if "-" not in fields:
+                continue
+            sep = fields.index("-")
+            mount = {"mountpoint": _unescape(fields[4]), "source": _unescape(fields[sep + 2]),
+                     "fstype": fields[sep + 1]}
+            # btrfs and others report an anonymous device number; fall back to the source path
+            name = self.by_dev.get(fields[2]) or self.resolve(mount["source"])
+            mount["device"] = name
+            self.mounts.append(mount)
+            if name in self.nodes:
+                self.nodes[name]["mounts"].append(mount["mountpoint"])
+
+        self.swaps = []
+        for line in (_read(os.path.join(proc_root, "swaps"), "") or "").splitlines()[1:]:
+            fields = line.split()
+            if not fields:
+                continue
+            swap = {"path": _unescape(fields[0]), "type": fields[1] if len(fields) > 1 else "partition"}
+            if swap["type"] == "file":
+                # a swap file belongs to the device of the filesystem it lives on
+                mount = self.mount_of(swap["path"])
+                swap["device"] = mount["device"] if mount else None
+            else:
+                swap["device"] = self.resolve(swap["path"])
+            self.swaps.append(swap)
+            if swap["device"] in self.nodes:
+                self.nodes[swap["device"]]["swaps"].append(swap["path"])
+
+    def resolve(self, path):
+        """Node name of a device path (/dev/sda1, /dev/mapper/x, /dev/disk/by-uuid/...), or None."""
+        if path.startswith("/dev/mapper/") and path[len("/dev/mapper/"):] in self.by_dm_name:
+            return self.by_dm_name[path[len("/dev/mapper/"):]]
+        try:
+            st = os.stat(path)
+            dev = f"{os.major(st.st_rdev)}:{os.minor(st.st_rdev)}"
+            if st.st_rdev and dev in self.by_dev:
+                return self.by_dev[dev]
+        except OSError:
+            pass
+        name = os.path.basename(os.path.realpath(path))
+        return name if name in self.nodes else None
+
+    def mount_of(self, path):
+        """The mount a file lives on (longest mountpoint prefix)."""
+        best = None
+        for mount in self.mounts:
+            point = mount["mountpoint"].rstrip("/") + "/"
+            if (path + "/").startswith(point) and (best is None or len(point) > len(best["mountpoint"].rstrip("/") + "/")):
+                best = mount
+        return best
+
+    def stack(self, disk):
+        """disk, its partitions and everything held on top of them, bottom up."""
+        name = self.resolve(disk)
+        if name is None:
+            raise TopologyError(f"'{disk}' is not a known block device")
+        base = [name] + [n for n, node in self.nodes.items() if node["parent"] == name]
+        order = []
+        pending = list(base)
+        while pending:
+            current = pending.pop(0)
+            if current in order or current not in self.nodes:
+                continue
+            order.append(current)
+            pending.extend(self.nodes[current]["holders"])
+        return base, order
+
+    def path_groups(self):
+        """Whole disks that are paths to the same LUN, as {disk: sorted paths}, for disks with more than one."""
+        groups = []
+        by_wwid = {}
+        for name, node in self.nodes.items():
+            wwid = (node.get("wwid") or "").lower()
+            if node["kind"] == "disk" and wwid.startswith(UNIQUE_WWIDS):
+                by_wwid.setdefault((wwid, node["size"]), []).append(name)
+        groups += by_wwid.values()
+        for node in self.nodes.values():
+            if node["kind"] == "dm" and (node.get("dm_uuid") or "").startswith("mpath-"):
+                groups.append([self.nodes[s]["parent"] or s for s in node["slaves"] if s in self.nodes])
+        paths = {}
+        for group in groups:
+            merged = set(group)
+            for name in group:
+                merged |= set(paths.get(name, ()))
+            for name in merged:
+                paths[name] = sorted(merged)
+        return {name: group for name, group in paths.items() if len(group) > 1}
+
+    def best_path(self, paths):
+        """The path to wipe through: running first, then by ALUA state, then by name."""
+        def rank(name):
+            node = self.nodes[name]
+            return (node.get("state") not in (None, "running"),
+                    ALUA_RANK.get(node.get("access_state"), 1 if node.get("access_state") is None else 4), name)
+        return min(paths, key=rank)
+
+    def stack_below(self, name):
+        """Every device name sits on, top down."""
+        below = []
+        pending = list(self.nodes[name]["slaves"])
+        while pending:
+            current = pending.pop(0)
+            if current in below or current not in self.nodes:
+                continue
+            below.append(current)
+            pending.extend(self.nodes[current]["slaves"])
+        return below
+
+    def resolve_targets(self, disk):
+        """
+        The physical disks a wipe of disk goes to: md and dm devices
+        expand into the whole disks below them (a member partition takes
+        its disk along), paths to one LUN collapse into the best path.
+        """
+        name = self.resolve(disk)
+        if name is None:
+            raise TopologyError(f"'{disk}' is not a known block device")
+        node = self.nodes[name]
+        if node["kind"] == "part":
+            raise TopologyError(f"'{disk}' is a partition; wipe the whole disk")
+        below = self.stack_below(name)
+        members = []
+        for n in below:
+            below_node = self.nodes[n]
+            member = below_node["parent"] if below_node["kind"] == "part" else n if below_node["kind"] == "disk" else None
+            if member is not None and member not in members:
+                members.append(member)
+        groups = self.path_groups()
+        targets, paths = [], {}
+        for member in members or [name]:
+            best = self.best_path(groups[member]) if member in groups else member
+            if best not in targets:
+                targets.append(best)
+                paths[best] = [p for p in groups.get(member, []) if p != best]
+        return {"disk": disk, "name": name, "label": _label(node), "targets": targets,
+                "expanded": targets != [name], "paths": paths,
+                "partitions": sorted(n for n in below if self.nodes[n]["kind"] == "part")}
+
+    def plan(self, disk):
+        """
+        What has to go before disk can be wiped: swap, mounts (deepest
+        first), and holder levels to close (top first). refused is set
+        when the stack carries the running system.
+        """
+        base, order = self.stack(disk)
+        in_stack = set(order)
+        mounts = [m for m in self.mounts if m["device"] in in_stack]
+        # anything mounted below them keeps them busy, wherever it lives
+        points = [m["mountpoint"].rstrip("/") + "/" for m in mounts]
+        mounts += [m for m in self.mounts if m not in mounts and any(m["mountpoint"].startswith(p) for p in points)]
+        swaps = [s for s in self.swaps if s["device"] in in_stack]
+
+        # distance from the top of the stack: what nothing holds closes first
+        height = {}
+
+        def level(name):
+            if name not in height:
+                holders = [h for h in self.nodes[name]["holders"] if h in in_stack]
+                height[name] = 1 + max((level(h) for h in holders), default=-1)
+            return height[name]
+
+        holders = [n for n in order if n not in base]
+        levels = {}
+        for name in holders:
+            levels.setdefault(level(name), []).append(name)
+        close = [sorted(levels[h]) for h in sorted(levels)]
+
+        # arrays and volume groups that also span other disks
+        shared = sorted({self.nodes[s]["parent"] or s for n in holders for s in self.nodes[n]["slaves"]
+                         if s in self.nodes and s not in in_stack})
+        refused = None
+        system = [m["mountpoint"] for m in mounts if m["mountpoint"] in SYSTEM_MOUNTS]
+        if system:
+            refused = f"mounted on {', '.join(sorted(system))}, part of the running system"
+        return {"disk": disk, "stack": order, "swapoff": [s["path"] for s in swaps],
+                "unmount": sorted({m["mountpoint"] for m in mounts}, key=lambda p: (-p.rstrip("/").count("/"), p)),
+                "close": close, "shared_with": shared, "refused": refused,
+                "nodes": {n: self.nodes[n] for n in order}}
+
+
+def describe(plan):
+    """Lines for the operation plan and dry runs."""
+    lines = []
+    for path in plan["swapoff"]:
+        lines.append(f"swapoff {path}")
+    for mountpoint in plan["unmount"]:
+        lines.append(f"unmount {mountpoint}")
+    for level in plan["close"]:
+        for name in level:
+            lines.append(f"close {_label(plan['nodes'][name])}")
+    if plan["shared_with"]:
+        lines.append(f"also spans {', '.join(plan['shared_with'])}, which loses access to it")
+    return lines
+
+
+def describe_targets(resolution):
+    """Lines for the operation plan: the physical set a target resolves to."""
+    lines = []
+    targets = ", ".join(f"/dev/{t}" for t in resolution["targets"])
+    if resolution["expanded"]:
+        lines.append(f"{resolution['label']} resolves to {targets}")
+    if resolution["partitions"]:
+        lines.append(f"member partitions {', '.join(resolution['partitions'])}: their whole disks are wiped")
+    for target, others in resolution["paths"].items():
+        if others:
+            lines.append(f"/dev/{target} is the best of {len(others) + 1} paths to one LUN, "
+                         f"{', '.join(others)} not wiped again")
+    return lines
+
+
+def group_drives(drives, topology=None):
+    """
+    The front-ends' drive scan with the other paths of a multipath LUN
+    left out (noted as paths on the best one) and md/dm devices noted
+    with the disks they expand into.
+    """
+    try:
+        topology = topology or Topology()
+    except OSError:
+        return drives
+    groups = topology.path_groups()
+    result = []
+    for drive in drives:
+        name = topology.resolve(drive["name"]) if drive["name"].startswith("/dev/") else None
+        node = topology.nodes.get(name)
+        if name in groups:
+            if topology.best_path(groups[name]) != name:
+                continue
+            drive = dict(drive, paths=[p for p in groups[name] if p != name])
+        elif node is not None and node["kind"] in ("md", "dm"):
+            drive = dict(drive, members=topology.resolve_targets(drive["name"])["targets"])
+        result.append(drive)
+    return result
+
+
+def _label(node):
+    if node["kind"] == "dm":
+        uuid = node.get("dm_uuid") or ""
+        kind = ("dm-crypt" if uuid.startswith("CRYPT-") else "LVM" if uuid.startswith("LVM-")
+                else "multipath" if uuid.startswith("mpath-") else "dm")
+        return f"{kind} {node['dm_name']} ({node['name']})"
+    return f"md array {node['name']}" if node["kind"] == "md" else node["name"]
+
+
+def _umount(mountpoint):
+    if _libc.umount2(mountpoint.encode(), 0) != 0:
+        err = ctypes.get_errno()
+        raise TopologyError(f"unmounting {mountpoint} failed: {os.strerror(err)}")
+
+
+def _swapoff(path):
+    if _libc.swapoff(path.encode()) != 0:
+        err = ctypes.get_errno()
+        raise TopologyError(f"swapoff {path} failed: {os.strerror(err)}")
+
+
+def _close_command(node):
+    if node["kind"] == "md":
+        return ["mdadm", "--stop", f"/dev/{node['name']}"]
+    return ["dmsetup", "remove", node["dm_name"]]
+
+
+def _close(node, run):
+    cmd = _close_command(node)
+    try:
+        result = run(cmd, capture_output=True, text=True)
+    except FileNotFoundError:
+        raise TopologyError(f"closing {_label(node)} needs {cmd[0]}, which is not installed") from None
+    if result.returncode != 0:
+        raise TopologyError(f"closing {_label(node)} failed: {(result.stderr or result.stdout).strip()}")
+
+
+def _parallel(func, items):
+    if len(items) <= 1:
+        for item in items:
+            func(item)
+        return
+    with ThreadPoolExecutor(max_workers=min(len(items), MAX_WORKERS)) as pool:
+        for future in [pool.submit(func, item) for item in items]:
+            future.result()
+
+
+def teardown(plan, run=subprocess.run, log=print):
+    """Carry out plan. Raises TopologyError when it is refused or a step fails."""
+    if plan["refused"]:
+        raise TopologyError(f"refusing to touch {plan['disk']}: {plan['refused']}")
+    for path in plan["swapoff"]:
+        log(f"Disabling swap {path}...")
+    # swap files pin their filesystem, so swap goes before any unmount
+    _parallel(_swapoff, plan["swapoff"])
+    # nested mounts: the deepest level first, mounts at the same depth are independent
+    depths = {}
+    for mountpoint in plan["unmount"]:
+        depths.setdefault(mountpoint.rstrip("/").count("/"), []).append(mountpoint)
+    for depth in sorted(depths, reverse=True):
+        for mountpoint in depths[depth]:
+            log(f"Unmounting {mountpoint}...")
+        _parallel(_umount, depths[depth])
+    for level in plan["close"]:
+        for name in level:
+            log(f"Closing {_label(plan['nodes'][name])}...")
+        _parallel(lambda name: _close(plan["nodes"][name], run), level)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="uee_topology.py", description="UEE device topology and teardown")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for command, text in (("show", "show what is stacked on a disk and the teardown plan"),
+                          ("resolve", "show the physical disks a wipe of a device goes to"),
+                          ("teardown", "unmount, swapoff and close everything stacked on a disk")):
+        command_parser = sub.add_parser(command, help=text)
+        command_parser.add_argument("disk")
+        command_parser.add_argument("--sysfs-root", default=SYSFS_ROOT, help=argparse.SUPPRESS)
+        command_parser.add_argument("--proc-root", default=PROC_ROOT, help=argparse.SUPPRESS)
+        if command == "teardown":
+            command_parser.add_argument("--dry-run", action="store_true", help="print the steps without running them")
+
+    args = parser.parse_args(argv)
+    started = time.monotonic()
+    if args.command == "resolve":
+        try:
+            resolution = Topology(args.sysfs_root, args.proc_root).resolve_targets(args.disk)
+        except TopologyError as e:
+            print(f"Error: {e}", file=sys.stderr)
+            return 1
+        print("Targets: " + " ".join(f"/dev/{t}" for t in resolution["targets"]))
+        for line in describe_targets(resolution):
+            print(line)
+        return 0
+    try:
+        plan = Topology(args.sysfs_root, args.proc_root).plan(args.disk)
+    except TopologyError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+    if args.command == "show":
+        for name in plan["stack"]:
+            node = plan["nodes"][name]
+            uses = [f"mounted on {m}" for m in node["mounts"]] + [f"swap {s}" for s in node["swaps"]]
+            print(f"{_label(node):<32} {node['kind']:<5} {', '.join(uses)}")
+        print("Teardown: " + ("; ".join(describe(plan)) or "nothing to do"))
+        if plan["refused"]:
+            print(f"Refused: {plan['refused']}")
+        return 1 if plan["refused"] else 0
+
+    if args.dry_run:
+        for line in describe(plan):
+            print(line)
+        if plan["refused"]:
+            print(f"Refused: {plan['refused']}", file=sys.stderr)
+        return 1 if plan["refused"] else 0
+    try:
+        teardown(plan)
+    except TopologyError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    steps = len(plan["swapoff"]) + len(plan["unmount"]) + sum(len(level) for level in plan["close"])
+    print(f"{args.disk} released ({steps} step{'s' if steps != 1 else ''}, "
+          f"{time.monotonic() - started:.2f}s).")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,109 @@
+"""
+UEE phase tracing in Chrome/Perfetto trace format.
+
+The shell scripts and the engine report phases by printing marker lines
+("@@uee-trace {json event}") when UEE_TRACE is set. The front-end that
+reads the script output feeds every line to a Tracer, which swallows the
+markers, stamps them with CLOCK_MONOTONIC and writes the trace JSON that
+chrome://tracing and ui.perfetto.dev load. Nothing is printed or recorded
+when tracing is off, and when it is on the cost is one short line per
+phase plus one counter sample per progress update.
+"""
+import json
+import os
+import time
+from contextlib import contextmanager
+
+MARKER = "@@uee-trace "
+ENABLED = bool(os.environ.get("UEE_TRACE"))
+
+
+def now_us():
+    return time.monotonic_ns() // 1000
+
+
+def emit(ph, name, **fields):
+    """Print a trace marker from a child process (engine, scripts)."""
+    if not ENABLED:
+        return
+    event = {"ph": ph, "name": name, "ts": now_us()}
+    event.update(fields)
+    print(MARKER + json.dumps(event), flush=True)
+
+
+class Tracer:
+    """Collects trace events from the front-end and from marker lines."""
+
+    def __init__(self, enabled=True, process_name="uee"):
+        self.enabled = enabled
+        self.pid = os.getpid()
+        self.events = []
+        self.threads = {}
+        self.process_name = process_name
+
+    def _tid(self, name):
+        if name not in self.threads:
+            self.threads[name] = len(self.threads) + 1
+        return self.threads[name]
+
+    def add(self, event):
+        if not self.enabled:
+            return
+        event.setdefault("ts", now_us())
+        event["pid"] = self.pid
+        event["tid"] = self._tid(str(event.get("tid", "main")))
+        self.events.append(event)
+
+    @contextmanager
+    def span(self, name, **args):
+        if not self.enabled:
+            yield
+            return
+        start = now_us()
+        try:
+            yield
+        finally:
+            self.add({"ph": "X", "name": name, "ts": start, "dur": now_us() - start, "args": args})
+
+    def feed(self, line):
+        """Record line if it is a trace marker; returns True when it was one."""
+        if not line.startswith(MARKER):
+            return False
+        try:
+            event = json.loads(line[len(MARKER):])
+        except ValueError:
+            return True
+        if isinstance(event, dict):
+            self.add(event)
+        return True
+
+    def durations(self):
+        """Seconds spent per phase on the main thread, in first-seen order."""
+        main = self.threads.get("main")
+        started = {}
+        totals = {}
+        for event in self.events:
+            if event["tid"] != main:
+                continue
+            name = event["name"]
+            if event["ph"] == "B":
+                started[name] = event["ts"]
+            elif event["ph"] == "E" and name in started:
+                totals[name] = totals.get(name, 0.0) + (event["ts"] - started.pop(name)) / 1e6
+            elif event["ph"] == "X":
+                totals[name] = totals.get(name, 0.0) + event.get("dur", 0) / 1e6
+        return {name: round(seconds, 3) for name, seconds in totals.items()}
+
+    def save(self, path):
+        if not self.enabled:
+            return
+        metadata = [{"ph": "M", "name": "process_name", "pid": self.pid, "tid": 0,
+                     "args": {"name": self.process_name}}]
+        for name, tid in self.threads.items():
+            metadata.append({"ph": "M", "name": "thread_name", "pid": self.pid, "tid": tid,
+                             "args": {"name": name}})
+        directory = os.path.dirname(str(path))
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, "w") as f:
+            json.dump({"traceEvents": metadata + self.events, "displayTimeUnit": "ms"}, f)
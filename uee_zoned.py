@@ -0,0 +1,216 @@
+"""
+UEE zoned block devices.
+
+Host-managed SMR drives and NVMe ZNS namespaces only accept writes at
+each sequential zone's write pointer; host-aware SMR drives accept
+others but pay for them with read-modify-write of whole bands. A plain
+sequential sweep of the LBA range either fails at the first zone it
+does not start at the write pointer of, or crawls.
+
+The zone layout comes from the BLKREPORTZONE ioctl and the limits from
+sysfs (queue/zoned, queue/max_open_zones, queue/max_active_zones). A
+wipe resets each sequential zone (BLKRESETZONE) and writes it from its
+write pointer to its capacity, in order (a zone it has to stop short in,
+at a bad sector, is finished with BLKFINISHZONE); conventional zones are
+written like any other disk. Every zone is written start to end by one worker,
+and at most max_open_zones workers run at once, so the device never has
+to close a zone implicitly.
+
+The null_blk driver emulates zoned devices, for example a 4 GiB device
+with 64 MiB zones, 4 conventional ones and at most 8 open zones:
+
+  modprobe null_blk nr_devices=1 zoned=1 zone_size=64 zone_nr_conv=4 \\
+      zone_max_open=8 gb=4 memory_backed=1
+  python3 uee_zoned.py report /dev/nullb0
+
+Usage: python3 uee_zoned.py report /dev/sdb [--zones]
+"""
+import argparse
+import fcntl
+import os
+import struct
+import sys
+
+import uee_target
+
+SYSFS_ROOT = "/sys"
+SECTOR = 512
+
+# linux/blkzoned.h
+BLKREPORTZONE = 0xC0101282
+BLKRESETZONE = 0x40101283
+BLKFINISHZONE = 0x40101288
+BLK_ZONE_REP_CAPACITY = 1
+REPORT_HEADER = struct.Struct("=QII")
+ZONE = struct.Struct("=QQQBBBB4xQ24x")
+ZONE_RANGE = struct.Struct("=QQ")
+REPORT_BATCH = 4096
+
+ZONE_TYPES = {1: 'conventional', 2: 'seq-required', 3: 'seq-preferred'}
+ZONE_CONDITIONS = {0x0: 'not-wp', 0x1: 'empty', 0x2: 'implicit-open', 0x3: 'explicit-open',
+                   0x4: 'closed', 0xD: 'read-only', 0xE: 'full', 0xF: 'offline'}
+# zones that cannot be written at all
+DEAD_CONDITIONS = ('read-only', 'offline')
+MODELS = ['host-managed', 'host-aware']
+DEFAULT_WORKERS = 8
+
+
+def _queue_attribute(device, name, sysfs_root=SYSFS_ROOT):
+    block = os.path.basename(os.path.realpath(device))
+    try:
+        with open(os.path.join(sysfs_root, "class", "block", block, "queue", name)) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def zoned_model(device, sysfs_root=SYSFS_ROOT):
+    """'host-managed', 'host-aware', or None for a regular device."""
+    model = _queue_attribute(device, "zoned", sysfs_root)
+    return model if model in MODELS else None
+
+
+def zone_limits(device, sysfs_root=SYSFS_ROOT):
+    """Open and active zone limits of device; 0 means none."""
+    limits = {}
+    for name in ("max_open_zones", "max_active_zones"):
+        try:
+            limits[name] = int(_queue_attribute(device, name, sysfs_root) or 0)
+        except ValueError:
+            limits[name] = 0
+    return limits
+
+
+def report_zones(fd, size):
+    """
+    All zones of the device behind fd, in LBA order, as dicts with
+    start, length, capacity and write pointer in bytes, type and
+    condition.
+    """
+    zones = []
+    sector = 0
+    end = size // SECTOR
+    while sector < end:
+        buf = bytearray(REPORT_HEADER.size + ZONE.size * REPORT_BATCH)
+        REPORT_HEADER.pack_into(buf, 0, sector, REPORT_BATCH, 0)
+        fcntl.ioctl(fd, BLKREPORTZONE, buf)
+        _, count, flags = REPORT_HEADER.unpack_from(buf, 0)
+        if count == 0:
+            break
+        for i in range(count):
+            start, length, wp, ztype, cond, _, _, capacity = ZONE.unpack_from(buf, REPORT_HEADER.size + i * ZONE.size)
+            if not flags & BLK_ZONE_REP_CAPACITY:
+                capacity = length
+            ztype = ZONE_TYPES.get(ztype, str(ztype))
+            zones.append({"start": start * SECTOR, "length": length * SECTOR, "capacity": capacity * SECTOR,
+                          "wp": None if ztype == 'conventional' else wp * SECTOR, "type": ztype,
+                          "cond": ZONE_CONDITIONS.get(cond, str(cond))})
+        sector = (zones[-1]["start"] + zones[-1]["length"]) // SECTOR
+    return zones
+
+
+def layout(device, fd, size, sysfs_root=SYSFS_ROOT):
+    """Model, limits and zones of a zoned block device; None for a regular one."""
+    model = zoned_model(device, sysfs_root)
+    if model is None:
+        return None
+    return dict(zone_limits(device, sysfs_root), model=model, zones=report_zones(fd, size))
+
+
+def _zone_range(fd, request, name, start, length):
+    try:
+        fcntl.ioctl(fd, request, ZONE_RANGE.pack(start // SECTOR, length // SECTOR))
+    except OSError as e:
+        raise OSError(e.errno, f"zone {name} at {start} failed: {os.strerror(e.errno)}") from None
+
+
+def reset_zone(fd, start, length):
+    """Move the write pointer of the zones in [start, start + length) back to their start."""
+    _zone_range(fd, BLKRESETZONE, "reset", start, length)
+
+
+def finish_zone(fd, start, length):
+    """Mark the zones in [start, start + length) full, releasing their open/active resources."""
+    _zone_range(fd, BLKFINISHZONE, "finish", start, length)
+
+
+def writable(zone):
+    return zone["cond"] not in DEAD_CONDITIONS
+
+
+def workers(zoned, default=DEFAULT_WORKERS):
+    """Zones written at once: one open zone per worker, within the device's limits."""
+    caps = [n for n in (zoned.get("max_open_zones"), zoned.get("max_active_zones")) if n]
+    n = min(caps) if caps else default
+    return max(1, min(n, sum(1 for z in zoned["zones"] if writable(z))))
+
+
+def summary(zoned):
+    """The zoned section of a certificate plan."""
+    zones = zoned["zones"]
+    counts = {}
+    for zone in zones:
+        counts[zone["type"]] = counts.get(zone["type"], 0) + 1
+    return {"model": zoned["model"], "zones": len(zones), "types": counts,
+            "zone_bytes": max((z["length"] for z in zones), default=0),
+            "capacity_bytes": sum(z["capacity"] for z in zones if writable(z)),
+            "unwritable_zones": sum(1 for z in zones if not writable(z)),
+            "max_open_zones": zoned.get("max_open_zones", 0), "workers": workers(zoned)}
+
+
+def probe(device):
+    """The zone layout of device opened read-only, for the front-ends' plan; None if not zoned or unreadable."""
+    try:
+        target = uee_target.open_target(device, readonly=True)
+    except OSError:
+        return None
+    try:
+        return target.zoned()
+    except OSError:
+        return None
+    finally:
+        target.close()
+
+
+def describe(zoned):
+    s = summary(zoned)
+    types = ", ".join(f"{n} {t}" for t, n in sorted(s["types"].items()))
+    line = (f"{s['model']} zoned device: {s['zones']} zones of {s['zone_bytes'] // (1024 * 1024)} MiB ({types}), "
+            f"{s['workers']} written at once")
+    if s["unwritable_zones"]:
+        line += f", {s['unwritable_zones']} read-only/offline zones skipped"
+    return line
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="uee_zoned.py", description="UEE zoned block devices")
+    sub = parser.add_subparsers(dest="command", required=True)
+    report_parser = sub.add_parser("report", help="show the zone layout and limits of a device (read-only)")
+    report_parser.add_argument("disk")
+    report_parser.add_argument("--zones", action="store_true", help="list every zone")
+    report_parser.add_argument("--sysfs-root", default=SYSFS_ROOT, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    try:
+        target = uee_target.open_target(args.disk, readonly=True)
+        try:
+            zoned = target.zoned(args.sysfs_root)
+        finally:
+            target.close()
+    except OSError as e:
+        print(f"Zone report on {args.disk} failed: {e}", file=sys.stderr)
+        return 1
+    if zoned is None:
+        print(f"{args.disk} is not a zoned device.")
+        return 0
+    print(describe(zoned))
+    if args.zones:
+        print(f"{'START':>14} {'LENGTH':>10} {'CAPACITY':>10} {'WP':>14}  {'TYPE':<14}COND")
+        for z in zoned["zones"]:
+            wp = "-" if z["wp"] is None else z["wp"]
+            print(f"{z['start']:>14} {z['length']:>10} {z['capacity']:>10} {wp:>14}  {z['type']:<14}{z['cond']}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())